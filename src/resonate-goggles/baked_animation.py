@@ -0,0 +1,195 @@
+"""
+Pre-baked animations.
+
+Periodic effects show the same frames over and over. bake() renders one
+period of a ColorCycleTemplate (cycles_per_period cycles, StrandTest takes
+three to go through red, green and blue) into a file of encoded LED frames
+(the contents of APA102.leds for every step), BakedAnimation memory maps
+such a file and plays it back with one copy per frame and no effect code
+at all. Files go to ANIMATIONS_DIR, POST /goggles/animations/<name> plays
+one.
+
+The encoded frames hold the global brightness of the strip they were
+baked for, so it is part of the header and playback refuses a strip with
+another brightness, like it does for another LED count or channel order.
+
+File layout (little endian):
+
+    offset  size  field
+    0       4     magic, b'LCBA'
+    4       1     version, currently 2
+    5       1     global brightness, 0 to 31
+    6       2     frames per second
+    8       4     frame count
+    12      2     LED count
+    14      3     channel order, e.g. b'rgb' (see constants.RGB_MAP)
+    17      1     unused
+    18      4*n   first frame, 4 bytes per LED, then the next frames
+"""
+import argparse
+import asyncio
+import mmap
+import os
+import struct
+import sys
+import time
+from constants import RGB_MAP, TARGET_FPS
+
+BAKE_MAGIC = b'LCBA'
+BAKE_VERSION = 2
+BAKE_HEADER = struct.Struct('<4sBBHIH3sx')  # magic, version, brightness, fps, frame count, LED count, order
+
+
+def strip_order(strip):
+    """The channel order name (key of RGB_MAP) an APA102 was set up with."""
+    for order, rgb in RGB_MAP.items():
+        if rgb == strip.rgb:
+            return order
+    raise ValueError("unknown channel order")
+
+
+def animation_path(directory, name):
+    """Path of the animation called name in directory.
+
+    name must be a plain file name, anything that could point outside of
+    directory raises ValueError.
+    """
+    if not name or name in ('.', '..') or '/' in name or '\\' in name or '\0' in name:
+        raise ValueError(f"{name!r} is not a valid animation name")
+    return os.path.join(directory, name)
+
+
+def bake(effect, path, fps=None):
+    """Renders one period of effect into path.
+
+    The effect paints on its own strip's pixel buffer, nothing is sent to
+    the strip and the buffer is restored afterwards. fps defaults to the
+    effect's pause_value, capped at TARGET_FPS.
+    """
+    strip = effect.strip
+    if fps is None:
+        fps = TARGET_FPS if effect.pause_value <= 0 else min(round(1 / effect.pause_value), TARGET_FPS)
+    fps = max(int(fps), 1)
+    saved = bytes(strip.leds)
+    try:
+        strip.fill((0, 0, 0))
+        effect.init(strip, effect.num_led)
+        with open(path, 'wb') as f:
+            f.write(BAKE_HEADER.pack(BAKE_MAGIC, BAKE_VERSION, strip.global_brightness, fps,
+                                     effect.cycles_per_period * effect.num_steps_per_cycle,
+                                     strip.num_led, strip_order(strip).encode()))
+            for current_cycle in range(effect.cycles_per_period):
+                for current_step in range(effect.num_steps_per_cycle):
+                    effect.update(strip, effect.num_led, effect.num_steps_per_cycle, current_step, current_cycle)
+                    f.write(strip.leds)
+        effect.shutdown(strip, effect.num_led)
+    finally:
+        strip.load_frame(saved)
+
+
+class BakedAnimation:
+    """
+    A baked animation file, memory mapped for playback.
+
+    Attributes
+    ----------
+    fps : int
+        Playback rate the animation was baked for
+    frame_count : int
+        Number of frames in one period
+    brightness : int
+        Global brightness of the strip it was baked for
+    num_led : int
+        LEDs per frame
+    order : str
+        Channel order of the encoded frames
+    """
+    def __init__(self, path):
+        self.path = path
+        self._view = None
+        with open(path, 'rb') as f:
+            header = f.read(BAKE_HEADER.size)
+            if len(header) < BAKE_HEADER.size:
+                raise ValueError(f"{path} is not a baked animation")
+            magic, version, self.brightness, self.fps, self.frame_count, self.num_led, order = \
+                BAKE_HEADER.unpack(header)
+            self.frame_size = 4 * self.num_led
+            if magic != BAKE_MAGIC:
+                raise ValueError(f"{path} is not a baked animation")
+            if version != BAKE_VERSION:
+                raise ValueError(f"{path} was baked by another version, bake it again")
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)  # Stays valid after close
+        if len(self._map) < BAKE_HEADER.size + self.frame_count * self.frame_size:
+            self._map.close()
+            raise ValueError(f"{path} is truncated")
+        self.order = order.decode()
+        self._view = memoryview(self._map)
+
+    def frame(self, index):
+        """The encoded frame for step index, a view into the mapped file."""
+        start = BAKE_HEADER.size + index * self.frame_size
+        return self._view[start:start + self.frame_size]
+
+    def check(self, strip):
+        if strip.num_led != self.num_led or strip_order(strip) != self.order:
+            raise ValueError(f"{self.path} was baked for {self.num_led} LEDs in {self.order} order")
+        if strip.global_brightness != self.brightness:
+            raise ValueError(f"{self.path} was baked for brightness {self.brightness}, "
+                             f"the strip runs at {strip.global_brightness}")
+
+    async def play(self, strip, num_cycles=-1):
+        """Plays the animation on strip on monotonic deadlines, cancel the task to stop.
+
+        num_cycles counts passes through the whole file, -1 plays it forever.
+        """
+        self.check(strip)
+        period = 1.0 / self.fps
+        deadline = time.monotonic()
+        current_cycle = 0
+        while num_cycles == -1 or current_cycle < num_cycles:
+            for index in range(self.frame_count):
+                strip.load_frame(self.frame(index))
+                await strip.show_async()
+                deadline += period
+                delay = deadline - time.monotonic()
+                if delay < -period:
+                    deadline = time.monotonic()  # More than a frame behind, don't rush to catch up
+                await asyncio.sleep(max(delay, 0))
+            current_cycle += 1
+
+    def close(self):
+        if self._view is not None:
+            self._view.release()
+            self._view = None
+            self._map.close()
+
+
+def main(argv=None):
+    # Bakes for the goggles described by the hardware config, on a simulated
+    # strip, the SPI device is never opened
+    from led_driver import APA102
+    from spi_transport import SimulatedSpiTransport
+    from constants import BRIGHTNESS
+    from effect_scheduler import EFFECTS, create_effect
+    from goggles_setup import animations_dir, strip_led_count
+    from hardware_config import HardwareConfigStore
+    defaults = HardwareConfigStore().read()
+    parser = argparse.ArgumentParser(description='Bake an effect into an animation file for the goggles.')
+    parser.add_argument('effect', choices=sorted(EFFECTS))
+    parser.add_argument('file', help=f"file name, in {animations_dir(defaults)} unless it is a path")
+    parser.add_argument('--leds', type=int, default=strip_led_count(defaults))
+    parser.add_argument('--brightness', type=int, default=int(defaults.get('LED_BRIGHTNESS', BRIGHTNESS)))
+    parser.add_argument('--fps', type=int, help='frames per second, by default the pace of the effect')
+    args = parser.parse_args(argv)
+    path = args.file
+    if os.path.dirname(path) == '':
+        os.makedirs(animations_dir(defaults), exist_ok=True)
+        path = os.path.join(animations_dir(defaults), path)
+    strip = APA102(num_led=args.leds, global_brightness=args.brightness, transport=SimulatedSpiTransport())
+    bake(create_effect(args.effect, strip), path, args.fps)
+    print(f"baked {args.effect} into {path}")
+
+
+if __name__ == '__main__':
+    # python baked_animation.py <effect> <file>, e.g. python baked_animation.py rainbow rainbow.lcba
+    main(sys.argv[1:])
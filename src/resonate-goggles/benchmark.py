@@ -0,0 +1,230 @@
+"""
+Benchmarks for the pixel pipeline, run against the simulated SPI backend.
+
+    python benchmark.py --output bench.json
+
+Measures set_pixel/set_pixel_rgb/bulk setter throughput, the cost of
+encoding a frame in show(), the update() cost of every stock effect, and
+the latency from sending a UDP datagram to the frame leaving on the
+(simulated) SPI bus, through LightGoggles.receive_vid_stream, at several
+packet rates. Results are printed or written as JSON so runs can be
+compared across releases.
+"""
+import argparse
+import asyncio
+import json
+import platform
+import socket
+import sys
+import threading
+import time
+from datetime import datetime
+
+import led_driver
+import light_goggles
+from constants import NUM_LED, SPI_SPEED_HZ
+from effect_scheduler import EFFECTS, create_effect
+from frame_protocol import pack_frame
+from spi_transport import SimulatedSpiTransport
+
+DEFAULT_RATES = (30, 60, 120, 500)
+
+
+def _time_per_call(function, iterations, repeats=5):
+    """Best of repeats, seconds per call."""
+    best = float('inf')
+    for _ in range(repeats):
+        started = time.perf_counter()
+        for _ in range(iterations):
+            function()
+        best = min(best, (time.perf_counter() - started) / iterations)
+    return best
+
+
+def _percentile(samples, percent):
+    if not samples:
+        return None
+    ordered = sorted(samples)
+    return ordered[min(int(len(ordered) * percent / 100), len(ordered) - 1)]
+
+
+def make_strip(num_led, spi_speed, realtime=False):
+    transport = SimulatedSpiTransport(max_speed_hz=spi_speed, realtime=realtime)
+    return led_driver.APA102(num_led=num_led, SPI_SPEED_HZ=spi_speed, transport=transport)
+
+
+def bench_pixels(num_led, spi_speed):
+    strip = make_strip(num_led, spi_speed)
+    frame = bytes(i % 256 for i in range(3 * num_led))
+
+    def set_pixel_frame():
+        for led in range(num_led):
+            strip.set_pixel(led, 10, 20, 30)
+
+    def set_pixel_rgb_frame():
+        for led in range(num_led):
+            strip.set_pixel_rgb(led, 0x0A141E)
+
+    results = {}
+    for name, function in (('set_pixel', set_pixel_frame), ('set_pixel_rgb', set_pixel_rgb_frame),
+                           ('set_pixels', lambda: strip.set_pixels(frame)),
+                           ('fill', lambda: strip.fill((10, 20, 30)))):
+        seconds = _time_per_call(function, 200)
+        results[name] = {'frame_us': seconds * 1e6, 'pixels_per_second': num_led / seconds}
+    return results
+
+
+def bench_show(num_led, spi_speed):
+    strip = make_strip(num_led, spi_speed)
+    frames = [bytes([i]) * (3 * num_led) for i in range(2)]
+    toggle = [0]
+
+    def encode():
+        # A changed frame every call, so nothing gets skipped
+        toggle[0] ^= 1
+        strip.set_pixels(frames[toggle[0]])
+        strip.update_frame()
+
+    def unchanged():
+        strip.show()
+
+    return {
+        'encode_us': _time_per_call(encode, 1000) * 1e6,
+        'show_forced_us': _time_per_call(lambda: strip.show(force=True), 1000) * 1e6,
+        'show_unchanged_us': _time_per_call(unchanged, 1000) * 1e6,
+        'frame_bytes': len(strip._frame),
+        'wire_time_us': strip.spi.wire_seconds(len(strip._frame)) * 1e6,
+    }
+
+
+def bench_effects(num_led, spi_speed):
+    results = {}
+    for name in EFFECTS:
+        strip = make_strip(num_led, spi_speed)
+        effect = create_effect(name, strip)
+        effect.init(strip, num_led)
+        steps = effect.num_steps_per_cycle
+        step = [0]
+
+        def update():
+            effect.update(strip, num_led, steps, step[0] % steps, step[0] // steps)
+            step[0] += 1
+
+        results[name] = {'update_us': _time_per_call(update, max(steps, 100)) * 1e6}
+    return results
+
+
+async def _stream(goggles, address, rate, duration):
+    """Sends frames from a thread at rate, returns the send time of every sequence number."""
+    sent = {}
+    num_led = goggles.strip.num_led
+
+    def sender():
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        period = 1.0 / rate
+        deadline = time.monotonic()
+        for sequence in range(1, int(rate * duration) + 1):
+            # Pixel 0 carries the sequence number so SPI transfers can be matched to packets
+            packet = pack_frame(sequence, sequence.to_bytes(3, 'big') * num_led)
+            sent[sequence] = time.monotonic()
+            sock.sendto(packet, address)
+            deadline += period
+            delay = deadline - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+        sock.close()
+
+    thread = threading.Thread(target=sender)
+    thread.start()
+    while thread.is_alive():
+        await asyncio.sleep(0.05)
+    await asyncio.sleep(0.2)  # Let the last frame drain
+    return sent
+
+
+async def _bench_latency(num_led, spi_speed, rate, duration, realtime):
+    strip = make_strip(num_led, spi_speed, realtime)
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.bind(('127.0.0.1', 0))
+    sock.setblocking(False)
+    goggles = light_goggles.LightGoggles(strip, sock)
+    strip.start_writer()
+    loop = asyncio.get_running_loop()
+    tasks = [loop.create_task(goggles.receive_vid_stream()), loop.create_task(goggles.renderer.run())]
+    try:
+        sent = await _stream(goggles, sock.getsockname(), rate, duration)
+    finally:
+        for task in tasks:
+            task.cancel()
+        strip.stop_writer()
+        sock.close()
+
+    latencies = []
+    rgb = strip.rgb
+    offset = strip._led_offset
+    for _, end, data in strip.spi.transfers:
+        sequence = (data[offset + rgb[0]] << 16) | (data[offset + rgb[1]] << 8) | data[offset + rgb[2]]
+        if sequence in sent:
+            latencies.append(end - sent[sequence])
+    return {
+        'rate': rate,
+        'packets_sent': len(sent),
+        'frames_rendered': goggles.renderer.frames_rendered,
+        'frames_dropped': goggles.renderer.frames_dropped,
+        'spi_transfers': strip.spi.transfer_count,
+        'latency_ms': {
+            'p50': _ms(_percentile(latencies, 50)),
+            'p95': _ms(_percentile(latencies, 95)),
+            'p99': _ms(_percentile(latencies, 99)),
+            'max': _ms(max(latencies) if latencies else None),
+        },
+    }
+
+
+def _ms(seconds):
+    return None if seconds is None else seconds * 1e3
+
+
+def bench_latency(num_led, spi_speed, rates, duration, realtime):
+    return [asyncio.run(_bench_latency(num_led, spi_speed, rate, duration, realtime)) for rate in rates]
+
+
+def run(num_led=NUM_LED, spi_speed=SPI_SPEED_HZ, rates=DEFAULT_RATES, duration=2.0, realtime=True):
+    return {
+        'meta': {
+            'timestamp': datetime.now().isoformat(),
+            'python': platform.python_version(),
+            'machine': platform.machine(),
+            'num_led': num_led,
+            'spi_speed_hz': spi_speed,
+            'realtime_spi': realtime,
+        },
+        'pixels': bench_pixels(num_led, spi_speed),
+        'show': bench_show(num_led, spi_speed),
+        'effects': bench_effects(num_led, spi_speed),
+        'udp_to_spi': bench_latency(num_led, spi_speed, rates, duration, realtime),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--output', help='write the JSON results here instead of stdout')
+    parser.add_argument('--num-led', type=int, default=NUM_LED)
+    parser.add_argument('--spi-speed', type=int, default=SPI_SPEED_HZ)
+    parser.add_argument('--rates', type=int, nargs='+', default=list(DEFAULT_RATES),
+                        help='packet rates for the UDP latency runs, packets per second')
+    parser.add_argument('--duration', type=float, default=2.0, help='seconds per packet rate')
+    parser.add_argument('--no-realtime', action='store_true',
+                        help="don't sleep for the modelled SPI wire time")
+    args = parser.parse_args(argv)
+    results = run(args.num_led, args.spi_speed, args.rates, args.duration, not args.no_realtime)
+    text = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text + '\n')
+    else:
+        print(text)
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
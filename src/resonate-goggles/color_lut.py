@@ -0,0 +1,42 @@
+"""
+256 entry color lookup tables.
+
+A table maps every possible channel value to its output value. Tables are
+applied to a whole frame of packed RGB with one bytes.translate call and
+several tables can be composed into one, so the cost of the color pipeline
+does not depend on how many steps it has.
+"""
+
+
+IDENTITY_LUT = bytes(range(256))
+
+
+def dimmer_lut(divider):
+    """Divides every channel by divider (the goggles' DIMMER_LEVEL)."""
+    if divider < 1:
+        raise ValueError("dimmer divider must be 1 or more")
+    return bytes(value // divider for value in range(256))
+
+
+def gamma_lut(gamma):
+    """Maps perceived brightness to LED PWM duty cycle."""
+    if gamma <= 0:
+        raise ValueError("gamma must be positive")
+    return bytes(round(255 * (value / 255) ** gamma) for value in range(256))
+
+
+def compose_luts(first, second):
+    """Returns one table that applies first, then second."""
+    return first.translate(second)
+
+
+def build_color_lut(divider=1, gamma=1.0):
+    """The goggles' color pipeline: dimmer, then gamma correction.
+
+    Dimming happens before gamma correction so that each dimmer step is an
+    even step in perceived brightness.
+    """
+    lut = dimmer_lut(divider)
+    if gamma != 1.0:
+        lut = compose_luts(lut, gamma_lut(gamma))
+    return lut
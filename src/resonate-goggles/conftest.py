@@ -0,0 +1,5 @@
+import os
+import sys
+
+# The modules import each other by their plain names, as when main.py runs from this directory
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
@@ -4,25 +4,47 @@ RGB_MAP = {'rgb': [3, 2, 1], 'rbg': [3, 1, 2], 'grb': [2, 3, 1],
 NUM_LED = 122
 UDP_IP = "0.0.0.0"
 UDP_PORT = 1337
+UDP_RCVBUF = 1 << 20 # Kernel receive buffer of the UDP socket (SO_RCVBUF), in bytes
+UDP_BATCH = 16 # Datagrams read per wakeup of the UDP listener, only the newest is shown
+LOCAL_SOCKET_PATH = '/run/lc8823-goggles/frames.sock' # Frame input for producers on the same machine, see local_ingest.py
+LOCAL_SOCKET_MODE = 0o600 # Only the user the goggles run as may connect
+RECORDINGS_DIR = '/var/lib/lc8823-goggles/recordings' # Stream recordings started through the API go here
+ANIMATIONS_DIR = '/var/lib/lc8823-goggles/animations' # Baked animations the API can play, see baked_animation.py
+UDP_DRAIN_LIMIT = 8 * UDP_BATCH # Datagrams read before the listener yields to the renderer
 
 SPI_BUS = 1
 SPI_DEVICE = 0
 SPI_SPEED_HZ = 500000 * 3
+SPI_MAX_TRANSFER = 4096 # spidev refuses single transfers larger than its bufsiz (4096 by default)
 BRIGHTNESS = 1
+DIMMER_LEVEL = 1
+HARDWARE_CONFIG_PATH = '/etc/default/lc8823-demo'
+DBUS_NAME = 'com.resonate.Goggles' # Bus name and interface of dbus_service.py
+DBUS_PATH = '/com/resonate/Goggles'
+REFRESH_INTERVAL = 5 # Seconds after which an unchanged frame is sent again anyway
+GAMMA = 1.0 # Gamma correction of the color pipeline, 1.0 turns it off
+TARGET_FPS = 60 # Upper bound for frames sent to the strip per second
+FADE_SECONDS = 1.0 # Length of the fade into rest mode
+REST_TIMEOUT = 1.0 # Seconds without packets before rest mode shows the R
+BLANK_TIMEOUT = 5 * 60 # Seconds rest mode shows the R before the strip is turned off
 
-r = [[0,0,0],[0,0,0],[0,0,0],[0,0,0],[0,0,0],[255,255,255],[255,255,255],[255,255,255],[255,255,255],[255,255,255],[255,255,255],[255,255,255],[255,255,255], [255,255,255], [0,0,0], [0,0,0], [0,0,0], [0,0,0], [0,0,0], [0,0,0],
+# Images are kept as packed RGB bytes, 3 bytes per LED, built once at import
+def _pack_image(pixels):
+    return bytes(color for pixel in pixels for color in pixel)
+
+r = _pack_image([[0,0,0],[0,0,0],[0,0,0],[0,0,0],[0,0,0],[255,255,255],[255,255,255],[255,255,255],[255,255,255],[255,255,255],[255,255,255],[255,255,255],[255,255,255], [255,255,255], [0,0,0], [0,0,0], [0,0,0], [0,0,0], [0,0,0], [0,0,0],
               [0,0,0],[0,0,0],[0,0,0],[0,0,0],[0,0,0],[255,255,255],[0,0,0],[0,0,0],[0,0,0],[0,0,0],[0,0,0],[0,0,0],[0,0,0],[0,0,0],[255,255,255],      [0,0,0],       [0,0,0],       [0,0,0], [0,0,0], [0,0,0],
               [0,0,0],[0,0,0],[0,0,0],[0,0,0],[0,0,0],[255,255,255],[0,0,0],[0,0,0],[0,0,0],[0,0,0],[0,0,0],[0,0,0],[0,0,0],[0,0,0],[255,255,255], [0,0,0], [0,0,0], [0,0,0], [0,0,0], [0,0,0],
               [0,0,0],[0,0,0],[0,0,0],[0,0,0],[0,0,0],[255,255,255],[0,0,0],[255,255,255],[255,255,255],[255,255,255],[255,255,255],[255,255,255],[255,255,255],[255,255,255],[0,0,0], [0,0,0], [0,0,0], [0,0,0], [0,0,0], [0,0,0],
               [0,0,0],[0,0,0],[0,0,0],[0,0,0],[0,0,0],[255,255,255],[0,0,0],[0,0,0],[0,0,0],[0,0,0],[0,0,0],[0,0,0],[0,0,0],[0,0,0],[255,255,255], [0,0,0], [0,0,0], [0,0,0], [0,0,0], [0,0,0],
               [0,0,0],[0,0,0],[0,0,0],[255,255,255],[0,0,0],[0,0,0],[0,0,0],[0,0,0],[255,255,255], [0,0,0], [0,0,0], [0,0,0],
-              [0,0,0],[0,0,0],[0,0,0],[255,255,255],[0,0,0],[0,0,0],[255,255,255], [0,0,0], [0,0,0], [0,0,0]]
+              [0,0,0],[0,0,0],[0,0,0],[255,255,255],[0,0,0],[0,0,0],[255,255,255], [0,0,0], [0,0,0], [0,0,0]])
 
 
-r1 = [[0,0,255],[0,0,255],[0,0,255],[0,0,255],[0,0,255],[255,255,0],[255,255,0],[255,255,0],[255,255,0],[255,255,0],[255,255,0],[255,255,0],[255,255,0], [255,255,0], [0,0,255], [0,0,255], [0,0,255], [0,0,255], [0,0,255], [0,0,255],
+r1 = _pack_image([[0,0,255],[0,0,255],[0,0,255],[0,0,255],[0,0,255],[255,255,0],[255,255,0],[255,255,0],[255,255,0],[255,255,0],[255,255,0],[255,255,0],[255,255,0], [255,255,0], [0,0,255], [0,0,255], [0,0,255], [0,0,255], [0,0,255], [0,0,255],
               [0,0,255],[0,0,255],[0,0,255],[0,0,255],[0,0,255],[255,255,0],[0,0,255],[0,0,255],[0,0,255],[0,0,255],[0,0,255],[0,0,255],[0,0,255],[0,0,255],[255,255,0],      [0,0,255],       [0,0,255],       [0,0,255], [0,0,255], [0,0,255],
               [0,0,255],[0,0,255],[0,0,255],[0,0,255],[0,0,255],[255,255,0],[0,0,255],[0,0,255],[0,0,255],[0,0,255],[0,0,255],[0,0,255],[0,0,255],[0,0,255],[255,255,0], [0,0,255], [0,0,255], [0,0,255], [0,0,255], [0,0,255],
               [0,0,255],[0,0,255],[0,0,255],[0,0,255],[0,0,255],[255,255,0],[0,0,255],[255,255,0],[255,255,0],[255,255,0],[255,255,0],[255,255,0],[255,255,0],[255,255,0],[0,0,255], [0,0,255], [0,0,255], [0,0,255], [0,0,255], [0,0,255],
               [0,0,255],[0,0,255],[0,0,255],[0,0,255],[0,0,255],[255,255,0],[0,0,255],[0,0,255],[0,0,255],[0,0,255],[0,0,255],[0,0,255],[0,0,255],[0,0,255],[255,255,0], [0,0,255], [0,0,255], [0,0,255], [0,0,255], [0,0,255],
               [0,0,255],[0,0,255],[0,0,255],[255,255,0],[0,0,255],[0,0,255],[0,0,255],[0,0,255],[255,255,0], [0,0,255], [0,0,255], [0,0,255],
-              [0,0,255],[0,0,255],[0,0,255],[255,255,0],[0,0,255],[0,0,255],[255,255,0], [0,0,255], [0,0,255], [0,0,255]]
\ No newline at end of file
+              [0,0,255],[0,0,255],[0,0,255],[255,255,0],[0,0,255],[0,0,255],[255,255,0], [0,0,255], [0,0,255], [0,0,255]])
\ No newline at end of file
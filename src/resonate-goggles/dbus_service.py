@@ -0,0 +1,98 @@
+"""
+D-Bus interface of the goggles, com.resonate.Goggles.
+
+Lets other services on the device control the goggles and get told about
+changes instead of polling GET /goggles. Exported on the system bus (or
+the session bus) when DBUS_SERVICE=1 is set in the hardware config, by the
+process that runs the goggles (see goggles_setup.start_goggles).
+
+Properties: Dimmer, Brightness (read/write), RestMode, RestState, Effect
+Methods: SetEffect(name, num_cycles), StopEffect(), PushFrame(packet)
+Signal: StateChanged(a{sv}), with the properties that changed
+
+PushFrame takes a binary frame packet as described in frame_protocol.py.
+
+    busctl --system introspect com.resonate.Goggles /com/resonate/Goggles
+"""
+from dbus_next import BusType, DBusError, Variant
+from dbus_next.aio import MessageBus
+from dbus_next.constants import PropertyAccess
+from dbus_next.service import ServiceInterface, dbus_property, method, signal
+from constants import DBUS_NAME, DBUS_PATH
+from effect_scheduler import EFFECTS
+
+# D-Bus signature of the keys LightGoggles.notify_state sends
+STATE_SIGNATURES = {'Dimmer': 'u', 'Brightness': 'u', 'RestMode': 'b', 'RestState': 's', 'Effect': 's'}
+
+
+class GogglesInterface(ServiceInterface):
+    def __init__(self, goggles):
+        super().__init__(DBUS_NAME)
+        self.goggles = goggles
+        goggles.add_state_listener(self.state_changed)
+
+    def state_changed(self, changes):
+        self.emit_properties_changed(changes) # org.freedesktop.DBus.Properties.PropertiesChanged
+        self.StateChanged({key: Variant(STATE_SIGNATURES[key], value) for key, value in changes.items()})
+
+    @signal()
+    def StateChanged(self, changes) -> 'a{sv}':
+        return changes
+
+    @dbus_property()
+    def Dimmer(self) -> 'u':
+        return self.goggles.color_divider
+
+    @Dimmer.setter
+    def Dimmer(self, dimmer: 'u'):
+        if dimmer < 1:
+            raise DBusError(f'{DBUS_NAME}.Error.InvalidValue', 'dimmer must be 1 or more')
+        self.goggles.color_divider = dimmer # Notifies, see state_changed
+
+    @dbus_property()
+    def Brightness(self) -> 'u':
+        return self.goggles.strip.global_brightness
+
+    @Brightness.setter
+    def Brightness(self, brightness: 'u'):
+        if brightness > 31:
+            raise DBusError(f'{DBUS_NAME}.Error.InvalidValue', 'brightness goes from 0 to 31')
+        self.goggles.set_brightness(brightness)
+
+    @dbus_property(access=PropertyAccess.READ)
+    def RestMode(self) -> 'b':
+        return self.goggles.rest_mode
+
+    @dbus_property(access=PropertyAccess.READ)
+    def RestState(self) -> 's':
+        return self.goggles.rest.state
+
+    @dbus_property(access=PropertyAccess.READ)
+    def Effect(self) -> 's':
+        return self.goggles.effects.current or ''
+
+    @method()
+    def SetEffect(self, name: 's', num_cycles: 'i') -> 's':
+        if name not in EFFECTS:
+            raise DBusError(f'{DBUS_NAME}.Error.UnknownEffect', f'unknown effect {name}')
+        self.goggles.effects.start(name, num_cycles=num_cycles)
+        return name
+
+    @method()
+    def StopEffect(self):
+        self.goggles.effects.stop()
+
+    @method()
+    def PushFrame(self, packet: 'ay') -> 'u':
+        sequence = self.goggles.handle_frame(packet, len(packet))
+        if sequence is None:
+            raise DBusError(f'{DBUS_NAME}.Error.InvalidFrame', 'not a valid frame packet')
+        return sequence
+
+
+async def export_goggles(goggles, bus_type='system'):
+    """Connects to the bus and exports the goggles, returns the bus (disconnect() to stop)."""
+    bus = await MessageBus(bus_type=BusType.SESSION if bus_type == 'session' else BusType.SYSTEM).connect()
+    bus.export(DBUS_PATH, GogglesInterface(goggles))
+    await bus.request_name(DBUS_NAME)
+    return bus
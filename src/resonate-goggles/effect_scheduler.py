@@ -0,0 +1,123 @@
+import asyncio
+import os
+from constants import TARGET_FPS
+from baked_animation import BakedAnimation
+from goggle_light_show_templates import StrandTest, TheaterChase, RoundAndRound, Solid, Rainbow
+
+# Effects that can be started by name, with the settings used by run_demo
+EFFECTS = {
+    'solid': (Solid, {'pause_value': 2, 'num_steps_per_cycle': 1}),
+    'roundandround': (RoundAndRound, {'pause_value': 0, 'num_steps_per_cycle': None}),
+    'strandtest': (StrandTest, {'pause_value': 0, 'num_steps_per_cycle': None}),
+    'theaterchase': (TheaterChase, {'pause_value': 0.04, 'num_steps_per_cycle': 35}),
+    'rainbow': (Rainbow, {'pause_value': 0, 'num_steps_per_cycle': 255}),
+}
+
+
+def create_effect(name, strip, num_cycles=-1):
+    """Creates the effect called name for strip. Raises KeyError for unknown names."""
+    effect_class, params = EFFECTS[name]
+    params = dict(params)
+    if params['num_steps_per_cycle'] is None:
+        params['num_steps_per_cycle'] = strip.num_led  # One trip around the strip
+    return effect_class(num_led=strip.num_led, strip=strip, num_cycles=num_cycles,
+                        global_brightness=strip.global_brightness, **params)
+
+
+class EffectScheduler:
+    """
+    Runs light show effects (ColorCycleTemplate subclasses) and baked
+    animations as asyncio tasks.
+
+    Only one effect runs at a time, starting an effect replaces the current
+    one. Video streaming has priority, ingest calls preempt() which stops
+    the effect right away.
+
+    Attributes
+    ----------
+    strip : APA102
+        The strip effects paint on
+    current : str
+        Name of the running effect, None if no effect runs
+    on_idle : callable
+        Called when an effect ends by itself or through stop(), not when
+        it is preempted or replaced, so the owner can draw the strip again
+    on_change : callable
+        Called with the name of the new current effect (None when none runs)
+    """
+    def __init__(self, strip, fps=TARGET_FPS):
+        self.strip = strip
+        self.fps = fps
+        self.current = None
+        self.on_idle = None
+        self.on_change = None
+        self._task = None
+
+    @property
+    def running(self):
+        return self._task is not None and not self._task.done()
+
+    def start(self, name, num_cycles=-1):
+        """Starts the effect called name, see EFFECTS. Raises KeyError for unknown names."""
+        effect = create_effect(name, self.strip, num_cycles)
+        return self._run(name, effect.run(self.fps))
+
+    def play(self, animation, num_cycles=-1):
+        """Plays a BakedAnimation, see baked_animation.py."""
+        animation.check(self.strip)
+        return self._run(os.path.basename(animation.path), animation.play(self.strip, num_cycles))
+
+    def play_file(self, path, num_cycles=-1):
+        """Plays the baked animation in path, the file is closed when it ends.
+
+        Raises OSError or ValueError if it can't be played on this strip.
+        """
+        animation = BakedAnimation(path)
+        try:
+            animation.check(self.strip)
+        except ValueError:
+            animation.close()
+            raise
+        task = self.play(animation, num_cycles)
+        task.add_done_callback(lambda task: animation.close())
+        return task
+
+    def _run(self, name, coroutine):
+        if self._task is not None:
+            self._task.cancel() # Replaced, listeners only hear about the new one
+        self.current = name
+        self._task = asyncio.get_running_loop().create_task(coroutine)
+        self._task.add_done_callback(self._finished)
+        self._changed()
+        return self._task
+
+    def stop(self):
+        running = self._task is not None
+        self._cancel()
+        if running and self.on_idle is not None:
+            self.on_idle()
+
+    def preempt(self):
+        # Called for every video packet, keep it cheap when nothing runs
+        if self._task is not None:
+            self._cancel()
+
+    def _cancel(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        if self.current is not None:
+            self.current = None
+            self._changed()
+
+    def _changed(self):
+        if self.on_change is not None:
+            self.on_change(self.current)
+
+    def _finished(self, task):
+        if task is self._task:  # Ran out of cycles, wasn't replaced
+            self._task = None
+            self.current = None
+            self._changed()
+            if self.on_idle is not None:
+                self.on_idle()
@@ -0,0 +1,44 @@
+from collections import OrderedDict
+
+FRAME_CACHE_SIZE = 8
+
+
+class EncodedFrameCache:
+    """
+    LRU cache of encoded LED frames for static images.
+
+    A static image such as the rest mode "R" only has to go through the
+    color table and the strip encoding once per combination of dimmer,
+    gamma, global brightness and channel order. After that, showing it is
+    a single copy into the pixel buffer (APA102.load_frame).
+
+    Keys are tuples chosen by the caller and must contain everything the
+    encoded frame depends on. invalidate() drops all frames, call it when
+    the color pipeline or the strip configuration changes.
+    """
+    def __init__(self, max_entries=FRAME_CACHE_SIZE):
+        self.max_entries = max_entries
+        self._frames = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        frame = self._frames.get(key)
+        if frame is None:
+            self.misses += 1
+            return None
+        self._frames.move_to_end(key)
+        self.hits += 1
+        return frame
+
+    def put(self, key, frame):
+        self._frames[key] = frame
+        self._frames.move_to_end(key)
+        while len(self._frames) > self.max_entries:
+            self._frames.popitem(last=False)  # Least recently used
+
+    def invalidate(self):
+        self._frames.clear()
+
+    def __len__(self):
+        return len(self._frames)
@@ -0,0 +1,114 @@
+"""
+Wire formats for streaming frames to the goggles.
+
+Binary frame packet (all fields big endian):
+
+    offset  size  field
+    0       2     magic, b'LG'
+    2       1     version, currently 1
+    3       1     pixel format, FORMAT_RGB or FORMAT_PALETTE
+    4       4     sequence number, incremented by the sender for every frame
+    8       2     pixel count
+    10      ...   pixel data
+
+FORMAT_RGB pixel data is packed red, green, blue per pixel, 3*n bytes.
+
+FORMAT_PALETTE pixel data starts with the number of palette entries p
+(1 byte, 0 means 256), then the palette as 3*p red, green, blue bytes and
+then one palette index per pixel, n bytes. Indices past the palette show
+black.
+
+Legacy packet: newline separated lines, the 4th line holds one red, green,
+blue byte triple that is shown on every LED.
+
+The parsers work on the receive buffer in place, RGB frames and legacy
+packets do not allocate per packet.
+"""
+import struct
+
+FRAME_MAGIC = b'LG'
+FRAME_VERSION = 1
+FORMAT_RGB = 0
+FORMAT_PALETTE = 1
+FRAME_HEADER = struct.Struct('!2sBBIH')  # magic, version, format, sequence, pixel count
+
+
+def is_frame_packet(buffer, nbytes):
+    """True if the buffer starts with a binary frame header."""
+    return nbytes >= FRAME_HEADER.size and buffer[0:2] == FRAME_MAGIC
+
+
+def parse_frame(buffer, nbytes, target):
+    """Copies the pixels of a binary frame packet into target.
+
+    target is a writable bytes-like object with room for 3 bytes per pixel,
+    pixels that don't fit are ignored and pixels past the ones in the packet
+    keep their old value.
+    Returns (sequence, bytes written), or None if the packet is invalid.
+    """
+    if nbytes < FRAME_HEADER.size:
+        return None
+    magic, version, pixel_format, sequence, pixel_count = FRAME_HEADER.unpack_from(buffer, 0)
+    if magic != FRAME_MAGIC or version != FRAME_VERSION:
+        return None
+    if pixel_format == FORMAT_PALETTE:
+        return parse_palette_pixels(buffer, nbytes, target, sequence, pixel_count)
+    if pixel_format != FORMAT_RGB:
+        return None
+    length = 3 * pixel_count
+    if nbytes < FRAME_HEADER.size + length:
+        return None  # Truncated
+    length = min(length, len(target))
+    memoryview(target)[:length] = memoryview(buffer)[FRAME_HEADER.size:FRAME_HEADER.size + length]
+    return sequence, length
+
+
+def parse_palette_pixels(buffer, nbytes, target, sequence, pixel_count):
+    # Each channel is looked up with bytes.translate, the palette becomes
+    # three 256 byte tables and the indices are translated once per channel.
+    start = FRAME_HEADER.size + 1
+    if nbytes < start:
+        return None
+    entries = buffer[FRAME_HEADER.size] or 256
+    indices = start + 3 * entries
+    if nbytes < indices + pixel_count:
+        return None  # Truncated
+    palette = bytes(buffer[start:indices]) + bytes(3 * (256 - entries))
+    count = min(pixel_count, len(target) // 3)
+    pixels = bytes(buffer[indices:indices + count])
+    for channel in range(3):
+        target[channel:3 * count:3] = pixels.translate(palette[channel::3])
+    return sequence, 3 * count
+
+
+def find_legacy_color(buffer, nbytes):
+    """Returns the offset of the color triple in a legacy packet, or -1."""
+    start = 0
+    for _ in range(3):  # Skip the first three lines
+        newline = buffer.find(b'\n', start, nbytes)
+        if newline < 0:
+            return -1
+        start = newline + 1
+    end = buffer.find(b'\n', start, nbytes)
+    if end < 0:
+        end = nbytes
+    if end - start < 3:  # Skip color values that don't make sense!
+        return -1
+    return start
+
+
+def pack_frame(sequence, rgb_data, pixel_format=FORMAT_RGB):
+    """Builds a binary frame packet, used by senders and tools."""
+    header = FRAME_HEADER.pack(FRAME_MAGIC, FRAME_VERSION, pixel_format,
+                               sequence & 0xFFFFFFFF, len(rgb_data) // 3)
+    return header + bytes(rgb_data)
+
+
+def pack_palette_frame(sequence, palette, indices):
+    """Builds a FORMAT_PALETTE packet from packed RGB palette entries and one index per pixel."""
+    entries = len(palette) // 3
+    if not 1 <= entries <= 256:
+        raise ValueError("palette must have 1 to 256 entries")
+    header = FRAME_HEADER.pack(FRAME_MAGIC, FRAME_VERSION, FORMAT_PALETTE,
+                               sequence & 0xFFFFFFFF, len(indices))
+    return header + bytes((entries & 0xFF,)) + bytes(palette[:3 * entries]) + bytes(indices)
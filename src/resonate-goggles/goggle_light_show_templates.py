@@ -1,8 +1,56 @@
-import spidev
+import asyncio
 import sys
 import time
+from functools import lru_cache
 from math import ceil
-from constants import NUM_LED, RGB_MAP, r
+from constants import NUM_LED, RGB_MAP, r, TARGET_FPS
+from led_driver import WHEEL_LUT
+
+# Frame kernels. They build the packed RGB frame (3 bytes per LED) for one
+# step of an effect with slicing and bytes.translate, i.e. in C, instead of
+# calling wheel() and set_pixel_rgb() for every pixel.
+
+# One table per channel: wheel position -> red, green or blue
+WHEEL_RED = WHEEL_LUT[0::3]
+WHEEL_GREEN = WHEEL_LUT[1::3]
+WHEEL_BLUE = WHEEL_LUT[2::3]
+
+
+def wheel_frame(positions, shift=0):
+    """Packed RGB for a bytes object of wheel positions (0..254).
+
+    shift is added to every position, modulo 255, by rotating the tables.
+    """
+    shift %= 255
+    frame = bytearray(3 * len(positions))
+    frame[0::3] = positions.translate(WHEEL_RED[shift:255] + WHEEL_RED[:shift] + WHEEL_RED[255:])
+    frame[1::3] = positions.translate(WHEEL_GREEN[shift:255] + WHEEL_GREEN[:shift] + WHEEL_GREEN[255:])
+    frame[2::3] = positions.translate(WHEEL_BLUE[shift:255] + WHEEL_BLUE[:shift] + WHEEL_BLUE[255:])
+    return frame
+
+
+@lru_cache(maxsize=8)
+def rainbow_positions(num_led):
+    """Wheel position of every LED relative to LED 0, one full rainbow over the strip."""
+    scale_factor = 255 / num_led  # Index change between two neighboring LEDs
+    return bytes(int(round(i * scale_factor, 0)) % 255 for i in range(num_led))
+
+
+def rainbow_frame(num_led, num_steps_per_cycle, current_step):
+    """One step of Rainbow.
+
+    Positions are rounded per LED and per step separately, so a pixel can be
+    one wheel position off the per pixel calculation, which is not visible.
+    """
+    start_index = int(round(255 / num_steps_per_cycle * current_step, 0))  # LED 0
+    return wheel_frame(rainbow_positions(num_led), start_index)
+
+
+def theater_chase_frame(num_led, rgb, start_index):
+    """One step of TheaterChase, LEDs where (pixel + start_index) % 7 is 0 or 1 are off."""
+    segment = bytes(6) + bytes(rgb[:3]) * 5  # 2 blank, 5 filled
+    repeats = (num_led + start_index) // 7 + 1
+    return (segment * repeats)[3 * start_index:3 * (start_index + num_led)]
 
 
 class ColorCycleTemplate:
@@ -11,8 +59,13 @@ class ColorCycleTemplate:
 
     A specific color cycle must subclass this template, and implement at least the
     'update' method.
+
+    cycles_per_period is the number of cycles after which the effect shows
+    the same frames again, baked animations hold that many cycles.
     """
 
+    cycles_per_period = 1
+
     def __init__(self, num_led, strip, pause_value=0, num_steps_per_cycle=100, num_cycles=-1, global_brightness=4):
         self.num_led = num_led  # The number of LEDs in the strip
         self.pause_value = pause_value  # How long to pause between two runs
@@ -66,6 +119,8 @@ class ColorCycleTemplate:
             self.init(self.strip, self.num_led)  # Call the subclasses init method
             self.strip.show()
             current_cycle = 0
+            # Steps are due at fixed times, so the time spent painting does not add up
+            deadline = time.monotonic()
             while True:  # Loop forever
                 for current_step in range(self.num_steps_per_cycle):
                     need_repaint = self.update(self.strip, self.num_led,
@@ -73,7 +128,12 @@ class ColorCycleTemplate:
                                                current_step, current_cycle)
                     if need_repaint:
                         self.strip.show()  # repaint if required
-                    time.sleep(self.pause_value)  # Pause until the next step
+                    deadline += self.pause_value
+                    delay = deadline - time.monotonic()
+                    if delay > 0:
+                        time.sleep(delay)  # Pause until the next step
+                    else:
+                        deadline = time.monotonic()  # Running late, don't rush the next steps
                 current_cycle += 1
                 if self.num_cycles != -1 and current_cycle >= self.num_cycles:
                     break
@@ -85,11 +145,46 @@ class ColorCycleTemplate:
             if self.strip is not None:
                 self.strip.cleanup()
 
+    async def run(self, fps=TARGET_FPS):
+        """Asyncio version of start(), to run the effect as a task.
+
+        Steps are due on absolute time.monotonic() deadlines, one every
+        pause_value seconds but not faster than fps, so time spent in
+        update() and on the SPI bus is taken out of the pause. The strip is
+        shown with show_async(), the event loop keeps running in between.
+        Cancel the task to stop the effect.
+        """
+        period = max(self.pause_value, 1.0 / fps)
+        try:
+            self.strip.clear_strip()
+            self.init(self.strip, self.num_led)  # Call the subclasses init method
+            await self.strip.show_async()
+            current_cycle = 0
+            deadline = time.monotonic()
+            while True:
+                for current_step in range(self.num_steps_per_cycle):
+                    need_repaint = self.update(self.strip, self.num_led,
+                                               self.num_steps_per_cycle,
+                                               current_step, current_cycle)
+                    if need_repaint:
+                        await self.strip.show_async()
+                    deadline += period
+                    delay = deadline - time.monotonic()
+                    if delay < -period:
+                        deadline = time.monotonic()  # More than a step behind, don't rush to catch up
+                    await asyncio.sleep(max(delay, 0))
+                current_cycle += 1
+                if self.num_cycles != -1 and current_cycle >= self.num_cycles:
+                    break
+        finally:
+            self.shutdown(self.strip, self.num_led)
+
 
 class StrandTest(ColorCycleTemplate):
     """Runs a simple strand test (9 LEDs wander through the strip)."""
 
     color = None
+    cycles_per_period = 3  # Red, green, blue
 
     def init(self, strip, num_led):
         self.color = 0x000000  # Initialize with black
@@ -125,15 +220,10 @@ class TheaterChase(ColorCycleTemplate):
         # Note: For a smooth transition between cycles, numStepsPerCycle must
         # be a multiple of 7
         start_index = current_step % 7  # One segment is 2 blank, and 5 filled
-        color_index = strip.wheel(int(round(255 / num_steps_per_cycle *
-                                            current_step, 0)))
-        for pixel in range(num_led):
-            # Two LEDs out of 7 are blank. At each step, the blank
-            # ones move one pixel ahead.
-            if ((pixel + start_index) % 7 == 0) or ((pixel + start_index) % 7 == 1):
-                strip.set_pixel_rgb(pixel, 0)
-            else:
-                strip.set_pixel_rgb(pixel, color_index)
+        wheel_pos = min(int(round(255 / num_steps_per_cycle * current_step, 0)), 255)
+        # Two LEDs out of 7 are blank. At each step, the blank
+        # ones move one pixel ahead.
+        strip.set_pixels(theater_chase_frame(num_led, WHEEL_LUT[3 * wheel_pos:3 * wheel_pos + 3], start_index))
         return 1
 
 
@@ -163,8 +253,7 @@ class Solid(ColorCycleTemplate):
             stripcolour = 0x00FF00
         if current_step == 3:
             stripcolour = 0x0000FF
-        for led in range(0, num_led):
-            strip.set_pixel_rgb(led, stripcolour, 5)  # Paint 5% white
+        strip.fill(strip.split_color(stripcolour), 5)  # Paint 5% white
         return 1
 
 
@@ -182,16 +271,7 @@ class Rainbow(ColorCycleTemplate):
         #     again until the last one is just below LED 0. This way, the
         #     strip always shows one full rainbow, regardless of the
         #     number of LEDs
-        scale_factor = 255 / num_led  # Index change between two neighboring LEDs
-        start_index = 255 / num_steps_per_cycle * current_step  # LED 0
-        for i in range(num_led):
-            # Index of LED i, not rounded and not wrapped at 255
-            led_index = start_index + i * scale_factor
-            # Now rounded and wrapped
-            led_index_rounded_wrapped = int(round(led_index, 0)) % 255
-            # Get the actual color out of the wheel
-            pixel_color = strip.wheel(led_index_rounded_wrapped)
-            strip.set_pixel_rgb(i, pixel_color)
+        strip.set_pixels(rainbow_frame(num_led, num_steps_per_cycle, current_step))
         return 1  # All pixels are set in the buffer, so repaint the strip now
 
 def run_demo(lg):
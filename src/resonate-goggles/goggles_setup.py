@@ -0,0 +1,122 @@
+"""
+Building, starting and stopping the goggles.
+
+Kept out of main.py so the render process (see render_process.py) can set
+up the goggles without importing the web app.
+"""
+import asyncio
+import socket
+import led_driver
+import light_goggles
+import metrics
+import spi_transport
+import strip_group
+from local_ingest import LocalIngest
+from constants import LOCAL_SOCKET_PATH, RECORDINGS_DIR, ANIMATIONS_DIR, NUM_LED, UDP_IP, UDP_PORT, UDP_RCVBUF, SPI_BUS, SPI_DEVICE, SPI_SPEED_HZ, BRIGHTNESS, TARGET_FPS, GAMMA, DIMMER_LEVEL, REST_TIMEOUT, BLANK_TIMEOUT
+
+goggle_tasks = []
+goggle_inputs = [] # Started LocalIngest, stopped by teardown_goggles()
+
+def open_strip(defaults, num_led, spi_bus, spi_device):
+    spi_speed = int(defaults.get('SPI_SPEED', SPI_SPEED_HZ))
+    return led_driver.APA102(num_led=num_led, 
+                             global_brightness=int(defaults.get('LED_BRIGHTNESS', BRIGHTNESS)), 
+                             SPI_BUS=spi_bus, 
+                             SPI_DEVICE=spi_device,
+                             SPI_SPEED_HZ=spi_speed,
+                             transport=spi_transport.open_transport(defaults.get('SPI_BACKEND'), spi_bus, spi_device,
+                                                                    spi_speed))
+
+def strip_led_count(defaults):
+    # Number of LEDs setup_goggles() will drive with these options
+    segments = strip_group.parse_segments(defaults.get('SPI_SEGMENTS', ''))
+    if segments:
+        return sum(num_led for _, _, num_led in segments)
+    return NUM_LED
+
+def setup_goggles(defaults):
+    #Initialize Strip - SPI_SEGMENTS spreads the pixels over several SPI devices, see strip_group.py
+    segments = strip_group.parse_segments(defaults.get('SPI_SEGMENTS', ''))
+    if segments:
+        strip = strip_group.StripGroup([open_strip(defaults, num_led, spi_bus, spi_device) 
+                                        for spi_bus, spi_device, num_led in segments])
+    else:
+        strip = open_strip(defaults, NUM_LED, SPI_BUS, SPI_DEVICE)
+
+    #Initialize UDP - the socket stays open until teardown_goggles()
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, int(defaults.get('UDP_RCVBUF', UDP_RCVBUF))) # Room for bursts, the listener drains it in batches
+    sock.bind((UDP_IP, UDP_PORT))
+    sock.setblocking(0)
+
+
+    #Initialize Goggles
+    return light_goggles.LightGoggles(strip, sock, 
+                                      color_divider=int(defaults.get("DIMMER_LEVEL", DIMMER_LEVEL)), #DIMMER_LEVEL becomes color_divider inside the Light Goggles class
+                                      fps=int(defaults.get("TARGET_FPS", TARGET_FPS)),
+                                      gamma=float(defaults.get("GAMMA", GAMMA)),
+                                      rest_timeout=float(defaults.get("REST_TIMEOUT", REST_TIMEOUT)),
+                                      blank_timeout=float(defaults.get("BLANK_TIMEOUT", BLANK_TIMEOUT)))
+
+def dbus_bus_type(defaults):
+    # DBUS_SERVICE=1 (or system) exports the goggles on the system bus, session on the session bus
+    bus_type = defaults.get('DBUS_SERVICE', '0')
+    if bus_type in ('', '0'):
+        return None
+    return 'session' if bus_type == 'session' else 'system'
+
+async def serve_dbus(lg, bus_type):
+    from dbus_service import export_goggles # dbus-next is only needed with DBUS_SERVICE set
+    try:
+        bus = await export_goggles(lg, bus_type)
+    except Exception as e:
+        print(f"D-Bus service not available: {e}")
+        return
+    try:
+        await bus.wait_for_disconnect()
+    finally:
+        bus.disconnect()
+
+def local_socket_path(defaults):
+    # LOCAL_SOCKET= (empty) turns the local frame input off
+    return defaults.get('LOCAL_SOCKET', LOCAL_SOCKET_PATH) or None
+
+def recordings_dir(defaults):
+    return defaults.get('RECORDINGS_DIR', RECORDINGS_DIR)
+
+def animations_dir(defaults):
+    return defaults.get('ANIMATIONS_DIR', ANIMATIONS_DIR)
+
+def start_goggles(lg, dbus_bus=None, local_socket=None):
+    loop = asyncio.get_running_loop()
+    lg.strip.start_writer() # SPI transfers must not block the event loop
+    #goggle_tasks.append(loop.create_task(lg.get_new_variables()))
+    goggle_tasks.append(loop.create_task(lg.receive_vid_stream()))
+    goggle_tasks.append(loop.create_task(lg.renderer.run()))
+    goggle_tasks.append(loop.create_task(metrics.monitor_event_loop_lag()))
+    lg.rest.start() # Timers on the event loop, no task needed
+    if dbus_bus is not None:
+        goggle_tasks.append(loop.create_task(serve_dbus(lg, dbus_bus)))
+    if local_socket is not None:
+        local_ingest = LocalIngest(lg, local_socket)
+        try:
+            local_ingest.start()
+        except OSError as e:
+            print(f"Local frame socket {local_socket} not available: {e}")
+        else:
+            goggle_inputs.append(local_ingest)
+
+def teardown_goggles(lg):
+    for task in goggle_tasks:
+        task.cancel()
+    goggle_tasks.clear()
+    for local_ingest in goggle_inputs:
+        local_ingest.stop()
+    goggle_inputs.clear()
+    lg.rest.stop()
+    lg.effects.preempt() # Neither the effect nor a fade may paint after the strip was cleared
+    lg.cancel_fade()
+    lg.stop_recording()
+    lg.sock.close()
+    lg.strip.clear_strip()
+    lg.strip.stop_writer()
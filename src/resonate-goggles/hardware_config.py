@@ -0,0 +1,132 @@
+import asyncio
+import os
+from constants import HARDWARE_CONFIG_PATH
+
+
+def parse_config(text):
+    """KEY=value lines, as in /etc/default files."""
+    options = {}
+    for line in text.splitlines():
+        line = line.strip()
+        if not line or line.startswith('#') or '=' not in line:
+            continue
+        key, value = line.split('=', 1)
+        options[key.strip()] = value.strip()
+    return options
+
+
+def serialize_config(options):
+    return ''.join(f"{key}={value}\n" for key, value in options.items())
+
+
+# Options applied to the running goggles: type, check and what a valid value is
+LIVE_SETTINGS = {
+    'SPI_SPEED': (int, lambda value: value > 0, "must be more than 0"),
+    'LED_BRIGHTNESS': (int, lambda value: 0 <= value <= 31, "goes from 0 to 31"),
+    'DIMMER_LEVEL': (int, lambda value: value >= 1, "must be 1 or more"),
+    'GAMMA': (float, lambda value: value > 0, "must be more than 0"),
+    'REST_TIMEOUT': (float, lambda value: value > 0, "must be more than 0"), # 0 would rest after every packet
+    'BLANK_TIMEOUT': (float, lambda value: value >= 0, "must not be negative"),
+}
+
+
+def live_settings(options):
+    """The LIVE_SETTINGS in options, converted and checked.
+
+    Raises ValueError if any of them is invalid, so nothing gets applied
+    half way.
+    """
+    settings = {}
+    for key, (kind, valid, expected) in LIVE_SETTINGS.items():
+        if key not in options:
+            continue
+        value = kind(options[key])
+        if not valid(value):
+            raise ValueError(f"{key} {expected}, got {options[key]}")
+        settings[key] = value
+    return settings
+
+
+class HardwareConfigStore:
+    """
+    In-memory copy of the hardware config file.
+
+    read() only re-parses the file when its modification time changed,
+    write() updates the copy right away and writes the file on a worker
+    thread. Listeners (e.g. LightGoggles.apply_hardware_config) are called
+    with the new options whenever they change, through write() or because
+    the file was edited, which watch() checks for periodically.
+
+    A missing file reads as no options, callers fall back to defaults.
+    """
+    def __init__(self, path=HARDWARE_CONFIG_PATH):
+        self.path = path
+        self._options = {}
+        self._mtime = None
+        self._loaded = False # Set by the first read(), which notifies nobody
+        self._listeners = []
+
+    def add_listener(self, listener):
+        self._listeners.append(listener)
+
+    def read(self):
+        """The current options, a copy that may be changed freely."""
+        self._reload_if_changed()
+        return dict(self._options)
+
+    async def write(self, options):
+        """Replaces the options and writes them to the file in the background."""
+        options = {key: str(value) for key, value in options.items()}
+        changed = options != self._options
+        self._options = options
+        self._loaded = True
+        if changed:
+            self._notify()
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, self._write_file, serialize_config(options))
+        return dict(options)
+
+    async def watch(self, interval=5.0):
+        """Picks up edits to the file made outside of the API."""
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                self._reload_if_changed()
+            except OSError as e:
+                print(f"Hardware config {self.path} not readable: {e}") # Try again next time
+
+    def _mtime_of_file(self):
+        try:
+            return os.stat(self.path).st_mtime_ns
+        except FileNotFoundError:
+            return None
+
+    def _reload_if_changed(self):
+        mtime = self._mtime_of_file()
+        first_read = not self._loaded
+        self._loaded = True # Also without a file, one created later is a change
+        if mtime == self._mtime:
+            return
+        try:
+            with open(self.path, 'r') as f:
+                options = parse_config(f.read())
+        except FileNotFoundError:
+            options = {}
+        self._mtime = mtime
+        if options != self._options:
+            self._options = options
+            if not first_read:
+                self._notify()
+
+    def _write_file(self, text):
+        with open(self.path, 'w') as f:
+            f.write(text)
+        self._mtime = self._mtime_of_file()  # Our own write, nothing to reload
+
+    def _notify(self):
+        options = dict(self._options)
+        for listener in self._listeners:
+            try:
+                listener(options)
+            except Exception as e: # A bad value in the file must not stop the other listeners or watch()
+                print(f"Hardware config not applied: {e!r}")
@@ -1,6 +1,128 @@
-import spidev
+import asyncio
+import threading
+import time
 from math import ceil
-from constants import LED_START, RGB_MAP
+import metrics
+from constants import LED_START, RGB_MAP, SPI_MAX_TRANSFER, REFRESH_INTERVAL
+from spi_transport import open_transport
+
+BARRIER_TIMEOUT = 1.0  # Seconds a writer waits for the other strips of a group
+
+
+def _wheel_rgb(wheel_pos):
+    if wheel_pos < 85:  # Green -> Red
+        return wheel_pos * 3, 255 - wheel_pos * 3, 0
+    if wheel_pos < 170:  # Red -> Blue
+        wheel_pos -= 85
+        return 255 - wheel_pos * 3, 0, wheel_pos * 3
+    # Blue -> Green
+    wheel_pos -= 170
+    return 0, wheel_pos * 3, 255 - wheel_pos * 3
+
+
+# The color wheel as packed RGB, 3 bytes for each of the 256 positions
+WHEEL_LUT = bytes(color for wheel_pos in range(256) for color in _wheel_rgb(wheel_pos))
+
+
+class SpiWriter(threading.Thread):
+    """
+    Background thread that clocks frames out to the SPI device.
+
+    spidev's writebytes2 is a blocking ioctl that takes several milliseconds
+    at slow SPI clocks. This thread does the writing so that callers, in
+    particular the asyncio event loop, only pay for a memory copy.
+
+    Frames are double buffered: submit() copies a frame into the back buffer,
+    the thread swaps it with the front buffer and sends the front buffer
+    while the next frame can already be written to the back buffer. If a
+    frame is submitted while the previous one is still waiting, the previous
+    one is replaced (latest frame wins).
+
+    A frame can come with a threading.Barrier shared with the writers of
+    other strips (see strip_group.py), the thread then waits for all of
+    them before sending so that the strips latch at the same time.
+    """
+
+    def __init__(self, send, frame_size):
+        super().__init__(name="apa102-spi-writer", daemon=True)
+        self._send = send
+        self._front = bytearray(frame_size)
+        self._back = bytearray(frame_size)
+        self._cond = threading.Condition()
+        self._pending = False
+        self._busy = False
+        self._running = True
+        self._callbacks = []
+        self._barrier = None
+        self.frames_written = 0
+        self.frames_replaced = 0
+
+    def submit(self, frame, callback=None, barrier=None):
+        """Queues a frame for sending.
+
+        callback is called from the writer thread once the frame (or a
+        newer frame replacing it) went out, with None or the raised error.
+        """
+        with self._cond:
+            self._back[:] = frame
+            if self._pending:
+                self.frames_replaced += 1
+                if self._barrier is not None:
+                    self._barrier.abort()  # The other strips must not wait for the replaced frame
+            self._pending = True
+            self._barrier = barrier
+            if callback is not None:
+                self._callbacks.append(callback)
+            self._cond.notify_all()
+
+    def flush(self, timeout=None):
+        """Blocks until all submitted frames are sent."""
+        with self._cond:
+            return self._cond.wait_for(lambda: not (self._pending or self._busy), timeout)
+
+    def stop(self):
+        """Sends the last submitted frame, then ends the thread."""
+        with self._cond:
+            self._running = False
+            self._cond.notify_all()
+        self.join()
+
+    def run(self):
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: self._pending or not self._running)
+                if not self._pending:
+                    return
+                self._front, self._back = self._back, self._front
+                self._pending = False
+                self._busy = True
+                callbacks, self._callbacks = self._callbacks, []
+                barrier, self._barrier = self._barrier, None
+            if barrier is not None:
+                try:
+                    barrier.wait(BARRIER_TIMEOUT)
+                except threading.BrokenBarrierError:
+                    pass  # Another strip missed this frame, send anyway
+            error = None
+            try:
+                self._send(self._front)
+            except Exception as e:  # Handed to the callbacks, the thread keeps running
+                error = e
+            with self._cond:
+                self._busy = False
+                self.frames_written += 1
+                self._cond.notify_all()
+            for callback in callbacks:
+                callback(error)
+
+
+def _resolve_future(future, error):
+    if future.cancelled():
+        return
+    if error is not None:
+        future.set_exception(error)
+    else:
+        future.set_result(None)
 
 
 class APA102:
@@ -12,14 +134,25 @@ class APA102:
     Public methods are:
      - set_pixel
      - set_pixel_rgb
+     - fill
+     - set_range
+     - set_pixels
+     - encode_frame
+     - load_frame
      - get_pixel
      - get_pixel_rgb
      - show
+     - show_async
+     - start_writer
+     - stop_writer
      - clear_strip
+     - set_spi_speed
+     - mark_dirty
      - cleanup
 
     Helper methods for color manipulation are:
      - combine_color
+     - split_color
      - wheel
 
     The rest of the methods are used internally and should not be used by the
@@ -66,12 +199,17 @@ class APA102:
     down the line to the last LED.
     """
 
-    def __init__(self, num_led=8, order='rgb', global_brightness=4, SPI_BUS=1, SPI_DEVICE=0, SPI_SPEED_HZ=500000 * 3):
+    def __init__(self, num_led=8, order='rgb', global_brightness=4, SPI_BUS=1, SPI_DEVICE=0, SPI_SPEED_HZ=500000 * 3,
+                 refresh_interval=REFRESH_INTERVAL, transport=None):
         """Initializes the library
 
         :param num_led: Number of LEDs in the strip
         :param order: Order in which the colours are addressed (this differs from strip to strip)
         :param global_brightness: This is a 5 bit value, i.e. from 0 to 31.
+        :param refresh_interval: Seconds after which show() sends an unchanged frame again,
+            in case a strip picked up a glitch.
+        :param transport: SPI transport, see spi_transport.py. By default the one
+            named by the LC8823_SPI_BACKEND environment variable, or spidev.
         """
 
         # Just in case someone use CAPS here.
@@ -82,11 +220,32 @@ class APA102:
         self.global_brightness = global_brightness
         self.order = 'rbg'  # Strip colour ordering
 
-        self.leds = [LED_START, 0, 0, 0] * self.num_led  # Pixel buffer
-
-        self.spi = spidev.SpiDev(SPI_BUS, SPI_DEVICE)
+        # Pixel buffer, 4 bytes per LED laid out exactly as on the wire.
+        self.leds = bytearray([LED_START, 0, 0, 0] * self.num_led)
+
+        # The complete SPI frame is assembled in one preallocated buffer:
+        # start frame, the LED frames, then the SK9822 reset frame followed by
+        # the end frame padding (see clock_end_frame). Only the LED frames
+        # change, start and end frame stay zero for the lifetime of the strip.
+        self._led_offset = 4
+        end_frame_len = 4 + (self.num_led + 15) // 16
+        self._frame = bytearray(self._led_offset + 4 * self.num_led + end_frame_len)
+
+        # Byte range of self.leds written since the last show(). show() skips
+        # the transfer if nothing in it differs from the frame sent last.
+        self._dirty_lo = 0
+        self._dirty_hi = len(self.leds)
+        self.refresh_interval = refresh_interval
+        self._last_transfer = 0.0
+        self.frames_skipped = 0
+
+        if transport is None:
+            transport = open_transport(None, SPI_BUS, SPI_DEVICE, SPI_SPEED_HZ)
+        self.spi = transport
         self.spi.max_speed_hz = SPI_SPEED_HZ
         # print("SPI speed: ", self.spi.max_speed_hz)
+        self._writer = None  # Optional SpiWriter thread, see start_writer
+        self._spi_speed_pending = None  # See set_spi_speed
 
     def clock_start_frame(self):
         """Sends a start frame to the LED strip.
@@ -132,11 +291,24 @@ class APA102:
         """ Set the overall brightness of the strip."""
         self.global_brightness = brigtness
 
+    def set_spi_speed(self, speed_hz):
+        """ Change the SPI clock, takes effect with the next frame sent.
+
+        The change is made by whoever sends that frame (the writer thread
+        if it runs), so it never happens in the middle of a transfer.
+        """
+        self._spi_speed_pending = speed_hz
+
+    @property
+    def spi_speed(self):
+        if self._spi_speed_pending is not None:
+            return self._spi_speed_pending
+        return self.spi.max_speed_hz
+
     def clear_strip(self):
         """ Turns off the strip and shows the result right away."""
 
-        for led in range(self.num_led):
-            self.set_pixel(led, 0, 0, 0)
+        self.fill((0, 0, 0))
         self.show()
 
     def set_pixel(self, led_num, red, green, blue, bright_percent=100):
@@ -151,20 +323,12 @@ class APA102:
         if led_num >= self.num_led:
             return  # again, invisible
 
-        # Calculate pixel brightness as a percentage of the
-        # defined global_brightness. Round up to nearest integer
-        # as we expect some brightness unless set to 0
-        brightness = ceil(bright_percent * self.global_brightness / 100.0)
-        brightness = int(brightness)
-
-        # LED start frame is three "1" bits, followed by 5 brightness bits
-        ledstart = (brightness & 0b00011111) | LED_START
-
         start_index = 4 * led_num
-        self.leds[start_index] = ledstart
+        self.leds[start_index] = self.led_start(bright_percent)
         self.leds[start_index + self.rgb[0]] = red
         self.leds[start_index + self.rgb[1]] = green
         self.leds[start_index + self.rgb[2]] = blue
+        self.mark_dirty(led_num, led_num + 1)
 
     def set_pixel_rgb(self, led_num, rgb_color, bright_percent=100):
         """Sets the color of one pixel in the LED stripe.
@@ -178,6 +342,98 @@ class APA102:
                        (rgb_color & 0x00FF00) >> 8, rgb_color & 0x0000FF,
                        bright_percent)
 
+    def fill(self, rgb, bright_percent=100):
+        """Sets all pixels of the LED stripe to the same color.
+
+        rgb is any sequence of three color values, e.g. a tuple or bytes.
+        The whole pixel buffer is written in one go.
+        """
+        self.leds[:] = self.encode_pixel(rgb, bright_percent) * self.num_led
+        self.mark_dirty()
+
+    def set_range(self, first, last, rgb, bright_percent=100):
+        """Sets the pixels first to last - 1 to the same color.
+
+        Works like a slice, pixels outside of the strip are ignored.
+        """
+        first = max(first, 0)
+        last = min(last, self.num_led)
+        if first >= last:
+            return
+        self.leds[4 * first:4 * last] = self.encode_pixel(rgb, bright_percent) * (last - first)
+        self.mark_dirty(first, last)
+
+    def set_pixels(self, rgb_data, bright_percent=100, first=0):
+        """Copies a block of packed RGB data into the pixel buffer.
+
+        rgb_data is a bytes-like object with three bytes (red, green, blue)
+        per pixel, starting at pixel first. Pixels past the end of the strip
+        are ignored. The colors are reordered for the strip with one strided
+        copy per channel instead of one call per pixel.
+        """
+        data = memoryview(rgb_data)
+        count = min(len(data) // 3, self.num_led - first)
+        if first < 0 or count <= 0:
+            return
+        self._encode_into(self.leds, first, data, count, bright_percent)
+        self.mark_dirty(first, first + count)
+
+    def encode_frame(self, rgb_data, bright_percent=100):
+        """Encodes packed RGB data into LED frames for this strip.
+
+        Returns the encoded pixel buffer as bytes, ready for load_frame().
+        The pixel buffer of the strip is not touched, LEDs not covered by
+        rgb_data are off.
+        """
+        data = memoryview(rgb_data)
+        count = min(len(data) // 3, self.num_led)
+        leds = bytearray([LED_START, 0, 0, 0] * self.num_led)
+        self._encode_into(leds, 0, data, count, bright_percent)
+        return bytes(leds)
+
+    def load_frame(self, encoded):
+        """Replaces the whole pixel buffer with a frame from encode_frame()."""
+        self.leds[:] = encoded
+        self.mark_dirty()
+
+    def _encode_into(self, leds, first, data, count, bright_percent):
+        start = 4 * first
+        end = start + 4 * count
+        leds[start:end:4] = bytes([self.led_start(bright_percent)]) * count
+        leds[start + self.rgb[0]:end:4] = data[0:3 * count:3]
+        leds[start + self.rgb[1]:end:4] = data[1:3 * count:3]
+        leds[start + self.rgb[2]:end:4] = data[2:3 * count:3]
+
+    def mark_dirty(self, first=0, last=None):
+        """Flags the pixels first to last - 1 as changed for the next show().
+
+        The setters do this on their own, call it after writing to
+        self.leds directly.
+        """
+        if last is None:
+            last = self.num_led
+        self._dirty_lo = min(self._dirty_lo, 4 * first)
+        self._dirty_hi = max(self._dirty_hi, 4 * last)
+
+    def led_start(self, bright_percent=100):
+        """Returns the first byte of an LED frame for the given brightness."""
+        # Calculate pixel brightness as a percentage of the
+        # defined global_brightness. Round up to nearest integer
+        # as we expect some brightness unless set to 0
+        brightness = int(ceil(bright_percent * self.global_brightness / 100.0))
+
+        # LED start frame is three "1" bits, followed by 5 brightness bits
+        return (brightness & 0b00011111) | LED_START
+
+    def encode_pixel(self, rgb, bright_percent=100):
+        """Returns the 4 byte LED frame for one pixel in strip order."""
+        pixel = bytearray(4)
+        pixel[0] = self.led_start(bright_percent)
+        pixel[self.rgb[0]] = rgb[0]
+        pixel[self.rgb[1]] = rgb[1]
+        pixel[self.rgb[2]] = rgb[2]
+        return pixel
+
     def get_pixel(self, led_num):
         """Gets the color and brightness of one pixel in the LED stripe.
 
@@ -220,6 +476,16 @@ class APA102:
 
         return output
 
+    def get_pixels(self):
+        """The colors in the pixel buffer as packed RGB, like set_pixels() takes them.
+
+        One strided copy per channel, the brightness of the pixels is left out.
+        """
+        rgb_data = bytearray(3 * self.num_led)
+        for channel in range(3):
+            rgb_data[channel::3] = self.leds[self.rgb[channel]::4]
+        return rgb_data
+
     def rotate(self, positions=1):
         """Rotate the LEDs by the specified number of positions.
 
@@ -228,22 +494,104 @@ class APA102:
         which means rotating in the opposite direction.
         """
         cutoff = 4 * (positions % self.num_led)
-        self.leds = self.leds[cutoff:] + self.leds[:cutoff]
+        self.leds[:] = self.leds[cutoff:] + self.leds[:cutoff]
+        self.mark_dirty()
 
-    def show(self):
+    def update_frame(self, force=False):
+        """Copies the changed pixels into the SPI frame.
+
+        Returns False if the frame is the same as the one sent last and the
+        refresh interval has not passed yet, i.e. there is nothing to send.
+        """
+        started = time.perf_counter()
+        now = time.monotonic()
+        lo, hi = self._dirty_lo, self._dirty_hi
+        self._dirty_lo, self._dirty_hi = len(self.leds), 0
+        start = self._led_offset
+        # Pixels can be written with the value they already had, so compare
+        # the dirty range with what went out last time (a memcmp).
+        changed = lo < hi and self.leds[lo:hi] != self._frame[start + lo:start + hi]
+        if not (changed or force or now - self._last_transfer >= self.refresh_interval):
+            self.frames_skipped += 1
+            metrics.frames_skipped.inc()
+            return False
+        if changed:
+            self._frame[start + lo:start + hi] = self.leds[lo:hi]
+        self._last_transfer = now
+        metrics.encode_seconds.observe(time.perf_counter() - started)
+        return True
+
+    def show(self, force=False):
         """Sends the content of the pixel buffer to the strip.
 
-        Todo: More than 1024 LEDs requires more than one xfer operation.
+        Start frame, LED frames and end frame go out as one transfer. Frames
+        longer than SPI_MAX_TRANSFER (more than ~1000 LEDs) are split into
+        several transfers by send_to_spi.
+        Nothing is sent if no pixel changed since the last call, unless
+        force is set or refresh_interval seconds have passed.
         """
-        self.clock_start_frame()
-        # xfer2 kills the list, unfortunately. So it must be copied first
-        # SPI takes up to 4096 Integers. So we are fine for up to 1024 LEDs.
-        self.send_to_spi(self.leds)
-        self.clock_end_frame()
+        if not self.update_frame(force):
+            return
+        self.send_frame()
+
+    def send_frame(self, barrier=None):
+        """Sends the frame prepared by update_frame().
+
+        Returns right away if the writer thread runs, barrier is passed on
+        to it (it is ignored without writer thread).
+        """
+        if self._writer is not None:
+            self.start_writer()  # In case the writer thread died
+            self._writer.submit(self._frame, barrier=barrier)
+        else:
+            self.send_to_spi(self._frame)
+
+    async def show_async(self, force=False):
+        """Sends the content of the pixel buffer to the strip from a coroutine.
+
+        The transfer runs on the writer thread (started if necessary), the
+        event loop is free while waiting for it to finish.
+        Unchanged frames are skipped the same way as in show().
+        """
+        if not self.update_frame(force):
+            return
+        await self.send_frame_async()
+
+    async def send_frame_async(self, barrier=None):
+        """Sends the frame prepared by update_frame() on the writer thread and waits for it."""
+        if self._writer is None or not self._writer.is_alive():
+            self.start_writer()
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+
+        def done(error):
+            try:
+                loop.call_soon_threadsafe(_resolve_future, future, error)
+            except RuntimeError:
+                pass  # Loop closed while the frame was in flight
+
+        self._writer.submit(self._frame, done, barrier)
+        await future
+
+    def start_writer(self):
+        """Hand the SPI device over to a background writer thread.
+
+        From now on show() only queues the frame and returns immediately.
+        """
+        if self._writer is None or not self._writer.is_alive():
+            self._writer = SpiWriter(self.send_to_spi, len(self._frame))
+            self._writer.start()
+
+    def stop_writer(self):
+        """Send any queued frame and stop the writer thread."""
+        if self._writer is not None:
+            self._writer.stop()
+            self._writer = None
 
     def cleanup(self):
         """Release the SPI device; Call this method at the end"""
         self.clear_strip()
+        self.stop_writer()
         # print("deinit!")
         self.spi.close()  # Close SPI port
 
@@ -253,27 +601,36 @@ class APA102:
 
         return (red << 16) + (green << 8) + blue
 
+    @staticmethod
+    def split_color(rgb_color):
+        """Split a 3*8 byte color value into a (red, green, blue) tuple."""
+
+        return (rgb_color & 0xFF0000) >> 16, (rgb_color & 0x00FF00) >> 8, rgb_color & 0x0000FF
+
     def wheel(self, wheel_pos):
         """Get a color from a color wheel; Green -> Red -> Blue -> Green"""
 
-        if wheel_pos > 255:
-            wheel_pos = 255  # Safeguard
-        if wheel_pos < 85:  # Green -> Red
-            return self.combine_color(wheel_pos * 3, 255 - wheel_pos * 3, 0)
-        if wheel_pos < 170:  # Red -> Blue
-            wheel_pos -= 85
-            return self.combine_color(255 - wheel_pos * 3, 0, wheel_pos * 3)
-        # Blue -> Green
-        wheel_pos -= 170
-        return self.combine_color(0, wheel_pos * 3, 255 - wheel_pos * 3)
+        wheel_pos = min(max(int(wheel_pos), 0), 255)  # Safeguard, the table has 256 entries
+        return self.combine_color(*WHEEL_LUT[3 * wheel_pos:3 * wheel_pos + 3])
 
     def send_to_spi(self, data):
         """Internal method to output data to the chosen SPI device"""
-        # @TODO: actual writing
-        # self.spi.write(data)
-        # print(data)
-        self.spi.writebytes2(data)
+        speed_hz = self._spi_speed_pending
+        if speed_hz is not None:
+            self._spi_speed_pending = None
+            self.spi.max_speed_hz = speed_hz
+        started = time.perf_counter()
+        if len(data) <= SPI_MAX_TRANSFER:
+            self.spi.writebytes2(data)
+        else:
+            # The kernel driver rejects transfers above its buffer size, so
+            # hand it the frame in slices without copying it.
+            view = memoryview(data)
+            for offset in range(0, len(view), SPI_MAX_TRANSFER):
+                self.spi.writebytes2(view[offset:offset + SPI_MAX_TRANSFER])
+        metrics.spi_transfer_seconds.observe(time.perf_counter() - started)
+        metrics.spi_bytes.inc(len(data))
 
     def dump_array(self):
         """For debug purposes: Dump the LED array onto the console."""
-        print(self.leds)
\ No newline at end of file
+        print(list(self.leds))
\ No newline at end of file
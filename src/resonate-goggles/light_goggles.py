@@ -1,7 +1,17 @@
 import asyncio
 import time
+import metrics
 #from goggle_light_show_templates import show_R
-from constants import r
+from constants import r, TARGET_FPS, GAMMA, FADE_SECONDS, UDP_BATCH, UDP_DRAIN_LIMIT, REST_TIMEOUT, BLANK_TIMEOUT
+from color_lut import build_color_lut
+from frame_cache import EncodedFrameCache
+from transitions import Transition
+from effect_scheduler import EffectScheduler
+from renderer import FrameRenderer
+from stream_recorder import StreamRecorder
+from rest_mode import RestMode, STREAMING, IDLE_R
+from hardware_config import live_settings
+from frame_protocol import FRAME_HEADER, is_frame_packet, parse_frame, find_legacy_color
 from asyncio import StreamReader
 
 class LightGoggles:
@@ -15,113 +25,309 @@ class LightGoggles:
     strip : APA102
         An object representing an LED Strip
     sock : socket
-        An object representing a unix socket
+        The UDP socket video frames come in on (see local_ingest.py for the unix socket)
+    renderer : FrameRenderer
+        Paces streamed frames to the strip, the latest received frame wins
+    effects : EffectScheduler
+        Runs light show effects, stopped as soon as video arrives
+    rest : RestMode
+        State machine that shows the R and then turns the strip off when nothing streams, see rest_mode.py
+    state_listeners : list
+        Callables notified when dimmer, brightness, rest mode or effect change
     rest_mode : boolean
         Represents if the goggles are currently in restmode, if false, something is playing!
     last_received_socket_communication : int
         the linux time that last communication was received over the socket
-    last_last_received_socket_communication : int
-        the linux time that the time before last communication was received over the socket
-        combined with previous attributes, the goggles object has knowledge if information is
-        flowing over the socket
+    last_sequence : int
+        Sequence number of the last binary frame packet, None until one arrives
+
+    color_divider : int
+        The dimmer level, every color channel is divided by it
+    gamma : float
+        Gamma correction applied after the dimmer, 1.0 is off
+    color_lut : bytes
+        256 entry table combining dimmer and gamma, rebuilt when either changes
+    frame_cache : EncodedFrameCache
+        Ready to send frames of static images, see show_image()
 
     Methods
     -------
+    apply_hardware_config(options)
+        Applies SPI speed, brightness, dimmer and gamma from the hardware config to the running goggles
+    set_brightness(brightness)
+        Sets the global brightness of the strip
+    add_state_listener(listener)
+        Registers a callable that gets a dict of the state that changed (dimmer, brightness, rest mode, effect)
     show_R()
         Displays the Resonate "R" on the light goggles, used for Rest Mode
+    show_image(name, image)
+        Displays a static image (packed RGB bytes), encoded frames are cached
+    start_fade(image, duration, easing)
+        Crossfades from what the strip shows to an image in the background
+    cancel_fade()
+        Stops a running fade, new packets do this on their own
     show_solid_color(colors)
         accepts a byte string of colors.  Colors are represented by 3 2 digit hexidecimal
         values, i.e. 24 bit color.
+    handle_datagram(buffer, nbytes)
+        Parses one datagram (binary frame or legacy packet, see frame_protocol.py)
+        received over the socket and queues it for rendering
+    stream_activity()
+        Leaves rest mode and stops fades and effects when frames come in
+    handle_frame(buffer, nbytes)
+        Queues a binary frame packet for the renderer
+    effect_changed(name)
+        Stops a running fade when an effect starts and tells the state listeners
+    effect_finished()
+        Hands the strip back to rest mode when an effect ends
+    start_recording(path)
+        Records the incoming video stream to path, see stream_recorder.py
+    stop_recording()
+        Stops recording the video stream and waits for the recording to be written out
+    detach_recorder()
+        Stops recording right away and returns the recorder, close it off the event loop
+    drain_datagrams(buffers, sizes, first)
+        Reads the datagrams already queued on the socket into a ring of buffers
     async receive_vid_stream()
         Streams video to light goggles over socket
-    async manage_rest_mode()
-        Handles turning restmode on when nothing is coming over the socket
 
     """
-    def __init__(self, strip, sock, rest_mode=False, color_divider=1):
+    def __init__(self, strip, sock, rest_mode=False, color_divider=1, fps=TARGET_FPS, gamma=GAMMA,
+                 rest_timeout=REST_TIMEOUT, blank_timeout=BLANK_TIMEOUT):
         self.strip = strip # Initialized in main.py
+        self.state_listeners = [] # Called with a dict of what changed, see notify_state
         self.sock = sock # Initialized in main.py
-        self.rest_mode = rest_mode # Goggles start in rest mode
+        self.renderer = FrameRenderer(strip, fps=fps)
+        self.effects = EffectScheduler(strip, fps=fps)
+        self.effects.on_idle = self.effect_finished
+        self.effects.on_change = self.effect_changed
+        self.rest = RestMode(self, rest_timeout, blank_timeout,
+                             state=IDLE_R if rest_mode else STREAMING) # Started by main.py once the loop runs
         self.last_received_socket_communication = time.time() 
-        self.last_last_received_socket_communication = self.last_received_socket_communication-1
-        self.color_divider = color_divider
+        self._color_divider = color_divider
+        self._gamma = gamma
+        self.color_lut = None
+        self.frame_cache = EncodedFrameCache()
+        self.update_color_lut()
+        self.last_sequence = None
+        self.fade_task = None
+        self.recorder = None # StreamRecorder while the video stream is being recorded
+
+    @property
+    def rest_mode(self):
+        return self.rest.state != STREAMING
+
+    @property
+    def color_divider(self):
+        return self._color_divider
+
+    @color_divider.setter
+    def color_divider(self, color_divider):
+        if color_divider < 1:
+            raise ValueError("dimmer must be 1 or more")
+        self._color_divider = color_divider
+        self.update_color_lut()
+        self.notify_state({'Dimmer': color_divider})
+
+    @property
+    def gamma(self):
+        return self._gamma
+
+    @gamma.setter
+    def gamma(self, gamma):
+        if gamma <= 0:
+            raise ValueError("gamma must be more than 0")
+        self._gamma = gamma
+        self.update_color_lut()
+
+    def update_color_lut(self):
+        # Only runs when the dimmer or gamma changes, frames just translate through the table
+        self.color_lut = build_color_lut(self._color_divider, self._gamma)
+        self.renderer.lut = self.color_lut
+        self.frame_cache.invalidate()
+        self.rest.redraw()
+
+    def apply_hardware_config(self, options):
+        # Called with the options of the hardware config file whenever they change.
+        # Everything is applied before the next frame, the goggles keep running.
+        # Invalid values raise ValueError before anything changed.
+        settings = live_settings(options)
+        if 'SPI_SPEED' in settings:
+            self.strip.set_spi_speed(settings['SPI_SPEED'])
+        if settings.get('LED_BRIGHTNESS', self.strip.global_brightness) != self.strip.global_brightness:
+            self.set_brightness(settings['LED_BRIGHTNESS'])
+        if settings.get('DIMMER_LEVEL', self._color_divider) != self._color_divider:
+            self.color_divider = settings['DIMMER_LEVEL']
+        if settings.get('GAMMA', self._gamma) != self._gamma:
+            self.gamma = settings['GAMMA']
+        if 'REST_TIMEOUT' in settings:
+            self.rest.rest_timeout = settings['REST_TIMEOUT'] # Used from the next timer on
+        if 'BLANK_TIMEOUT' in settings:
+            self.rest.blank_timeout = settings['BLANK_TIMEOUT']
+
+    def set_brightness(self, brightness):
+        # Global brightness of the strip, 0 - 31
+        self.strip.set_global_brightness(brightness)
+        self.frame_cache.invalidate()
+        self.rest.redraw()
+        self.notify_state({'Brightness': brightness})
+
+    def add_state_listener(self, listener):
+        self.state_listeners.append(listener)
+
+    def notify_state(self, changes):
+        # Keys are Dimmer, Brightness, RestMode, RestState and Effect, see dbus_service.py
+        for listener in self.state_listeners:
+            listener(changes)
 
     def show_R(self):
-        for i in range(len(r)):  # fill the strip with the same color
-                    # R image is stored in constants.py file
-                    self.strip.set_pixel(i, r[i][0]//self.color_divider, 
-                                            r[i][1]//self.color_divider, 
-                                            r[i][2]//self.color_divider, 
-                                        1)  # 1% brightness, but does not seem to make any difference
-        self.strip.show() 
+        # R image is stored in constants.py file
+        self.show_image('r', r)
+
+    def show_image(self, name, image):
+        key = (name, self._color_divider, self._gamma, self.strip.global_brightness, tuple(self.strip.rgb))
+        frame = self.frame_cache.get(key)
+        if frame is None:
+            frame = self.strip.encode_frame(image.translate(self.color_lut), 
+                                            1)  # 1% brightness, but does not seem to make any difference
+            self.frame_cache.put(key, frame)
+        self.strip.load_frame(frame) # One copy into the pixel buffer
+        self.strip.show()
     
     def show_solid_color(self, colors):
-        for i in range(self.strip.num_led):  # fill the strip with the same color
-            self.strip.set_pixel(i, 
-                colors[0]//self.color_divider, 
-                colors[1]//self.color_divider, 
-                colors[2]//self.color_divider,
-                1)  # 1% brightness, but does not seem to make any difference
+        self.strip.fill(bytes(colors[:3]).translate(self.color_lut),  # fill the strip with the same color
+                        1)  # 1% brightness, but does not seem to make any difference
         self.strip.show()
 
-    def fade(self):
-        current_pixel = self.strip.get_pixel(0)
-        print(current_pixel)
-        
-        for j in range(100):
-            for i in range(self.strip.num_led):
-                self.strip.set_pixel(i, 
-                    current_pixel["red"]//(j+1), 
-                    current_pixel["blue"]//(j+1), 
-                    current_pixel["green"]//(j+1),
-                    1)  # 1% brightness, but does not seem to make any difference
-            self.strip.show()
-            time.sleep(.01)
-        
+    def start_fade(self, image=b'', duration=FADE_SECONDS, easing='ease_in_out'):
+        # Fades from whatever the strip shows (the last streamed frame, or the
+        # last frame of an effect) to image (default black). The fade paints
+        # the strip itself, its frames are not counted as streamed frames.
+        self.cancel_fade()
+        transition = Transition(self.strip, self.strip.get_pixels(), image.translate(self.color_lut),
+                                duration=duration, easing=easing, fps=self.renderer.fps,
+                                bright_percent=self.renderer.bright_percent)
+        self.fade_task = asyncio.get_running_loop().create_task(transition.run())
+        return self.fade_task
 
-    async def receive_vid_stream(self):
-        while True:
-            # Try, because this is non-blocking socket, if no communcation
-            # comes over the socket, a BlockingIOError is thrown
+    def cancel_fade(self):
+        if self.fade_task is not None:
+            self.fade_task.cancel()
+            self.fade_task = None
+
+    def fading(self):
+        return self.fade_task is not None and not self.fade_task.done()
+
+    def stream_activity(self):
+        # Something is streaming to the goggles, over UDP or a websocket
+        self.rest.packet_received()
+        if self.fade_task is not None:
+            self.cancel_fade() # Video wins over a fade into rest mode
+        self.effects.preempt() # ... and over effects
+        # Capture last received data - used for rest mode.
+        self.last_received_socket_communication = time.time()
+
+    def handle_frame(self, buffer, nbytes):
+        # Binary frame, the pixels are copied straight into the pending
+        # frame, the renderer applies the color table. Returns the sequence
+        # number, or None if the frame is invalid. Invalid frames are not
+        # activity, they neither end rest mode nor stop effects.
+        parsed = parse_frame(buffer, nbytes, self.renderer.pending)
+        if parsed is None:
+            return None
+        self.stream_activity()
+        self.last_sequence = parsed[0]
+        self.renderer.commit()
+        return parsed[0]
+
+    def handle_datagram(self, buffer, nbytes):
+        # Returns whether the datagram held a frame
+        metrics.udp_packets_received.inc()
+        if is_frame_packet(buffer, nbytes):
+            if self.handle_frame(buffer, nbytes) is None:
+                metrics.udp_packets_rejected.inc()
+                return False
+            metrics.udp_packets_parsed.inc()
+            return True
+
+        # Legacy packet, the 4th line holds one color for the whole strip
+        start = find_legacy_color(buffer, nbytes)
+        if start < 0:
+            metrics.udp_packets_rejected.inc()
+            return False
+        metrics.udp_packets_parsed.inc()
+        self.stream_activity() # If we make it this far, socket comms are happening
+        self.renderer.submit_solid(buffer[start:start + 3])
+        return True
+
+    def effect_changed(self, name):
+        if name is not None and self.fading():
+            # The effect paints the strip itself, the fade must not draw over it
+            self.cancel_fade()
+        self.notify_state({'Effect': name or ''})
+
+    def effect_finished(self):
+        # An effect ended or was stopped, rest mode draws the strip again
+        self.rest.effect_finished()
+
+    def start_recording(self, path):
+        self.stop_recording()
+        self.recorder = StreamRecorder(path)
+
+    def stop_recording(self):
+        recorder = self.detach_recorder()
+        if recorder is not None:
+            recorder.close() # Waits for the writer thread to write out the rest
+
+    def detach_recorder(self):
+        # Ingest stops handing datagrams to the recorder before it is closed,
+        # nothing gets queued behind the end of the recording
+        recorder, self.recorder = self.recorder, None
+        return recorder
+
+    def drain_datagrams(self, buffers, sizes, first):
+        # Reads whatever else is already queued on the socket into the ring
+        # of buffers, buffers[0] holds the datagram that woke us up. When
+        # more is queued than the ring holds, the oldest entries get
+        # overwritten. Returns how many datagrams were read.
+        count = 1
+        sizes[0] = first
+        while count < UDP_DRAIN_LIMIT:
+            slot = count % len(buffers)
             try:
-                data, addr = self.sock.recvfrom(512)
-                self.rest_mode = False # If we make it this far, socket comms are happening
-                # Capture last received data - used for rest mode.
-                self.last_received_socket_communication = time.time()
-                # parse the bytes, splitting by newline-bytes
-                lines = data.split(b'\n')
-                # get the 4th line, or skip.
-                if len(lines) < 4:
-                    continue
-
-                colors = lines[3]
-                if len(colors) < 3: # Skip color values that don't make sense!
-                    continue
-                self.show_solid_color(colors)
-
-            except BlockingIOError:
-                #print("nothing to stream")
-                # Could start rest mode here... 
-                continue
-
-            finally:
-                await asyncio.sleep(0) #give control back to the loop regardless of socket comms.
-
-    async def manage_rest_mode(self):
-        #fiveminutesbefore=$((timestamp - 5 * 60 * 1000))
-        rest_mode_stop_time = None
-        while True:
-            print(self.last_received_socket_communication) # Debug
-            if(self.last_received_socket_communication == self.last_last_received_socket_communication): #socket has stopped streaming
-                if(self.rest_mode == False): # Rest Mode Startup Section
-                    #self.fade() # Fade current lights before switching
-                    rest_mode_stop_time = (self.last_received_socket_communication + 5 * 60) # five minutes from now
-                self.rest_mode = True 
-                if(rest_mode_stop_time):
-                    if(time.time() < rest_mode_stop_time):
-                        self.show_R()
-                    if(time.time() >= rest_mode_stop_time):
-                        self.strip.clear_strip()
-            self.last_last_received_socket_communication = self.last_received_socket_communication
-            await asyncio.sleep(1) # Toggle how long rest_mode takes to start up.
+                sizes[slot] = self.sock.recv_into(buffers[slot])
+            except (BlockingIOError, InterruptedError):
+                break
+            count += 1
+        return count
 
+    async def receive_vid_stream(self):
+        loop = asyncio.get_running_loop()
+        # Reused for every datagram, each big enough for a full frame of the strip
+        size = max(512, FRAME_HEADER.size + 3 * self.strip.num_led)
+        buffers = [bytearray(size) for _ in range(UDP_BATCH)]
+        sizes = [0] * UDP_BATCH
+        while True:
+            # The socket is non-blocking, the loop suspends this task until a
+            # datagram arrives, so no CPU is burned while nothing is streaming.
+            nbytes = await loop.sock_recv_into(self.sock, buffers[0])
+            count = self.drain_datagrams(buffers, sizes, nbytes)
+            recorder = self.recorder
+            if recorder is not None:
+                # Everything that came in, in order, including what is skipped below
+                if count > UDP_BATCH:
+                    recorder.dropped += count - UDP_BATCH # Overwritten in the ring before we got here
+                for age in range(min(count, UDP_BATCH) - 1, -1, -1):
+                    slot = (count - 1 - age) % UDP_BATCH
+                    recorder.record(buffers[slot], sizes[slot])
+            # Newest first, older frames would only be replaced before they are shown
+            for age in range(min(count, UDP_BATCH)):
+                slot = (count - 1 - age) % UDP_BATCH
+                if self.handle_datagram(buffers[slot], sizes[slot]):
+                    break
+            skipped = count - age - 1
+            if skipped:
+                metrics.udp_packets_received.inc(skipped)
+                metrics.udp_packets_superseded.inc(skipped)
+            if count == UDP_DRAIN_LIMIT:
+                await asyncio.sleep(0) # Flooded, let the renderer have a turn
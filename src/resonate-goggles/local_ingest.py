@@ -0,0 +1,311 @@
+"""
+Frame input for producers on the same machine, e.g. the video decoder.
+
+Two ways in, both end up in the pending frame of the renderer like UDP
+frames do. The socket lives in a directory of its own and only the user
+the goggles run as may connect (LOCAL_SOCKET_MODE).
+
+ - An AF_UNIX SOCK_SEQPACKET socket (LOCAL_SOCKET in the hardware config,
+   LOCAL_SOCKET_PATH by default). Every message is one frame packet as
+   described in frame_protocol.py, message boundaries are kept and there
+   is no IP stack in the way.
+ - A shared memory ring. A producer connected to the socket sends
+   RING_REQUEST and gets back the name of the ring and a doorbell file
+   descriptor (an eventfd, or the write end of a pipe where there is no
+   eventfd). It then writes pixels straight into the ring and rings the
+   doorbell, the goggles copy the newest frame into the renderer once.
+   Every connection gets a ring of its own, a ring has one producer.
+
+Producers use LocalFrameClient:
+
+    client = LocalFrameClient()
+    client.send_frame(pack_frame(sequence, rgb))       # over the socket
+    ring = client.open_ring()
+    ring.frame_buffer()[:] = rgb                        # or decode into it
+    ring.publish(sequence)
+"""
+import asyncio
+import os
+import socket
+import struct
+import sys
+from multiprocessing import resource_tracker, shared_memory
+import metrics
+from constants import LOCAL_SOCKET_PATH, LOCAL_SOCKET_MODE
+from frame_protocol import FRAME_HEADER
+
+RING_REQUEST = b'LGRING'
+RING_MAGIC = b'LCFR'
+RING_VERSION = 1
+RING_SLOTS = 4
+RING_HEADER = struct.Struct('<4sBxHIQ')  # magic, version, LED count, slots, frames published
+SLOT_HEADER = struct.Struct('<I')  # Frame sequence number
+HEAD_OFFSET = 12  # Frames published, inside RING_HEADER
+
+
+def attach_shared_memory(name):
+    """Opens an existing block, without this process' resource tracker unlinking it on exit."""
+    if sys.version_info >= (3, 13):
+        return shared_memory.SharedMemory(name=name, track=False)
+    shm = shared_memory.SharedMemory(name=name)
+    if os.name == 'posix':
+        # Registered under the name with a leading slash, shm.name has it cut off
+        resource_tracker.unregister('/' + shm.name, 'shared_memory')
+    return shm
+
+
+class FrameRing:
+    """
+    Ring of frames in shared memory, one producer and the goggles as consumer.
+
+    The producer fills the next slot and then bumps the published counter,
+    the consumer only ever takes the newest frame. Created by the goggles
+    (name=None), attached to by name from the producer.
+    """
+    def __init__(self, num_led=None, name=None, slots=RING_SLOTS):
+        if name is None:
+            self.num_led, self.slots = num_led, slots
+            size = RING_HEADER.size + slots * (SLOT_HEADER.size + 3 * num_led)
+            self.shm = shared_memory.SharedMemory(create=True, size=size)
+            RING_HEADER.pack_into(self.shm.buf, 0, RING_MAGIC, RING_VERSION, num_led, slots, 0)
+        else:
+            self.shm = attach_shared_memory(name) # Owned by the goggles
+            magic, version, self.num_led, self.slots, _ = RING_HEADER.unpack_from(self.shm.buf, 0)
+            if magic != RING_MAGIC or version != RING_VERSION:
+                self.shm.close()
+                raise ValueError(f"{name} is not a frame ring")
+        self.name = self.shm.name
+        self.slot_size = SLOT_HEADER.size + 3 * self.num_led
+
+    def published(self):
+        return struct.unpack_from('<Q', self.shm.buf, HEAD_OFFSET)[0]
+
+    def _slot(self, index):
+        return RING_HEADER.size + (index % self.slots) * self.slot_size
+
+    def frame_buffer(self):
+        """Writable view of the pixels of the next frame, packed RGB.
+
+        The slot still holds the frame published RING_SLOTS frames ago,
+        write all of it.
+        """
+        start = self._slot(self.published()) + SLOT_HEADER.size
+        return self.shm.buf[start:start + 3 * self.num_led]
+
+    def previous_frame(self):
+        """Read only view of the pixels of the frame published last."""
+        start = self._slot(self.published() - 1) + SLOT_HEADER.size
+        return self.shm.buf[start:start + 3 * self.num_led].toreadonly()
+
+    def publish(self, sequence):
+        """Hands the frame in frame_buffer() to the consumer."""
+        head = self.published()
+        SLOT_HEADER.pack_into(self.shm.buf, self._slot(head), sequence & 0xFFFFFFFF)
+        struct.pack_into('<Q', self.shm.buf, HEAD_OFFSET, head + 1)
+
+    def take(self, taken, target):
+        """Copies the newest frame published after the first taken ones into target.
+
+        Returns (frames published, sequence number), or None if there is no new frame.
+        """
+        while True:
+            head = self.published()
+            if head == taken:
+                return None
+            start = self._slot(head - 1)
+            sequence = SLOT_HEADER.unpack_from(self.shm.buf, start)[0]
+            count = min(len(target), 3 * self.num_led)
+            target[:count] = self.shm.buf[start + SLOT_HEADER.size:start + SLOT_HEADER.size + count]
+            if self.published() - head < self.slots - 1:
+                return head, sequence
+            # The producer went all the way around the ring while we copied, take the newest again
+
+    def close(self):
+        self.shm.close()
+
+    def unlink(self):
+        self.shm.unlink()
+
+
+def open_doorbell():
+    """(read fd, write fd) of a non-blocking doorbell, an eventfd where the OS has one."""
+    if hasattr(os, 'eventfd'):
+        fd = os.eventfd(0, os.EFD_NONBLOCK | os.EFD_CLOEXEC)
+        return fd, fd
+    read_fd, write_fd = os.pipe()
+    os.set_blocking(read_fd, False)
+    os.set_blocking(write_fd, False)
+    return read_fd, write_fd
+
+
+def ring_doorbell(fd):
+    try:
+        os.write(fd, (1).to_bytes(8, 'little')) # The 8 byte counter increment of an eventfd
+    except BlockingIOError:
+        pass # Pipe is full, the goggles are woken up anyway
+
+
+class _RingInput:
+    # The FrameRing and doorbell of one producer connection
+    def __init__(self, goggles, loop):
+        self.goggles = goggles
+        self.loop = loop
+        self.ring = FrameRing(goggles.strip.num_led)
+        self.doorbell = open_doorbell()
+        self.taken = 0
+        loop.add_reader(self.doorbell[0], self.rang)
+
+    def rang(self):
+        try:
+            while os.read(self.doorbell[0], 4096):
+                pass
+        except BlockingIOError:
+            pass
+        renderer = self.goggles.renderer
+        frame = self.ring.take(self.taken, renderer.pending)
+        if frame is None:
+            return
+        self.taken, sequence = frame
+        metrics.local_frames_received.inc()
+        self.goggles.stream_activity()
+        self.goggles.last_sequence = sequence
+        renderer.commit()
+
+    def close(self):
+        self.loop.remove_reader(self.doorbell[0])
+        for fd in set(self.doorbell):
+            os.close(fd)
+        self.ring.close()
+        self.ring.unlink()
+
+
+class LocalIngest:
+    """
+    Listens on the local socket and the shared memory rings, see the module docstring.
+
+    Attributes
+    ----------
+    goggles : LightGoggles
+        The goggles frames are shown on
+    path : str
+        Path of the SOCK_SEQPACKET socket
+    mode : int
+        Permissions of the socket, connecting needs write permission
+    rings : set of _RingInput
+        One for each connected producer that asked for a ring
+    """
+    def __init__(self, goggles, path=LOCAL_SOCKET_PATH, mode=LOCAL_SOCKET_MODE):
+        self.goggles = goggles
+        self.path = path
+        self.mode = mode
+        self.rings = set()
+        self._loop = None
+        self._sock = None
+        self._tasks = set()
+
+    def start(self):
+        self._loop = asyncio.get_running_loop()
+        os.makedirs(os.path.dirname(self.path) or '.', mode=0o755, exist_ok=True)
+        if os.path.exists(self.path):
+            os.unlink(self.path) # Left behind by an earlier run
+        self._sock = socket.socket(socket.AF_UNIX, socket.SOCK_SEQPACKET)
+        self._sock.bind(self.path)
+        os.chmod(self.path, self.mode) # Before listen(), nobody can connect yet
+        self._sock.listen()
+        self._sock.setblocking(False)
+        self._spawn(self._accept())
+
+    def stop(self):
+        for task in list(self._tasks):
+            task.cancel()
+        if self._sock is not None:
+            self._sock.close()
+            self._sock = None
+            if os.path.exists(self.path):
+                os.unlink(self.path)
+        for ring in list(self.rings):
+            ring.close()
+        self.rings.clear()
+
+    def _spawn(self, coroutine):
+        task = self._loop.create_task(coroutine)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _accept(self):
+        while True:
+            conn, _ = await self._loop.sock_accept(self._sock)
+            self._spawn(self._serve(conn))
+
+    async def _serve(self, conn):
+        # Room for a full palette frame, the biggest packet there is
+        buffer = bytearray(FRAME_HEADER.size + 1 + 3 * 256 + 3 * self.goggles.strip.num_led)
+        ring = None
+        try:
+            with conn:
+                while True:
+                    nbytes = await self._loop.sock_recv_into(conn, buffer)
+                    if nbytes == 0:
+                        return # Producer went away
+                    if nbytes == len(RING_REQUEST) and buffer.startswith(RING_REQUEST):
+                        if ring is None:
+                            ring = _RingInput(self.goggles, self._loop)
+                            self.rings.add(ring)
+                        socket.send_fds(conn, [ring.ring.name.encode()], [ring.doorbell[1]])
+                        continue
+                    metrics.local_frames_received.inc()
+                    if self.goggles.handle_frame(buffer, nbytes) is None:
+                        metrics.local_frames_rejected.inc()
+        finally:
+            if ring in self.rings: # Not closed by stop() already
+                self.rings.discard(ring)
+                ring.close()
+
+
+class LocalFrameClient:
+    """Producer side of the local socket, see the module docstring."""
+    def __init__(self, path=LOCAL_SOCKET_PATH):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_SEQPACKET)
+        self.sock.connect(path)
+
+    def send_frame(self, packet):
+        self.sock.send(packet)
+
+    def open_ring(self):
+        """Asks the goggles for the shared memory ring, returns a LocalRingWriter."""
+        self.sock.send(RING_REQUEST)
+        name, fds, _, _ = socket.recv_fds(self.sock, 256, 1)
+        return LocalRingWriter(FrameRing(name=name.decode()), fds[0])
+
+    def close(self):
+        self.sock.close()
+
+
+class LocalRingWriter:
+    """Writes frames into the goggles' FrameRing and rings the doorbell."""
+    def __init__(self, ring, doorbell):
+        self.ring = ring
+        self.doorbell = doorbell
+
+    def frame_buffer(self):
+        return self.ring.frame_buffer()
+
+    def publish(self, sequence):
+        self.ring.publish(sequence)
+        ring_doorbell(self.doorbell)
+
+    def push(self, rgb_data, sequence):
+        # Pixels past rgb_data keep their color from the previous frame
+        buffer = self.ring.frame_buffer()
+        count = min(len(rgb_data), len(buffer))
+        buffer[:count] = rgb_data[:count]
+        if count < len(buffer) and self.ring.published():
+            previous = self.ring.previous_frame()
+            buffer[count:] = previous[count:]
+            previous.release()
+        buffer.release()
+        self.publish(sequence)
+
+    def close(self):
+        os.close(self.doorbell)
+        self.ring.close()
@@ -3,52 +3,62 @@ import asyncio
 from typing import Union
 from datetime import datetime
 
+import os
 import sys
-import led_driver
-import light_goggles
-import socket
-from constants import NUM_LED, UDP_IP, UDP_PORT, r, SPI_BUS, SPI_DEVICE, SPI_SPEED_HZ, BRIGHTNESS
-from fastapi import FastAPI
+import metrics
+from fastapi import FastAPI, HTTPException, WebSocket
+from fastapi.responses import PlainTextResponse
 from tags import tags_metadata
 from models import HardwareConfig
-
-hardware_config_options = {}
-
-def read_hardware_config_file():
-    with open('/etc/default/lc8823-demo', 'r') as f:
-        hardware_config_options = {k[0] : k[1] for k in [x.strip('\n').split('=') for x in f.readlines()]}
-    return hardware_config_options
-
-def write_hardware_config_file(config_string):
-    with open('/etc/default/lc8823-demo', 'w') as f:
-        f.write(config_string)
-
-def serialize_config_options(hardware_config_parameters):
-    print(hardware_config_parameters.spi_speed)
-    return f"SPI_SPEED={hardware_config_parameters.spi_speed}\nLED_BRIGHTNESS={hardware_config_parameters.led_brightness}\nDIMMER_LEVEL={hardware_config_parameters.dimmer_level}\n"
-
-def setup_goggles():
-    defaults = read_hardware_config_file()
+from effect_scheduler import EFFECTS
+from hardware_config import HardwareConfigStore
+from stream_session import StreamSession
+from stream_recorder import recording_path
+from baked_animation import animation_path
+from goggles_setup import goggle_tasks, setup_goggles, start_goggles, teardown_goggles, strip_led_count, dbus_bus_type, local_socket_path, recordings_dir, animations_dir
+from render_process import RenderProcessProxy, RENDER_PROCESS_ENV
+
+hardware_config = HardwareConfigStore() # Cached copy of /etc/default/lc8823-demo
+
+def config_options(hardware_config_parameters):
+    return {"SPI_SPEED": hardware_config_parameters.spi_speed,
+            "LED_BRIGHTNESS": hardware_config_parameters.led_brightness,
+            "DIMMER_LEVEL": hardware_config_parameters.dimmer_level,
+            "GAMMA": hardware_config_parameters.gamma}
+
+def render_process_enabled(defaults):
+    # RENDER_PROCESS=1 in the hardware config, or LC8823_RENDER_PROCESS=1, see render_process.py
+    return os.environ.get(RENDER_PROCESS_ENV, defaults.get('RENDER_PROCESS', '0')) not in ('', '0')
+
+def create_goggles():
+    defaults = hardware_config.read()
     print(defaults)
-
-    #Initialize Strip
-    strip = led_driver.APA102(num_led=NUM_LED, 
-                                global_brightness=int(defaults['LED_BRIGHTNESS']), 
-                                SPI_BUS=SPI_BUS, 
-                                SPI_DEVICE=SPI_DEVICE,
-                                SPI_SPEED_HZ=int(defaults['SPI_SPEED']))  # Initialize the strip
-
-    #Initialize UDP
-    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-    sock.bind((UDP_IP, UDP_PORT))
-    sock.setblocking(0)
-
-
-    #Initialize Goggles
-    lg = light_goggles.LightGoggles(strip, sock, color_divider=int(defaults["DIMMER_LEVEL"])) #DIMMER_LEVEL becomes color_divider inside the Light Goggles class
+    if render_process_enabled(defaults):
+        # Rendering, UDP ingest and SPI run in their own process, lg forwards to it
+        lg = RenderProcessProxy(defaults, strip_led_count(defaults))
+    else:
+        lg = setup_goggles(defaults)
+    hardware_config.add_listener(lg.apply_hardware_config) # Config changes go live without a restart
     return lg
 
-lg = setup_goggles()
+async def goggles_command(function, *args, **kwargs):
+    # RenderProcessProxy's commands are coroutines that end once the render process
+    # carried them out, LightGoggles' are done when they return
+    result = function(*args, **kwargs)
+    if asyncio.iscoroutine(result):
+        await result
+
+async def close_recorder(recorder):
+    # Writing out the rest can take a moment, not on the event loop
+    if recorder is not None:
+        await asyncio.get_running_loop().run_in_executor(None, recorder.close)
+
+stream_sessions = set() # Open /goggles/stream connections
+lg = create_goggles()
+metrics.registry.gauge('goggles_rest_mode', 'Goggles are in rest mode (1) or streaming (0)', lambda: int(lg.rest_mode))
+if isinstance(lg, RenderProcessProxy):
+    metrics.registry.gauge('goggles_render_process_up', 'Render process is running (1) or being started again (0)',
+                           lambda: int(lg.running()))
 app = FastAPI(openapi_tags=tags_metadata,
               title="Resonate Labs Chair Control Service",
               description="An API to control a Resonate Chair.",
@@ -65,14 +75,22 @@ app = FastAPI(openapi_tags=tags_metadata,
 
 @app.on_event("startup")
 async def startup_event():
-    loop = asyncio.get_running_loop()
-    #loop.create_task(lg.get_new_variables())
-    loop.create_task(lg.receive_vid_stream())
-    loop.create_task(lg.manage_rest_mode())
+    if isinstance(lg, RenderProcessProxy):
+        lg.start()
+    else:
+        defaults = hardware_config.read()
+        start_goggles(lg, dbus_bus_type(defaults), local_socket_path(defaults))
+    goggle_tasks.append(asyncio.get_running_loop().create_task(hardware_config.watch()))
 
 @app.on_event("shutdown")
 def shutdown_event():
-    lg.strip.clear_strip()
+    if isinstance(lg, RenderProcessProxy):
+        for task in goggle_tasks:
+            task.cancel()
+        goggle_tasks.clear()
+        lg.stop()
+    else:
+        teardown_goggles(lg)
 
 @app.get("/")
 async def read_root():
@@ -83,18 +101,34 @@ async def read_goggle_state():
     return {"brightness": lg.strip.global_brightness, 
             "color_divider": lg.color_divider,
             "rest_mode": lg.rest_mode,
+            "rest_state": lg.rest.state,
+            "effect": lg.effects.current,
             "last_socket_communication": datetime.fromtimestamp(lg.last_received_socket_communication),
+            "frames_rendered": lg.renderer.frames_rendered,
+            "frames_dropped": lg.renderer.frames_dropped,
             }
 
+@app.get("/goggles/metrics", tags=["State"], response_class=PlainTextResponse)
+async def read_metrics():
+    registry = metrics.registry
+    if isinstance(lg, RenderProcessProxy):
+        try:
+            registry = await lg.collect_metrics() # Frames, UDP and SPI are counted in the render process
+        except OSError as e:
+            raise HTTPException(status_code=503, detail=str(e))
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
+
 @app.get("/goggles/hardware", tags=["Hardware Config"])
 async def read_hardware_config():
-    return read_hardware_config_file()
+    return hardware_config.read()
 
 @app.post("/goggles/hardware", tags=["Hardware Config"])
-async def update_hardware_config(hardware_config: HardwareConfig):
-    print("I'm here")
-    write_hardware_config_file(serialize_config_options(hardware_config))
-    return(hardware_config)
+async def update_hardware_config(hardware_config_parameters: HardwareConfig):
+    # Keys the API doesn't know about (SPI_BACKEND, SPI_SEGMENTS, ...) are kept
+    options = hardware_config.read()
+    options.update(config_options(hardware_config_parameters))
+    await hardware_config.write(options) # Applied to the running goggles right away
+    return(hardware_config_parameters)
 
 @app.get("/goggles/dimmer", tags=["Dimmer Control"])
 async def read_dimmer():
@@ -102,9 +136,87 @@ async def read_dimmer():
 
 @app.post("/goggles/dimmer/{dimmer}", tags=["Dimmer Control"])
 async def set_dimmer(dimmer: int):
-    lg.color_divider = dimmer
+    if dimmer < 1:
+        raise HTTPException(status_code=400, detail="dimmer must be 1 or more")
+    lg.color_divider = dimmer # Rebuilds the color lookup table
     return {"dimmer": dimmer}
 
-
-
-
+@app.get("/goggles/effects", tags=["Effects"])
+async def read_effects():
+    return {"effects": list(EFFECTS), "current": lg.effects.current}
+
+@app.post("/goggles/effects/{effect}", tags=["Effects"])
+async def start_effect(effect: str, num_cycles: int = -1):
+    if effect not in EFFECTS:
+        raise HTTPException(status_code=404, detail=f"unknown effect {effect}")
+    await goggles_command(lg.effects.start, effect, num_cycles=num_cycles)
+    return {"current": lg.effects.current}
+
+@app.delete("/goggles/effects", tags=["Effects"])
+async def stop_effect():
+    await goggles_command(lg.effects.stop)
+    return {"current": lg.effects.current}
+
+@app.get("/goggles/animations", tags=["Effects"])
+async def read_animations():
+    directory = animations_dir(hardware_config.read())
+    names = sorted(os.listdir(directory)) if os.path.isdir(directory) else []
+    return {"animations": names, "current": lg.effects.current}
+
+@app.post("/goggles/animations/{name}", tags=["Effects"])
+async def play_animation(name: str, num_cycles: int = -1):
+    # Baked with python baked_animation.py, see baked_animation.py
+    try:
+        path = animation_path(animations_dir(hardware_config.read()), name)
+        await goggles_command(lg.effects.play_file, path, num_cycles=num_cycles)
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail=f"unknown animation {name}")
+    except (OSError, ValueError) as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"current": lg.effects.current}
+
+@app.websocket("/goggles/stream")
+async def stream_frames(websocket: WebSocket, ack: bool = False):
+    await websocket.accept()
+    session = StreamSession(lg, websocket, ack=ack)
+    stream_sessions.add(session)
+    try:
+        await session.run()
+    finally:
+        stream_sessions.discard(session)
+
+@app.get("/goggles/streams", tags=["Streaming"])
+async def read_streams():
+    return {"streams": [session.stats() for session in stream_sessions]}
+
+@app.get("/goggles/recording", tags=["Streaming"])
+async def read_recording():
+    recorder = lg.recorder
+    if recorder is None:
+        return {"recording": False}
+    return {"recording": True, "path": recorder.path, "recorded": recorder.recorded, "dropped": recorder.dropped}
+
+@app.post("/goggles/recording", tags=["Streaming"])
+async def start_recording(name: str):
+    # Only a file name, recordings always go to RECORDINGS_DIR
+    try:
+        path = recording_path(recordings_dir(hardware_config.read()), name)
+        if isinstance(lg, RenderProcessProxy):
+            await lg.start_recording(path) # Replay with python stream_recorder.py replay <path>
+        else:
+            await close_recorder(lg.detach_recorder())
+            lg.start_recording(path)
+    except (OSError, ValueError) as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"recording": True, "path": path}
+
+@app.delete("/goggles/recording", tags=["Streaming"])
+async def stop_recording():
+    recorder = lg.recorder
+    if recorder is None:
+        return {"recording": False}
+    if isinstance(lg, RenderProcessProxy):
+        await lg.stop_recording()
+    else:
+        await close_recorder(lg.detach_recorder())
+    return {"recording": False, "path": recorder.path, "recorded": recorder.recorded, "dropped": recorder.dropped}
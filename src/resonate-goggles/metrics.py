@@ -0,0 +1,207 @@
+"""
+Render loop metrics, exported in the Prometheus text format.
+
+Instruments are created once at import. Recording a value only updates
+preallocated arrays, histograms also keep their most recent samples in a
+fixed-size ring buffer for the recent quantiles, so collecting metrics
+does not allocate per packet or per frame.
+
+With the render loop in its own process (see render_process.py) most of
+the metrics are recorded there. Registry.snapshot() packs the counters
+and histograms of one process into a flat tuple, Registry.merged() adds
+such a snapshot to the metrics of the other one. Both processes create
+the same counters and histograms in the same order, all of them are
+created when this module is imported.
+"""
+import asyncio
+import struct
+import time
+from array import array
+from bisect import bisect_left
+
+RING_SIZE = 1024  # Recent samples kept per histogram
+
+# Bucket upper bounds in seconds, from 100us to 1s
+TIME_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+
+
+def _format(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def _samples(recent, count):
+    return list(recent[:min(count, len(recent))])
+
+
+class Counter:
+    fields = 'Q'  # struct format of state()
+
+    def __init__(self, name, help_text):
+        self.name = name
+        self.help = help_text
+        self.value = 0
+
+    def inc(self, amount=1):
+        self.value += amount
+
+    def state(self):
+        return (self.value,)
+
+    def merged(self, state):
+        merged = Counter(self.name, self.help)
+        merged.value = self.value + state[0]
+        return merged
+
+    def render(self, lines):
+        lines.append(f"# HELP {self.name} {self.help}")
+        lines.append(f"# TYPE {self.name} counter")
+        lines.append(f"{self.name} {_format(self.value)}")
+
+
+class Gauge:
+    """A value read when metrics are collected, from a function."""
+    fields = ''  # Read in the process that registered it, not part of snapshots
+
+    def __init__(self, name, help_text, read):
+        self.name = name
+        self.help = help_text
+        self.read = read
+
+    def state(self):
+        return ()
+
+    def merged(self, state):
+        return self
+
+    def render(self, lines):
+        lines.append(f"# HELP {self.name} {self.help}")
+        lines.append(f"# TYPE {self.name} gauge")
+        lines.append(f"{self.name} {_format(self.read())}")
+
+
+class Histogram:
+    """Cumulative bucket counts plus a ring buffer of the latest samples."""
+    def __init__(self, name, help_text, buckets=TIME_BUCKETS, ring_size=RING_SIZE):
+        self.name = name
+        self.help = help_text
+        self.buckets = tuple(buckets)
+        self.counts = array('Q', [0] * (len(self.buckets) + 1))  # Last one is +Inf
+        self.sum = 0.0
+        self.count = 0
+        self.recent = array('d', [0.0] * ring_size)
+        self._next = 0
+        self.fields = f'{len(self.counts)}QdQ{ring_size}dQ'  # struct format of state()
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+        self.recent[self._next] = value
+        self._next = (self._next + 1) % len(self.recent)
+
+    def state(self):
+        return (*self.counts, self.sum, self.count, *self.recent, self._next)
+
+    def merged(self, state):
+        buckets, ring_size = len(self.counts), len(self.recent)
+        merged = Histogram(self.name, self.help, self.buckets, ring_size)
+        merged.counts = array('Q', (mine + theirs for mine, theirs in zip(self.counts, state[:buckets])))
+        merged.sum = self.sum + state[buckets]
+        merged.count = self.count + state[buckets + 1]
+        # Samples of both, which came last is unknown, so keep as many of them as fit
+        samples = (_samples(self.recent, self.count) +
+                   _samples(state[buckets + 2:buckets + 2 + ring_size], state[buckets + 1]))[-ring_size:]
+        merged.recent[:len(samples)] = array('d', samples)
+        merged._next = len(samples) % ring_size
+        return merged
+
+    def recent_quantile(self, quantile):
+        samples = sorted(self.recent[:min(self.count, len(self.recent))])
+        if not samples:
+            return 0.0
+        return samples[min(int(len(samples) * quantile), len(samples) - 1)]
+
+    def render(self, lines):
+        lines.append(f"# HELP {self.name} {self.help}")
+        lines.append(f"# TYPE {self.name} histogram")
+        cumulative = 0
+        for bound, count in zip(self.buckets, self.counts):
+            cumulative += count
+            lines.append(f'{self.name}_bucket{{le="{bound}"}} {cumulative}')
+        lines.append(f'{self.name}_bucket{{le="+Inf"}} {self.count}')
+        lines.append(f"{self.name}_sum {_format(self.sum)}")
+        lines.append(f"{self.name}_count {self.count}")
+        lines.append(f"# HELP {self.name}_recent Quantiles of the last {len(self.recent)} samples")
+        lines.append(f"# TYPE {self.name}_recent gauge")
+        for quantile in (0.5, 0.9, 0.99):
+            lines.append(f'{self.name}_recent{{quantile="{quantile}"}} {_format(self.recent_quantile(quantile))}')
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = []
+
+    def counter(self, name, help_text):
+        return self._add(Counter(name, help_text))
+
+    def gauge(self, name, help_text, read):
+        return self._add(Gauge(name, help_text, read))
+
+    def histogram(self, name, help_text, buckets=TIME_BUCKETS):
+        return self._add(Histogram(name, help_text, buckets))
+
+    def _add(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def snapshot_struct(self):
+        """struct that packs snapshot()."""
+        return struct.Struct('<' + ''.join(metric.fields for metric in self.metrics))
+
+    def snapshot(self):
+        """The values of all counters and histograms, one flat tuple."""
+        return tuple(value for metric in self.metrics for value in metric.state())
+
+    def merged(self, snapshot):
+        """A new registry, our metrics with the values of another process' snapshot() added."""
+        merged = Registry()
+        position = 0
+        for metric in self.metrics:
+            size = len(metric.state())
+            merged._add(metric.merged(snapshot[position:position + size]))
+            position += size
+        return merged
+
+    def render(self):
+        lines = []
+        for metric in self.metrics:
+            metric.render(lines)
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+
+udp_packets_received = registry.counter('goggles_udp_packets_received_total', 'Datagrams received')
+udp_packets_parsed = registry.counter('goggles_udp_packets_parsed_total', 'Datagrams that held a valid frame')
+udp_packets_rejected = registry.counter('goggles_udp_packets_rejected_total', 'Datagrams that could not be parsed')
+udp_packets_superseded = registry.counter('goggles_udp_packets_superseded_total', 'Datagrams skipped because a newer one was already waiting')
+websocket_frames_received = registry.counter('goggles_websocket_frames_received_total', 'Frames received on /goggles/stream')
+websocket_frames_rejected = registry.counter('goggles_websocket_frames_rejected_total', 'Websocket frames that could not be parsed')
+local_frames_received = registry.counter('goggles_local_frames_received_total', 'Frames received on the local socket or shared memory ring')
+local_frames_rejected = registry.counter('goggles_local_frames_rejected_total', 'Local socket messages that could not be parsed')
+frames_rendered = registry.counter('goggles_frames_rendered_total', 'Streamed frames shown on the strip')
+frames_dropped = registry.counter('goggles_frames_dropped_total', 'Streamed frames replaced before they were shown')
+frames_skipped = registry.counter('goggles_frames_skipped_total', 'show() calls skipped because nothing changed')
+spi_transfer_seconds = registry.histogram('goggles_spi_transfer_seconds', 'Time to clock one frame out on SPI')
+spi_bytes = registry.counter('goggles_spi_bytes_total', 'Bytes written to SPI')
+encode_seconds = registry.histogram('goggles_encode_seconds', 'Time to prepare the SPI frame in show()')
+event_loop_lag_seconds = registry.histogram('goggles_event_loop_lag_seconds', 'How late the event loop runs a timer')
+render_process_restarts = registry.counter('goggles_render_process_restarts_total', 'Times the render process exited and was started again')
+
+
+async def monitor_event_loop_lag(interval=0.5):
+    """Samples event loop lag, i.e. how much later than asked a sleep returns."""
+    while True:
+        started = time.monotonic()
+        await asyncio.sleep(interval)
+        event_loop_lag_seconds.observe(max(time.monotonic() - started - interval, 0.0))
@@ -1,6 +1,7 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 
 class HardwareConfig(BaseModel):
-    spi_speed: int = 150000
-    led_brightness: int = 1
-    dimmer_level: int = 1
+    spi_speed: int = Field(150000, gt=0)
+    led_brightness: int = Field(1, ge=0, le=31)
+    dimmer_level: int = Field(1, ge=1)
+    gamma: float = Field(1.0, gt=0)
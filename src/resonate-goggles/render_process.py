@@ -0,0 +1,696 @@
+"""
+Running the render loop in its own process.
+
+With RENDER_PROCESS=1 in the hardware config (or LC8823_RENDER_PROCESS=1)
+the strip, the UDP listener, the renderer, effects and rest mode run in a
+child process with an event loop of its own, so web requests and garbage
+collection in the API process can't make the goggles stutter. main.py
+talks to the child through RenderProcessProxy, which offers the parts of
+LightGoggles the endpoints use.
+
+Both processes share one block of memory (multiprocessing.shared_memory):
+
+    settings   brightness, dimmer, gamma, SPI speed and rest mode timeouts,
+               written by the API process behind a seqlock
+    command    one pending command (start/stop effect, play an animation,
+               start/stop recording) behind a seqlock, the API process waits for the
+               child to acknowledge it in the status block before sending
+               the next
+    status     state of the goggles, published by the child behind a
+               seqlock whenever it changed: after every frame rendered,
+               every command and every change of rest mode, effect,
+               brightness or dimmer, nothing is published while idle
+    metrics    the child's counters and histograms (metrics.py), published
+               behind a seqlock when /goggles/metrics asks for them with
+               a command
+    frames     a ring of RING_SLOTS frames (sequence number and packed RGB)
+               pushed by the API process, e.g. from the /goggles/stream
+               websocket, the child only ever shows the newest one
+
+A seqlock is a counter that is odd while its block is being written,
+readers retry until they saw the same even value before and after reading.
+Python has no memory barriers, and on the Pi's ARM cores another process
+may see the stores of a block in a different order than they were made,
+so the counter is stored with a CRC32 of itself and the block. A reader
+that got a mix of old and new bytes sees a wrong CRC and retries.
+Frames need no CRC: the doorbell is a system call, which orders the
+stores made before it. A block that stays locked for SEQLOCK_TIMEOUT
+means its writer died in the middle of writing it, readers give up
+with a TimeoutError.
+
+The D-Bus service (DBUS_SERVICE) is exported by the render process.
+Frames are parsed straight into the ring, nothing is pickled or copied in
+between. Changes are signalled over a pipe (the doorbell), one byte per
+change, so the child sleeps while nothing happens. The child answers over
+a second pipe (the status bell) whenever it published its status, which
+is what commands and frame acks in the API process wait for. The status
+bell closing tells the API process that the child exited. If that
+wasn't stop(), the child is started again after RESTART_DELAY.
+
+Texts (effect names, paths) are at most TEXT_SIZE bytes, longer ones are
+rejected before they are sent.
+"""
+import asyncio
+import multiprocessing
+import os
+import struct
+import time
+import zlib
+from collections import deque, namedtuple
+from multiprocessing import shared_memory
+import metrics
+from hardware_config import live_settings
+from frame_protocol import parse_frame
+from rest_mode import STREAMING, IDLE_R, BLANK
+
+RENDER_PROCESS_ENV = 'LC8823_RENDER_PROCESS'
+RING_SLOTS = 4
+COMMAND_TIMEOUT = 2.0 # Seconds to wait for the render process to take a command
+SEQLOCK_TIMEOUT = 0.5 # Seconds a shared block may stay locked before readers give up
+RESTART_DELAY = 1.0 # Seconds before a render process that exited is started again
+TEXT_SIZE = 256 # Bytes of effect names and paths in the command and status blocks
+MESSAGE_SIZE = 128 # Bytes of the error message in the status block, longer ones are cut
+
+REST_STATES = (STREAMING, IDLE_R, BLANK)
+COMMAND_START_EFFECT = 1
+COMMAND_STOP_EFFECT = 2
+COMMAND_START_RECORDING = 3
+COMMAND_STOP_RECORDING = 4
+COMMAND_PLAY_ANIMATION = 5
+COMMAND_PUBLISH_METRICS = 6
+
+SEQ = struct.Struct('<II')  # Seqlock counter, CRC32 of the counter and the block
+SETTINGS = struct.Struct('<IIdIdd')  # brightness, dimmer, gamma, SPI speed, rest timeout, blank timeout
+SETTINGS_KEYS = ('LED_BRIGHTNESS', 'DIMMER_LEVEL', 'GAMMA', 'SPI_SPEED', 'REST_TIMEOUT', 'BLANK_TIMEOUT')
+COMMAND = struct.Struct(f'<IiB3x{TEXT_SIZE}s')  # sequence, number argument, command, text argument
+STATUS = struct.Struct(f'<BBBxIiQQQQQqdQQIId{TEXT_SIZE}s{TEXT_SIZE}s{MESSAGE_SIZE}s')
+METRICS = metrics.registry.snapshot_struct()
+RING_HEAD = struct.Struct('<Q')  # Frames pushed so far
+SLOT_HEADER = struct.Struct('<I')  # Frame sequence number
+
+RenderStatus = namedtuple('RenderStatus', 'rest_state has_pending recording command_ack command_result '
+                                          'frames_rendered frames_dropped frames_taken ring_done ring_shown '
+                                          'last_sequence '
+                                          'last_communication recorded recording_dropped brightness '
+                                          'color_divider gamma effect recording_path message')
+
+
+
+def _aligned(offset):
+    return (offset + 7) & ~7
+
+
+SETTINGS_OFFSET = 0
+COMMAND_OFFSET = SETTINGS_OFFSET + SEQ.size + SETTINGS.size
+STATUS_OFFSET = COMMAND_OFFSET + SEQ.size + COMMAND.size
+METRICS_OFFSET = _aligned(STATUS_OFFSET + SEQ.size + STATUS.size)
+RING_OFFSET = _aligned(METRICS_OFFSET + SEQ.size + METRICS.size)
+
+
+def _text(value):
+    return value.rstrip(b'\0').decode(errors='replace')
+
+
+def _encoded(text, what):
+    data = text.encode()
+    if len(data) > TEXT_SIZE:
+        raise ValueError(f"{what} is longer than {TEXT_SIZE} bytes")
+    return data
+
+
+def _status_values(status):
+    # RenderStatus back into what publish_status() takes
+    values = list(status)
+    values[0] = REST_STATES.index(values[0])
+    for field in (-3, -2, -1):
+        values[field] = values[field].encode()
+    return values
+
+
+def _clipped(text, size):
+    # Cut on a character boundary
+    return text.encode()[:size].decode(errors='ignore')
+
+
+class SharedGoggles:
+    """
+    The shared memory block, see the module docstring for its parts.
+
+    Created by the API process, attached to by name in the render process.
+    """
+    def __init__(self, num_led, name=None):
+        self.num_led = num_led
+        self.slot_size = SLOT_HEADER.size + 3 * num_led
+        size = RING_OFFSET + RING_HEAD.size + RING_SLOTS * self.slot_size
+        self.shm = shared_memory.SharedMemory(name=name, create=name is None, size=size)
+        self.name = self.shm.name
+        self.buf = self.shm.buf
+        self._ring = RING_OFFSET + RING_HEAD.size
+        if name is None:
+            self.write_command(0, 0) # No command yet, readers of a block never written to would spin
+
+    def close(self):
+        self.buf = None
+        self.shm.close()
+
+    def unlink(self):
+        self.shm.unlink()
+
+    def _write_locked(self, offset, fields, values):
+        block = fields.pack(*values)
+        seq = (SEQ.unpack_from(self.buf, offset)[0] + 2) & 0xFFFFFFFE
+        SEQ.pack_into(self.buf, offset, seq - 1, 0) # Odd, readers wait
+        start = offset + SEQ.size
+        self.buf[start:start + fields.size] = block
+        SEQ.pack_into(self.buf, offset, seq, zlib.crc32(block, seq))
+
+    def _read_locked(self, offset, fields):
+        start = offset + SEQ.size
+        deadline = None
+        while True:
+            header = SEQ.unpack_from(self.buf, offset)
+            if not header[0] & 1:
+                block = bytes(self.buf[start:start + fields.size])
+                if SEQ.unpack_from(self.buf, offset) == header and zlib.crc32(block, header[0]) == header[1]:
+                    return header[0], fields.unpack(block)
+            # The writer is in the middle of it
+            if deadline is None:
+                deadline = time.monotonic() + SEQLOCK_TIMEOUT
+            elif time.monotonic() > deadline:
+                raise TimeoutError("shared memory block stays locked, its writer stopped half way")
+            time.sleep(0)
+
+    def write_settings(self, brightness, color_divider, gamma, spi_speed, rest_timeout, blank_timeout):
+        self._write_locked(SETTINGS_OFFSET, SETTINGS,
+                           (brightness, color_divider, gamma, spi_speed, rest_timeout, blank_timeout))
+
+    def read_settings(self):
+        """(version, settings), the version changes with every write_settings()."""
+        return self._read_locked(SETTINGS_OFFSET, SETTINGS)
+
+    def write_command(self, sequence, command, argument=0, text=''):
+        self._write_locked(COMMAND_OFFSET, COMMAND, (sequence, argument, command, _encoded(text, "command text")))
+
+    def read_command(self):
+        sequence, argument, command, text = self._read_locked(COMMAND_OFFSET, COMMAND)[1]
+        return sequence, command, argument, _text(text)
+
+    def publish_status(self, status):
+        self._write_locked(STATUS_OFFSET, STATUS, status)
+
+    def read_status(self):
+        values = list(self._read_locked(STATUS_OFFSET, STATUS)[1])
+        values[0] = REST_STATES[values[0]]
+        for field in (-3, -2, -1):
+            values[field] = _text(values[field])
+        return RenderStatus(*values)
+
+    def publish_metrics(self, snapshot):
+        self._write_locked(METRICS_OFFSET, METRICS, snapshot)
+
+    def read_metrics(self):
+        """The metrics.registry.snapshot() published last."""
+        return self._read_locked(METRICS_OFFSET, METRICS)[1]
+
+    def frames_pushed(self):
+        return RING_HEAD.unpack_from(self.buf, RING_OFFSET)[0]
+
+    def _slot(self, index):
+        return self._ring + (index % RING_SLOTS) * self.slot_size
+
+    def push_frame(self, buffer, nbytes):
+        """Parses a frame packet into the next ring slot, returns its sequence number or None.
+
+        Pixels the packet doesn't cover keep their value from the frame
+        pushed before, as they would in the renderer's pending frame.
+        """
+        head = self.frames_pushed()
+        start = self._slot(head) + SLOT_HEADER.size
+        end = start + 3 * self.num_led
+        parsed = parse_frame(buffer, nbytes, self.buf[start:end])
+        if parsed is None:
+            return None
+        sequence, length = parsed
+        if length < end - start and head > 0:
+            previous = self._slot(head - 1) + SLOT_HEADER.size
+            self.buf[start + length:end] = self.buf[previous + length:previous + end - start]
+        SLOT_HEADER.pack_into(self.buf, start - SLOT_HEADER.size, sequence)
+        RING_HEAD.pack_into(self.buf, RING_OFFSET, head + 1) # Publishes the frame
+        return sequence
+
+    def take_frame(self, taken, target):
+        """Copies the newest frame pushed after the first taken ones into target.
+
+        Returns (frames pushed, sequence number), or None if there is no new frame.
+        """
+        while True:
+            head = self.frames_pushed()
+            if head == taken:
+                return None
+            start = self._slot(head - 1)
+            sequence = SLOT_HEADER.unpack_from(self.buf, start)[0]
+            target[:] = self.buf[start + SLOT_HEADER.size:start + self.slot_size]
+            if self.frames_pushed() - head < RING_SLOTS - 1:
+                return head, sequence
+            # The API process went all the way around the ring while we copied, take the newest again
+
+
+def goggles_status(lg, taken, ring_done, ring_shown, command_ack, command_result, message=''):
+    # Effect names and paths came through the command block, they fit
+    recorder = lg.recorder
+    return (REST_STATES.index(lg.rest.state), lg.renderer.has_pending, recorder is not None,
+            command_ack, command_result,
+            lg.renderer.frames_rendered, lg.renderer.frames_dropped, taken, ring_done, ring_shown,
+            -1 if lg.last_sequence is None else lg.last_sequence,
+            lg.last_received_socket_communication,
+            0 if recorder is None else recorder.recorded, 0 if recorder is None else recorder.dropped,
+            lg.strip.global_brightness, lg.color_divider, lg.gamma,
+            (lg.effects.current or '').encode(), b'' if recorder is None else recorder.path.encode(),
+            _clipped(message, MESSAGE_SIZE).encode())
+
+
+def render_main(name, num_led, doorbell, status_bell):
+    """Entry point of the render process."""
+    asyncio.run(_render(name, num_led, doorbell, status_bell))
+
+
+def _ring_bell(fd):
+    try:
+        os.write(fd, b'\0')
+    except (BlockingIOError, BrokenPipeError):
+        pass # The other side has a wakeup pending already, or is gone
+
+
+def _drain_bell(fd):
+    """Empties a non-blocking bell pipe, returns False once the other side closed it."""
+    try:
+        while True:
+            data = os.read(fd, 4096)
+            if not data:
+                return False
+            if len(data) < 4096:
+                return True
+    except BlockingIOError:
+        return True
+
+
+async def _render(name, num_led, doorbell, status_bell):
+    from goggles_setup import setup_goggles, start_goggles, teardown_goggles, dbus_bus_type, local_socket_path
+    from hardware_config import HardwareConfigStore
+    loop = asyncio.get_running_loop()
+    shared = SharedGoggles(num_led, name=name)
+    defaults = HardwareConfigStore().read()
+    lg = setup_goggles(defaults)
+    start_goggles(lg, dbus_bus_type(defaults), local_socket_path(defaults)) # D-Bus and local input live where the goggles are
+    settings_version = None
+    command_ack = command_seen = shared.read_command()[0]
+    command_task = None # The command being carried out
+    command_result = 0
+    message = ''
+    taken = shared.frames_pushed()
+    ring_done = ring_shown = taken # Ring frames shown or replaced, and the frame shown last
+    ring_frames = deque() # (renderer.frames_submitted, taken) of ring frames not rendered yet
+    stopped = loop.create_future()
+    os.set_blocking(status_bell.fileno(), False) # Never wait for the API process
+
+    def publish():
+        nonlocal ring_done, ring_shown
+        if stopped.done():
+            return # Shutting down, the shared memory may be gone already
+        while ring_frames and ring_frames[0][0] <= lg.renderer.last_shown:
+            submitted, ring_done = ring_frames.popleft()
+            if submitted == lg.renderer.last_shown:
+                ring_shown = ring_done
+        shared.publish_status(goggles_status(lg, taken, ring_done, ring_shown,
+                                             command_ack, command_result, message))
+        _ring_bell(status_bell.fileno())
+
+    async def close_recorder():
+        recorder = lg.detach_recorder() # Ingest stops recording right away
+        if recorder is not None:
+            await loop.run_in_executor(None, recorder.close) # Joining the writer must not hold up rendering
+
+    async def run_command(command, argument, text):
+        if command == COMMAND_START_EFFECT:
+            lg.effects.start(text, num_cycles=argument)
+        elif command == COMMAND_STOP_EFFECT:
+            lg.effects.stop()
+        elif command == COMMAND_PLAY_ANIMATION:
+            lg.effects.play_file(text, num_cycles=argument)
+        elif command == COMMAND_START_RECORDING:
+            await close_recorder()
+            lg.start_recording(text)
+        elif command == COMMAND_STOP_RECORDING:
+            await close_recorder()
+        elif command == COMMAND_PUBLISH_METRICS:
+            shared.publish_metrics(metrics.registry.snapshot())
+
+    async def carry_out(sequence, command, argument, text):
+        # Acknowledged once done, the API process sends no other command until then
+        nonlocal command_ack, command_result, message
+        try:
+            await run_command(command, argument, text)
+            command_result, message = 0, ''
+        except Exception as e:
+            command_result, message = 1, str(e)
+        command_ack = sequence
+        publish()
+
+    def ring():
+        nonlocal settings_version, command_seen, command_task, taken
+        try:
+            while doorbell.poll():
+                doorbell.recv_bytes()
+        except EOFError: # The API process went away
+            loop.remove_reader(doorbell.fileno())
+            if not stopped.done():
+                stopped.set_result(None)
+            return
+        version, settings = shared.read_settings()
+        if version != settings_version:
+            settings_version = version
+            lg.apply_hardware_config(dict(zip(SETTINGS_KEYS, settings)))
+        sequence, command, argument, text = shared.read_command()
+        if sequence != command_seen:
+            command_seen = sequence
+            command_task = loop.create_task(carry_out(sequence, command, argument, text))
+        frame = shared.take_frame(taken, lg.renderer.pending)
+        if frame is not None:
+            skipped = frame[0] - taken - 1
+            if skipped: # Replaced in the ring before we got to them
+                lg.renderer.frames_dropped += skipped
+            taken, lg.last_sequence = frame
+            lg.stream_activity()
+            lg.renderer.commit()
+            ring_frames.append((lg.renderer.frames_submitted, taken))
+        publish()
+
+    publish()
+    lg.renderer.on_render = publish # Frame counters and acks
+    lg.add_state_listener(lambda changes: publish()) # Rest mode, effects, brightness and dimmer
+    loop.add_reader(doorbell.fileno(), ring)
+    ring() # Settings and anything pushed before we were listening
+    try:
+        await stopped
+    finally:
+        if command_task is not None:
+            command_task.cancel()
+        teardown_goggles(lg)
+        shared.close()
+
+
+class _StripStatus:
+    def __init__(self, proxy):
+        self._proxy = proxy
+
+    @property
+    def global_brightness(self):
+        return self._proxy.status().brightness
+
+    @property
+    def num_led(self):
+        return self._proxy.shared.num_led
+
+
+class _RestStatus:
+    def __init__(self, proxy):
+        self._proxy = proxy
+
+    @property
+    def state(self):
+        return self._proxy.status().rest_state
+
+
+class _EffectsProxy:
+    def __init__(self, proxy):
+        self._proxy = proxy
+
+    @property
+    def current(self):
+        return self._proxy.status().effect or None
+
+    @property
+    def running(self):
+        return self.current is not None
+
+    async def start(self, name, num_cycles=-1):
+        await self._proxy.command(COMMAND_START_EFFECT, num_cycles, name)
+
+    async def stop(self):
+        await self._proxy.command(COMMAND_STOP_EFFECT)
+
+    async def play_file(self, path, num_cycles=-1):
+        await self._proxy.command(COMMAND_PLAY_ANIMATION, num_cycles, path)
+
+
+class _RendererProxy:
+    def __init__(self, proxy):
+        self._proxy = proxy
+        self.last_pushed = 0 # Ring frame number of the last frame pushed, what wait_rendered waits for
+
+    @property
+    def frames_rendered(self):
+        return self._proxy.status().frames_rendered
+
+    @property
+    def frames_dropped(self):
+        return self._proxy.status().frames_dropped
+
+    @property
+    def has_pending(self):
+        status = self._proxy.status()
+        return status.has_pending or self._proxy.shared.frames_pushed() > status.frames_taken
+
+    def wait_rendered(self, frame=None):
+        # Same contract as FrameRenderer.wait_rendered, frame counts ring frames
+        if frame is None:
+            frame = self.last_pushed
+        return self._proxy.wait_status(lambda status: status.ring_shown == frame
+                                       if status.ring_done >= frame else None)
+
+
+class RenderProcessProxy:
+    """
+    Stands in for LightGoggles in the API process while the goggles run in the render process.
+
+    Reads come from the status block, changes go through the settings and
+    command blocks, frames through the ring (see handle_frame).
+
+    Attributes
+    ----------
+    shared : SharedGoggles
+        The shared memory block
+    process : multiprocessing.Process
+        The render process, started by start() and again when it exited
+    restarts : int
+        Times the render process exited and was started again
+    strip, rest, effects, renderer
+        The parts of the LightGoggles interface main.py and stream_session.py use
+    """
+    def __init__(self, defaults, num_led):
+        from constants import BRIGHTNESS, DIMMER_LEVEL, GAMMA, SPI_SPEED_HZ, REST_TIMEOUT, BLANK_TIMEOUT
+        self._context = multiprocessing.get_context('spawn') # A fresh interpreter, nothing of the web app
+        self.shared = SharedGoggles(num_led)
+        self._settings = {'LED_BRIGHTNESS': int(defaults.get('LED_BRIGHTNESS', BRIGHTNESS)),
+                          'DIMMER_LEVEL': int(defaults.get('DIMMER_LEVEL', DIMMER_LEVEL)),
+                          'GAMMA': float(defaults.get('GAMMA', GAMMA)),
+                          'SPI_SPEED': int(defaults.get('SPI_SPEED', SPI_SPEED_HZ)),
+                          'REST_TIMEOUT': float(defaults.get('REST_TIMEOUT', REST_TIMEOUT)),
+                          'BLANK_TIMEOUT': float(defaults.get('BLANK_TIMEOUT', BLANK_TIMEOUT))}
+        self._seen = {key: self._settings[key] for key in ('LED_BRIGHTNESS', 'DIMMER_LEVEL', 'GAMMA')}
+        self._write_settings()
+        self._status = RenderStatus(STREAMING, False, False, 0, 0, 0, 0, 0, 0, 0, -1, time.time(), 0, 0,
+                                    self._settings['LED_BRIGHTNESS'], self._settings['DIMMER_LEVEL'],
+                                    self._settings['GAMMA'], '', '', '') # The status read last
+        self.shared.publish_status(_status_values(self._status))
+        self._command_sequence = 0
+        self._command_lock = asyncio.Lock() # One command in the command block at a time
+        self._status_waiters = [] # (check, future), see wait_status
+        self._doorbell = self._status_bell_reader = None # Pipes to the render process, opened by start()
+        self.process = None
+        self.restarts = 0
+        self._restart = None # Timer handle while the render process is due to be started again
+        self._loop = None # Set by start()
+        self.strip = _StripStatus(self)
+        self.rest = _RestStatus(self)
+        self.effects = _EffectsProxy(self)
+        self.renderer = _RendererProxy(self)
+
+    def start(self):
+        """Starts the render process, call from the running event loop."""
+        self._restart = None
+        doorbell_reader, self._doorbell = self._context.Pipe(duplex=False)
+        self._status_bell_reader, status_bell = self._context.Pipe(duplex=False)
+        self.process = self._context.Process(target=render_main, name='goggles-render', daemon=True,
+                                             args=(self.shared.name, self.shared.num_led,
+                                                   doorbell_reader, status_bell))
+        self.process.start()
+        doorbell_reader.close() # The render process has its own copies
+        status_bell.close()
+        self._loop = asyncio.get_running_loop()
+        os.set_blocking(self._status_bell_reader.fileno(), False)
+        self._loop.add_reader(self._status_bell_reader.fileno(), self._status_published)
+
+    def stop(self, timeout=5.0):
+        if self._restart is not None:
+            self._restart.cancel() # Exited a moment ago, the pipes are closed already
+            self._restart = None
+        elif self.process is not None:
+            self._loop.remove_reader(self._status_bell_reader.fileno())
+            self._doorbell.close() # The render process sees the pipe close, clears the strip and exits
+            self.process.join(timeout)
+            if self.process.is_alive():
+                self.process.terminate()
+            self._status_bell_reader.close()
+        self.shared.close()
+        self.shared.unlink()
+
+    def running(self):
+        return self._restart is None and self.process is not None and self.process.is_alive()
+
+    def _render_process_exited(self):
+        # Crashed or was killed, stop() stops listening before the render process exits
+        self._loop.remove_reader(self._status_bell_reader.fileno())
+        self._status_bell_reader.close()
+        self._doorbell.close()
+        self.process.join(1.0) # It closed the status bell on its way out
+        print(f"Render process exited with code {self.process.exitcode}, starting it again in {RESTART_DELAY} s")
+        self.restarts += 1
+        metrics.render_process_restarts.inc()
+        # It may have died in the middle of publishing, the next one starts from the status we read last
+        self.shared.publish_status(_status_values(self._status))
+        self._restart = self._loop.call_later(RESTART_DELAY, self.start)
+
+    def _status_published(self):
+        if not _drain_bell(self._status_bell_reader.fileno()):
+            self._render_process_exited()
+            return
+        status = self.status()
+        waiting = []
+        for check, future in self._status_waiters:
+            if future.done():
+                continue # Timed out
+            result = check(status)
+            if result is None:
+                waiting.append((check, future))
+            else:
+                future.set_result(result)
+        self._status_waiters = waiting
+
+    def wait_status(self, check):
+        """Future resolved with check(status) as soon as that is not None.
+
+        check is called with the current status and then every time the
+        render process published a new one.
+        """
+        future = asyncio.get_running_loop().create_future()
+        result = check(self.status())
+        if result is None:
+            # Nothing is published while the goggles are idle, drop the waiters that timed out meanwhile
+            self._status_waiters = [entry for entry in self._status_waiters if not entry[1].done()]
+            self._status_waiters.append((check, future))
+        else:
+            future.set_result(result)
+        return future
+
+    def _ring(self):
+        if self._doorbell is None:
+            return # Not started yet, the render process reads everything once it runs
+        try:
+            self._doorbell.send_bytes(b'\0')
+        except (BrokenPipeError, OSError):
+            pass # Render process is gone, nothing to wake up
+
+    def status(self):
+        if self.process is None or self.running():
+            self._status = self.shared.read_status()
+        return self._status # Exited, the block may be half written
+
+    def _write_settings(self):
+        self.shared.write_settings(*(self._settings[key] for key in SETTINGS_KEYS))
+
+    async def command(self, command, argument=0, text=''):
+        """Hands a command to the render process and waits until it was carried out."""
+        async with self._command_lock:
+            if not self.running():
+                raise ConnectionError("render process is not running")
+            restarts = self.restarts
+            self._command_sequence = sequence = (self._command_sequence + 1) & 0xFFFFFFFF
+            self.shared.write_command(sequence, command, argument, text)
+            self._ring()
+            try:
+                status = await asyncio.wait_for(
+                    self.wait_status(lambda status: status if status.command_ack == sequence else None),
+                    COMMAND_TIMEOUT)
+            except asyncio.TimeoutError:
+                raise TimeoutError("render process did not respond") from None
+        if self.restarts != restarts: # A new render process takes the command as seen without running it
+            raise ConnectionError("render process exited before it carried out the command")
+        if status.command_result:
+            raise OSError(status.message)
+
+    async def collect_metrics(self):
+        """metrics.registry with the counters and histograms of the render process added."""
+        await self.command(COMMAND_PUBLISH_METRICS)
+        return metrics.registry.merged(self.shared.read_metrics())
+
+    def apply_hardware_config(self, options):
+        settings = live_settings(options) # Checked here, the render process gets valid values only
+        self._follow_render_process()
+        self._settings.update(settings)
+        self._write_settings()
+        self._ring()
+
+    def _follow_render_process(self):
+        # Takes over what the render process changed by itself (D-Bus) since we last looked,
+        # so writing the settings block doesn't undo it
+        status = self.status()
+        for key, value in (('LED_BRIGHTNESS', status.brightness), ('DIMMER_LEVEL', status.color_divider),
+                           ('GAMMA', status.gamma)):
+            if value != self._seen[key]:
+                self._seen[key] = self._settings[key] = value
+
+    @property
+    def color_divider(self):
+        return self.status().color_divider
+
+    @color_divider.setter
+    def color_divider(self, color_divider):
+        self.apply_hardware_config({'DIMMER_LEVEL': color_divider})
+
+    @property
+    def rest_mode(self):
+        return self.status().rest_state != STREAMING
+
+    @property
+    def last_received_socket_communication(self):
+        return self.status().last_communication
+
+    @property
+    def last_sequence(self):
+        sequence = self.status().last_sequence
+        return None if sequence < 0 else sequence
+
+    @property
+    def recorder(self):
+        status = self.status()
+        if not status.recording:
+            return None
+        return _RecorderStatus(status.recording_path, status.recorded, status.recording_dropped)
+
+    async def start_recording(self, path):
+        await self.command(COMMAND_START_RECORDING, text=path)
+
+    async def stop_recording(self):
+        await self.command(COMMAND_STOP_RECORDING)
+
+    def handle_frame(self, buffer, nbytes):
+        # Same contract as LightGoggles.handle_frame, the frame goes into the ring
+        sequence = self.shared.push_frame(buffer, nbytes)
+        if sequence is not None:
+            self.renderer.last_pushed = self.shared.frames_pushed()
+            self._ring()
+        return sequence
+
+
+_RecorderStatus = namedtuple('_RecorderStatus', 'path recorded dropped')
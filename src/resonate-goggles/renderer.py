@@ -0,0 +1,138 @@
+import asyncio
+import time
+import metrics
+from constants import TARGET_FPS
+
+
+class FrameRenderer:
+    """
+    Render stage that sits between stream ingest and the LED strip.
+
+    Ingest never touches the strip. It overwrites the single pending frame
+    slot and returns right away. The render loop picks up whatever is in the
+    slot when the next frame deadline comes around, so a sender that bursts
+    faster than the strip can be refreshed only ever costs one frame period
+    of latency. Frames that get overwritten before they were shown are
+    counted as dropped.
+
+    Attributes
+    ----------
+    strip : APA102
+        The LED strip frames are rendered to
+    fps : int
+        Target frame rate, frames are never shown faster than this
+    bright_percent : int
+        Per pixel brightness used when rendering frames
+    lut : bytes
+        Optional 256 entry color table (see color_lut.py) applied to every frame
+    pending : bytearray
+        Packed RGB (3 bytes per LED) of the next frame to show
+    frames_submitted, frames_rendered, frames_dropped : int
+        Frame counters since startup
+    last_shown : int
+        frames_submitted of the frame the last finished render showed
+    on_render : callable
+        Called without arguments after every frame that went out to the strip
+    """
+    def __init__(self, strip, fps=TARGET_FPS, bright_percent=1):
+        self.strip = strip
+        self.fps = fps
+        self.bright_percent = bright_percent
+        self.lut = None
+        self.pending = bytearray(3 * strip.num_led)
+        self.has_pending = False
+        self.frames_submitted = 0
+        self.frames_rendered = 0
+        self.frames_dropped = 0
+        self.last_shown = 0
+        self._next_deadline = 0.0
+        self._wakeup = None # Created by run(), it must belong to the running loop
+        self._render_waiters = [] # (frame, future) resolved once that frame went out, see wait_rendered
+        self.on_render = None
+
+    def submit(self, rgb_data):
+        """Replaces the pending frame with packed RGB data."""
+        count = min(len(rgb_data), len(self.pending))
+        self.pending[:count] = rgb_data[:count]
+        self.commit()
+
+    def submit_solid(self, rgb):
+        """Replaces the pending frame with a single color."""
+        self.pending[:] = bytes(rgb[:3]) * self.strip.num_led
+        self.commit()
+
+    def commit(self):
+        """Marks the pending slot as holding a new frame.
+
+        Used by callers that write into self.pending directly.
+        """
+        if self.has_pending:
+            self.frames_dropped += 1 # The previous frame never made it to the strip
+            metrics.frames_dropped.inc()
+        self.has_pending = True
+        self.frames_submitted += 1
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    async def render(self):
+        """Shows the pending frame on the strip right away."""
+        shown = self.frames_submitted # Frames committed while the transfer runs are not part of it
+        frame = self.pending if self.lut is None else self.pending.translate(self.lut)
+        self.strip.set_pixels(frame, self.bright_percent)
+        self.has_pending = False
+        await self.strip.show_async() # The SPI transfer runs off the event loop
+        self.frames_rendered += 1
+        self.last_shown = shown
+        metrics.frames_rendered.inc()
+        waiting = []
+        for target, waiter in self._render_waiters:
+            if target > shown:
+                waiting.append((target, waiter))
+            elif not waiter.done():
+                waiter.set_result(target == shown)
+        self._render_waiters = waiting
+        if self.on_render is not None:
+            self.on_render()
+
+    def wait_rendered(self, frame=None):
+        """Future that is resolved once a frame has been sent to the strip.
+
+        frame is a frames_submitted value, by default the frame committed
+        last. The result is True if that frame was shown and False if a
+        newer one replaced it before it got its turn. Lets senders pace
+        themselves on the render loop instead of queueing frames that would
+        only be dropped.
+        """
+        if frame is None:
+            frame = self.frames_submitted
+        waiter = asyncio.get_running_loop().create_future()
+        if frame <= self.last_shown:
+            waiter.set_result(frame == self.last_shown)
+        else:
+            # Waiters given up on (cancelled, e.g. by a timeout) go now, renders may be far off
+            self._render_waiters = [entry for entry in self._render_waiters if not entry[1].done()]
+            self._render_waiters.append((frame, waiter))
+        return waiter
+
+    async def run(self):
+        self._wakeup = asyncio.Event()
+        if self.has_pending:
+            self._wakeup.set()
+        while True:
+            # Sleep until ingest commits a frame, no wakeups while idle
+            await self._wakeup.wait()
+            self._wakeup.clear()
+            # Frames newer than the last one shown wait for the next deadline,
+            # more frames may replace the pending one in the meantime.
+            delay = self._next_deadline - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            if not self.has_pending:
+                continue
+            now = time.monotonic()
+            await self.render()
+            period = 1.0 / self.fps
+            if now - self._next_deadline < period:
+                self._next_deadline += period # On schedule, keep the cadence
+            else:
+                self._next_deadline = now + period # Idle or behind, restart the schedule
@@ -0,0 +1,126 @@
+"""
+Rest mode of the goggles, a small state machine driven by event loop timers.
+
+    STREAMING --no packets for rest_timeout--> IDLE_R --blank_timeout--> BLANK
+        ^                                        |                         |
+        +-------------- next packet -------------+-------------------------+
+
+Packets only record their arrival time, the single timer is re-armed
+lazily: when it fires during streaming it checks the time of the last
+packet and sleeps for the rest of the timeout. So there are no wakeups
+while the goggles are blank, one per rest_timeout while streaming and the
+strip is drawn exactly once per transition (the fade to the R, or the
+blank strip). Going back to STREAMING draws nothing, the packet that ended
+rest mode is already on its way through the renderer.
+
+While an effect runs it owns the strip, transitions still happen but are
+drawn once the effect ends (see EffectScheduler.on_idle). A change of
+the dimmer, gamma or brightness redraws the R (redraw()).
+"""
+import asyncio
+import time
+from constants import r, REST_TIMEOUT, BLANK_TIMEOUT
+
+STREAMING = 'streaming'
+IDLE_R = 'idle_r'
+BLANK = 'blank'
+
+
+class RestMode:
+    """
+    Attributes
+    ----------
+    goggles : LightGoggles
+        The goggles that rest
+    state : str
+        STREAMING, IDLE_R or BLANK
+    rest_timeout : float
+        Seconds without packets before the R is shown
+    blank_timeout : float
+        Seconds the R is shown before the strip goes blank
+    last_packet : float
+        time.monotonic() of the last packet
+    """
+    def __init__(self, goggles, rest_timeout=REST_TIMEOUT, blank_timeout=BLANK_TIMEOUT, state=STREAMING):
+        self.goggles = goggles
+        self.rest_timeout = rest_timeout
+        self.blank_timeout = blank_timeout
+        self.state = state
+        self.last_packet = time.monotonic()
+        self._loop = None
+        self._timer = None
+
+    def start(self):
+        """Arms the first timer, call once the event loop runs."""
+        self._loop = asyncio.get_running_loop()
+        self.last_packet = time.monotonic()
+        self._enter(self.state)
+
+    def stop(self):
+        self._cancel_timer()
+        self._loop = None
+
+    def packet_received(self):
+        # Called for every packet, keep it cheap
+        self.last_packet = time.monotonic()
+        if self.state != STREAMING:
+            self._enter(STREAMING)
+
+    def effect_finished(self):
+        # The effect left its last frame on the strip, draw the current state again
+        if self.state == STREAMING:
+            self._cancel_timer()
+            self._timeout() # Rest right away if the stream stopped while the effect ran
+        else:
+            self._draw()
+
+    def redraw(self):
+        # The dimmer, gamma or brightness changed, show the R again in the new colors
+        if self._loop is None or self.state != IDLE_R:
+            return
+        if self.goggles.effects.running:
+            return # The effect owns the strip
+        if self.goggles.fading():
+            self.goggles.start_fade(r) # Carry on from where the fade got to, towards the new R
+        else:
+            self.goggles.show_R() # No fade, the encoded frame comes from the cache
+
+    def _enter(self, state):
+        self.state = state
+        self._cancel_timer()
+        self.goggles.notify_state({'RestMode': state != STREAMING, 'RestState': state})
+        if state == STREAMING:
+            self._arm(self.last_packet + self.rest_timeout - time.monotonic())
+            return
+        if state == IDLE_R:
+            self._arm(self.blank_timeout)
+        self._draw()
+
+    def _draw(self):
+        if self.goggles.effects.running:
+            return
+        if self.state == IDLE_R:
+            self.goggles.start_fade(r) # Fade current lights before switching
+        elif self.state == BLANK:
+            self.goggles.cancel_fade()
+            self.goggles.strip.clear_strip()
+
+    def _arm(self, delay):
+        if self._loop is not None:
+            self._timer = self._loop.call_later(max(delay, 0), self._timeout)
+
+    def _cancel_timer(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+    def _timeout(self):
+        self._timer = None
+        if self.state == STREAMING:
+            remaining = self.last_packet + self.rest_timeout - time.monotonic()
+            if remaining > 0:
+                self._arm(remaining) # Packets came in since the timer was armed
+            else:
+                self._enter(IDLE_R)
+        elif self.state == IDLE_R:
+            self._enter(BLANK)
@@ -0,0 +1,128 @@
+"""
+SPI transports for the APA102 driver.
+
+A transport is anything with a max_speed_hz attribute, writebytes2(data)
+and close(), the subset of spidev.SpiDev the driver uses.
+
+ - SpiDevTransport talks to the kernel spidev device
+ - SimulatedSpiTransport records transfers and models their wire time,
+   for running and measuring the goggles without hardware
+
+open_transport() picks one by name, the LC8823_SPI_BACKEND environment
+variable overrides the name from the hardware config file (SPI_BACKEND).
+"""
+import os
+import time
+from collections import deque
+from constants import RGB_MAP, SPI_SPEED_HZ
+
+SPI_BACKEND_ENV = 'LC8823_SPI_BACKEND'
+SPI_BACKENDS = ('spidev', 'simulated', 'simulated-realtime')
+
+
+class SpiDevTransport:
+    """The real thing, a kernel spidev device."""
+    def __init__(self, bus, device, max_speed_hz=SPI_SPEED_HZ):
+        import spidev  # Only available (and needed) on the goggles
+        self._spi = spidev.SpiDev(bus, device)
+        self._spi.max_speed_hz = max_speed_hz
+
+    @property
+    def max_speed_hz(self):
+        return self._spi.max_speed_hz
+
+    @max_speed_hz.setter
+    def max_speed_hz(self, max_speed_hz):
+        self._spi.max_speed_hz = max_speed_hz
+
+    def writebytes2(self, data):
+        self._spi.writebytes2(data)
+
+    def close(self):
+        self._spi.close()
+
+
+class SimulatedSpiTransport:
+    """
+    Stand-in for an SPI device that records what would have been sent.
+
+    Every transfer is kept as (start, end, data) with time.monotonic()
+    timestamps, the most recent max_transfers of them. The time a transfer
+    occupies the bus is modelled as 8 bits per byte at max_speed_hz. With
+    realtime set, writebytes2 sleeps for that long, like the blocking
+    ioctl on the device does.
+    """
+    def __init__(self, bus=0, device=0, max_speed_hz=SPI_SPEED_HZ, realtime=False, max_transfers=10000):
+        self.bus = bus
+        self.device = device
+        self.max_speed_hz = max_speed_hz
+        self.realtime = realtime
+        self.transfers = deque(maxlen=max_transfers)
+        self.transfer_count = 0
+        self.bytes_sent = 0
+        self.wire_time = 0.0  # Seconds the bus would have been busy
+        self.closed = False
+
+    def wire_seconds(self, nbytes):
+        return nbytes * 8 / self.max_speed_hz
+
+    def writebytes2(self, data):
+        start = time.monotonic()
+        data = bytes(data)
+        wire_time = self.wire_seconds(len(data))
+        if self.realtime:
+            time.sleep(wire_time)
+        self.transfers.append((start, time.monotonic(), data))
+        self.transfer_count += 1
+        self.bytes_sent += len(data)
+        self.wire_time += wire_time
+
+    def close(self):
+        self.closed = True
+
+    def decode_frames(self, order='rgb'):
+        """The recorded transfers decoded back into frames.
+
+        Returns one list of (red, green, blue, brightness) tuples per frame
+        that was clocked out, oldest first.
+        """
+        return decode_apa102(b''.join(data for _, _, data in self.transfers), order)
+
+
+def decode_apa102(data, order='rgb'):
+    """Splits an APA102 byte stream into frames of (red, green, blue, brightness).
+
+    LED frames start with three 1 bits, start and end frames are zeroes,
+    so every run of LED frames after zeroes is one frame.
+    """
+    rgb = RGB_MAP[order]
+    frames = []
+    i = 0
+    while i < len(data):
+        if data[i] & 0xE0 != 0xE0:
+            i += 1  # Start/end frame
+            continue
+        pixels = []
+        while i + 4 <= len(data) and data[i] & 0xE0 == 0xE0:
+            pixels.append((data[i + rgb[0]], data[i + rgb[1]], data[i + rgb[2]], data[i] & 0x1F))
+            i += 4
+        frames.append(pixels)
+        if i + 4 > len(data):
+            break
+    return frames
+
+
+def open_transport(backend=None, bus=0, device=0, max_speed_hz=SPI_SPEED_HZ):
+    """Opens the transport called backend (see SPI_BACKENDS).
+
+    The LC8823_SPI_BACKEND environment variable wins over backend, the
+    default is the real spidev device.
+    """
+    backend = os.environ.get(SPI_BACKEND_ENV) or backend or 'spidev'
+    if backend == 'spidev':
+        return SpiDevTransport(bus, device, max_speed_hz)
+    if backend == 'simulated':
+        return SimulatedSpiTransport(bus, device, max_speed_hz)
+    if backend == 'simulated-realtime':
+        return SimulatedSpiTransport(bus, device, max_speed_hz, realtime=True)
+    raise ValueError(f"unknown SPI backend {backend}, expected one of {', '.join(SPI_BACKENDS)}")
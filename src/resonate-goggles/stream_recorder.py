@@ -0,0 +1,241 @@
+"""
+Recording and replay of the UDP video stream.
+
+StreamRecorder appends every received datagram to a log file, the
+datagrams are handed to a writer thread so recording never blocks ingest
+or rendering. StreamLog memory maps a log and replay() sends the datagrams
+again with their original timing (or faster), either over UDP to a pair
+of goggles or straight into LightGoggles.handle_datagram.
+
+File layout (little endian):
+
+    offset  size  field
+    0       4     magic, b'LCSR'
+    4       1     version, currently 1
+    5       3     unused
+    8       8     wall clock time the recording started, seconds since the epoch
+
+followed by one record per datagram:
+
+    0       8     nanoseconds since the recording started (monotonic clock)
+    8       2     datagram length n
+    10      n     datagram
+"""
+import argparse
+import asyncio
+import mmap
+import os
+import queue
+import socket
+import struct
+import sys
+import threading
+import time
+from constants import UDP_IP, UDP_PORT
+
+LOG_MAGIC = b'LCSR'
+LOG_VERSION = 1
+LOG_HEADER = struct.Struct('<4sB3xd')  # magic, version, start time
+RECORD_HEADER = struct.Struct('<QH')  # timestamp, length
+MAX_DATAGRAM = 0xFFFF
+
+
+class StreamRecorder:
+    """
+    Appends datagrams to a stream log from a background thread.
+
+    record() only copies the datagram and queues it. When the writer falls
+    behind by more than max_pending datagrams, new ones are counted in
+    dropped instead of growing the queue.
+
+    Attributes
+    ----------
+    path : str
+        The log file
+    recorded, dropped : int
+        Datagrams written and datagrams lost, because the writer was behind
+        or because ingest read more than it could keep (see receive_vid_stream)
+    """
+    def __init__(self, path, max_pending=4096, buffer_size=1 << 16):
+        self.path = path
+        self.recorded = 0
+        self.dropped = 0
+        self._queue = queue.Queue(max_pending)
+        self._file = open(path, 'wb', buffering=buffer_size)
+        self._file.write(LOG_HEADER.pack(LOG_MAGIC, LOG_VERSION, time.time()))
+        self._started = time.monotonic_ns()
+        self._thread = threading.Thread(target=self._write, name='stream-recorder', daemon=True)
+        self._thread.start()
+
+    def record(self, buffer, nbytes):
+        """Queues the first nbytes of buffer, the buffer may be reused right away."""
+        record = RECORD_HEADER.pack(time.monotonic_ns() - self._started, nbytes) + buffer[:nbytes]
+        try:
+            self._queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def _write(self):
+        while True:
+            record = self._queue.get()
+            if record is None:
+                break
+            self._file.write(record)
+            self.recorded += 1
+            if self._queue.empty():
+                self._file.flush()  # Idle, get it on disk
+        self._file.close()
+
+    def close(self):
+        """Writes out what is still queued and closes the log."""
+        if self._thread.is_alive():
+            self._queue.put(None)
+            self._thread.join()
+
+
+def recording_path(directory, name):
+    """Path of the recording called name in directory, which is created if needed.
+
+    name must be a plain file name, anything that could point outside of
+    directory raises ValueError.
+    """
+    if not name or name in ('.', '..') or '/' in name or '\\' in name or '\0' in name:
+        raise ValueError(f"{name!r} is not a valid recording name")
+    os.makedirs(directory, exist_ok=True)
+    return os.path.join(directory, name)
+
+
+class StreamLog:
+    """
+    A stream log, memory mapped for replay.
+
+    Attributes
+    ----------
+    started : float
+        Wall clock time the recording started
+    """
+    def __init__(self, path):
+        self.path = path
+        self._view = None
+        with open(path, 'rb') as f:
+            header = f.read(LOG_HEADER.size)
+            if len(header) < LOG_HEADER.size:
+                raise ValueError(f"{path} is not a stream log")
+            magic, version, self.started = LOG_HEADER.unpack(header)
+            if magic != LOG_MAGIC or version != LOG_VERSION:
+                raise ValueError(f"{path} is not a stream log")
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)  # Stays valid after close
+        self._view = memoryview(self._map)
+
+    def __iter__(self):
+        """(seconds since the start, datagram) per record, the datagram is a view into the file.
+
+        Stops at a truncated last record, as left behind by a recorder that
+        didn't get to close the log.
+        """
+        offset = LOG_HEADER.size
+        end = len(self._view)
+        while offset + RECORD_HEADER.size <= end:
+            timestamp, length = RECORD_HEADER.unpack_from(self._view, offset)
+            offset += RECORD_HEADER.size
+            if offset + length > end:
+                break
+            yield timestamp / 1e9, self._view[offset:offset + length]
+            offset += length
+
+    def close(self):
+        if self._view is not None:
+            self._view.release()
+            self._view = None
+            self._map.close()
+
+
+def udp_sender(host, port):
+    """A replay target that sends the datagrams to host:port."""
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    def send(buffer, nbytes):
+        sock.sendto(memoryview(buffer)[:nbytes], (host, port))
+    return send
+
+
+async def replay(log, target, speed=1.0):
+    """Feeds the datagrams of log to target(buffer, nbytes) on their original schedule.
+
+    speed scales the rate, 2.0 replays twice as fast, 0 as fast as
+    possible. target gets a reused bytearray, like the one
+    LightGoggles.receive_vid_stream passes to handle_datagram.
+    Returns the number of datagrams replayed.
+    """
+    buffer = bytearray(MAX_DATAGRAM)
+    started = time.monotonic()
+    count = 0
+    for timestamp, datagram in log:
+        if speed > 0:
+            delay = started + timestamp / speed - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+        nbytes = len(datagram)
+        buffer[:nbytes] = datagram
+        datagram.release()
+        target(buffer, nbytes)
+        count += 1
+    return count
+
+
+async def record_udp(path, host=UDP_IP, port=UDP_PORT, duration=None):
+    """Records everything sent to host:port, for capturing a show without goggles."""
+    loop = asyncio.get_running_loop()
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.bind((host, port))
+    sock.setblocking(False)
+    recorder = StreamRecorder(path)
+    buffer = bytearray(MAX_DATAGRAM)
+    try:
+        deadline = None if duration is None else loop.time() + duration
+        while deadline is None or loop.time() < deadline:
+            timeout = None if deadline is None else deadline - loop.time()
+            try:
+                nbytes = await asyncio.wait_for(loop.sock_recv_into(sock, buffer), timeout)
+            except asyncio.TimeoutError:
+                break
+            recorder.record(buffer, nbytes)
+    finally:
+        recorder.close()
+        sock.close()
+    return recorder.recorded
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Record and replay the UDP video stream of the goggles.')
+    commands = parser.add_subparsers(dest='command', required=True)
+    record = commands.add_parser('record', help='record the datagrams sent to a UDP port')
+    record.add_argument('log')
+    record.add_argument('--host', default=UDP_IP)
+    record.add_argument('--port', type=int, default=UDP_PORT)
+    record.add_argument('--duration', type=float, help='seconds to record, until interrupted by default')
+    play = commands.add_parser('replay', help='send a recording to a pair of goggles')
+    play.add_argument('log')
+    play.add_argument('--host', default='127.0.0.1')
+    play.add_argument('--port', type=int, default=UDP_PORT)
+    play.add_argument('--speed', type=float, default=1.0, help='replay rate, 0 sends as fast as possible')
+    play.add_argument('--loop', type=int, default=1, help='number of times to replay the log')
+    args = parser.parse_args(argv)
+
+    if args.command == 'record':
+        try:
+            count = asyncio.run(record_udp(args.log, args.host, args.port, args.duration))
+        except KeyboardInterrupt:
+            return
+        print(f"recorded {count} datagrams")
+        return
+    log = StreamLog(args.log)
+    target = udp_sender(args.host, args.port)
+    count = 0
+    for _ in range(args.loop):
+        count += asyncio.run(replay(log, target, args.speed))
+    log.close()
+    print(f"replayed {count} datagrams")
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,106 @@
+"""
+Frame streaming over a websocket, see /goggles/stream in main.py.
+
+Every binary message is one frame packet in the format of frame_protocol.py
+(FORMAT_RGB or FORMAT_PALETTE), the pixels go straight into the pending
+frame of the renderer, like frames received over UDP.
+
+There is never more than one frame queued. Without acknowledgements a frame
+that arrives before the previous one was shown replaces it (counted as
+dropped). With ack=True the session answers every frame with a JSON message
+once it has been sent to the strip, senders wait for it before sending the
+next frame and so run at the speed of the render loop.
+
+A text message "stats" is answered with the statistics of the connection.
+"""
+import asyncio
+import time
+import metrics
+
+ACK_TIMEOUT = 1.0 # Seconds an ack waits for the render loop before it goes out anyway
+
+
+class StreamSession:
+    """
+    One websocket connection streaming frames to the goggles.
+
+    Attributes
+    ----------
+    goggles : LightGoggles
+        The goggles frames are shown on
+    websocket : starlette.websockets.WebSocket
+        Accepted websocket of the connection
+    ack : bool
+        Acknowledge every frame once it has been rendered
+    frames_received, frames_rejected, frames_dropped, frames_acked, bytes_received : int
+        Counters of this connection
+    last_sequence : int
+        Sequence number of the last valid frame
+    """
+    def __init__(self, goggles, websocket, ack=False):
+        self.goggles = goggles
+        self.websocket = websocket
+        self.ack = ack
+        self.connected_at = time.time()
+        self.frames_received = 0
+        self.frames_rejected = 0
+        self.frames_dropped = 0
+        self.frames_acked = 0
+        self.bytes_received = 0
+        self.last_sequence = None
+
+    def stats(self):
+        return {"client": str(self.websocket.client),
+                "ack": self.ack,
+                "connected_seconds": round(time.time() - self.connected_at, 3),
+                "frames_received": self.frames_received,
+                "frames_rejected": self.frames_rejected,
+                "frames_dropped": self.frames_dropped,
+                "frames_acked": self.frames_acked,
+                "bytes_received": self.bytes_received,
+                "last_sequence": self.last_sequence}
+
+    def handle_frame(self, data):
+        """Queues one frame packet, returns its sequence number or None if invalid."""
+        self.frames_received += 1
+        self.bytes_received += len(data)
+        metrics.websocket_frames_received.inc()
+        renderer = self.goggles.renderer
+        replaces = renderer.has_pending # The render loop is behind, the waiting frame is lost
+        sequence = self.goggles.handle_frame(data, len(data))
+        if sequence is None:
+            self.frames_rejected += 1
+            metrics.websocket_frames_rejected.inc()
+            return None
+        if replaces:
+            self.frames_dropped += 1
+        self.last_sequence = sequence
+        return sequence
+
+    async def acknowledge(self, sequence):
+        waiter = self.goggles.renderer.wait_rendered()
+        try:
+            rendered = await asyncio.wait_for(waiter, ACK_TIMEOUT) # False if a newer frame replaced it
+        except asyncio.TimeoutError:
+            rendered = False
+        self.frames_acked += 1
+        await self.websocket.send_json({"ack": sequence, "rendered": rendered,
+                                        "frames_dropped": self.frames_dropped})
+
+    async def run(self):
+        """Handles messages until the client disconnects."""
+        while True:
+            message = await self.websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                return
+            data = message.get("bytes")
+            if data is not None:
+                sequence = self.handle_frame(data)
+                if self.ack:
+                    if sequence is None:
+                        await self.websocket.send_json({"error": "invalid frame",
+                                                        "frames_rejected": self.frames_rejected})
+                    else:
+                        await self.acknowledge(sequence)
+            elif message.get("text") == "stats":
+                await self.websocket.send_json(self.stats())
@@ -0,0 +1,209 @@
+import asyncio
+import threading
+from led_driver import APA102
+
+
+def parse_segments(spec):
+    """Parses SPI_SEGMENTS from the hardware config file.
+
+    The format is a comma separated list of bus.device:num_led, in the
+    order the segments appear in the logical pixel space, e.g.
+    "1.0:122,0.0:60". Returns a list of (bus, device, num_led).
+    """
+    segments = []
+    for part in spec.split(','):
+        part = part.strip()
+        if not part:
+            continue
+        address, num_led = part.split(':')
+        bus, device = address.split('.')
+        segments.append((int(bus), int(device), int(num_led)))
+    return segments
+
+
+class StripGroup:
+    """
+    Several APA102 strips, each on its own SPI device, driven as one strip.
+
+    Pixel 0 to segments[0].num_led - 1 are on the first strip, the next
+    ones on the second strip and so on. The group offers the parts of the
+    APA102 interface used by the goggles, effects and animations, so it can
+    be used wherever a single strip is.
+
+    Every strip gets its own writer thread (start_writer()). show() hands
+    the changed segments to their writers together with one
+    threading.Barrier: the writers wait for each other and then transfer
+    concurrently, so all segments latch together and a refresh takes as
+    long as the largest segment instead of the sum of all of them. Without
+    writer threads show() sends the segments one after the other, like
+    APA102.show() sends on the calling thread.
+
+    The SPI frame and device (_frame, spi) only exist per strip, use
+    strips[i] for those. All strips must use the same channel order.
+    """
+    def __init__(self, strips):
+        if not strips:
+            raise ValueError("a strip group needs at least one strip")
+        if any(strip.rgb != strips[0].rgb for strip in strips):
+            raise ValueError("all strips of a group must use the same channel order")
+        self.strips = list(strips)
+        self.num_led = sum(strip.num_led for strip in self.strips)
+        self.rgb = self.strips[0].rgb
+        self._changed = [] # Strips with a new frame, see update_frame
+        # (strip, first logical pixel) for every segment
+        self._segments = []
+        first = 0
+        for strip in self.strips:
+            self._segments.append((strip, first))
+            first += strip.num_led
+
+    @property
+    def global_brightness(self):
+        return self.strips[0].global_brightness
+
+    @global_brightness.setter
+    def global_brightness(self, global_brightness):
+        self.set_global_brightness(global_brightness)
+
+    def set_global_brightness(self, brightness):
+        for strip in self.strips:
+            strip.set_global_brightness(brightness)
+
+    def set_spi_speed(self, speed_hz):
+        for strip in self.strips:
+            strip.set_spi_speed(speed_hz)
+
+    @property
+    def spi_speed(self):
+        return self.strips[0].spi_speed
+
+    @property
+    def leds(self):
+        """Copy of the pixel buffers of all strips, in logical order."""
+        return b''.join(strip.leds for strip in self.strips)
+
+    @property
+    def frames_skipped(self):
+        return sum(strip.frames_skipped for strip in self.strips)
+
+    def _locate(self, led_num):
+        for strip, first in self._segments:
+            if led_num < first + strip.num_led:
+                return strip, led_num - first
+        return None, None
+
+    def set_pixel(self, led_num, red, green, blue, bright_percent=100):
+        if led_num < 0:
+            return
+        strip, led = self._locate(led_num)
+        if strip is not None:
+            strip.set_pixel(led, red, green, blue, bright_percent)
+
+    def set_pixel_rgb(self, led_num, rgb_color, bright_percent=100):
+        self.set_pixel(led_num, *APA102.split_color(rgb_color), bright_percent)
+
+    def get_pixel(self, led_num):
+        if led_num < 0:
+            return None
+        strip, led = self._locate(led_num)
+        return None if strip is None else strip.get_pixel(led)
+
+    def get_pixel_rgb(self, led_num):
+        strip, led = self._locate(led_num)
+        return None if strip is None else strip.get_pixel_rgb(led)
+
+    def fill(self, rgb, bright_percent=100):
+        for strip in self.strips:
+            strip.fill(rgb, bright_percent)
+
+    def set_range(self, first, last, rgb, bright_percent=100):
+        for strip, offset in self._segments:
+            strip.set_range(first - offset, last - offset, rgb, bright_percent)
+
+    def set_pixels(self, rgb_data, bright_percent=100, first=0):
+        data = memoryview(rgb_data)
+        end = first + len(data) // 3
+        for strip, offset in self._segments:
+            lo = max(first, offset)
+            hi = min(end, offset + strip.num_led)
+            if lo < hi:
+                strip.set_pixels(data[3 * (lo - first):3 * (hi - first)], bright_percent, lo - offset)
+
+    def get_pixels(self):
+        return b''.join(strip.get_pixels() for strip in self.strips)
+
+    def encode_frame(self, rgb_data, bright_percent=100):
+        data = memoryview(rgb_data)
+        return b''.join(strip.encode_frame(data[3 * offset:3 * (offset + strip.num_led)], bright_percent)
+                        for strip, offset in self._segments)
+
+    def load_frame(self, encoded):
+        data = memoryview(encoded)
+        for strip, offset in self._segments:
+            strip.load_frame(data[4 * offset:4 * (offset + strip.num_led)])
+
+    def mark_dirty(self, first=0, last=None):
+        if last is None:
+            last = self.num_led
+        for strip, offset in self._segments:
+            lo = max(first - offset, 0)
+            hi = min(last - offset, strip.num_led)
+            if lo < hi:
+                strip.mark_dirty(lo, hi)
+
+    def rotate(self, positions=1):
+        cutoff = 4 * (positions % self.num_led)
+        leds = self.leds
+        self.load_frame(leds[cutoff:] + leds[:cutoff])
+
+    def clear_strip(self):
+        self.fill((0, 0, 0))
+        self.show()
+
+    def update_frame(self, force=False):
+        """Copies the changed pixels into the SPI frames of the strips.
+
+        Returns False if no segment has anything to send, see APA102.update_frame.
+        """
+        self._changed = [strip for strip in self.strips if strip.update_frame(force)]
+        return bool(self._changed)
+
+    def _barrier(self):
+        return threading.Barrier(len(self._changed)) if len(self._changed) > 1 else None
+
+    def send_frame(self):
+        """Sends the segments changed in the last update_frame(), latching together."""
+        barrier = self._barrier()
+        for strip in self._changed:
+            strip.send_frame(barrier)
+
+    async def send_frame_async(self):
+        barrier = self._barrier()
+        await asyncio.gather(*(strip.send_frame_async(barrier) for strip in self._changed))
+
+    def show(self, force=False):
+        """Sends the changed segments, concurrently if the writer threads run."""
+        if self.update_frame(force):
+            self.send_frame()
+
+    async def show_async(self, force=False):
+        if self.update_frame(force):
+            await self.send_frame_async()
+
+    def start_writer(self):
+        for strip in self.strips:
+            strip.start_writer()
+
+    def stop_writer(self):
+        for strip in self.strips:
+            strip.stop_writer()
+
+    def cleanup(self):
+        for strip in self.strips:
+            strip.cleanup() # Clears the strip itself
+
+    combine_color = staticmethod(APA102.combine_color)
+    split_color = staticmethod(APA102.split_color)
+
+    def wheel(self, wheel_pos):
+        return self.strips[0].wheel(wheel_pos)
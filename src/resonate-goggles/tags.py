@@ -11,4 +11,12 @@ tags_metadata = [
         "name": "Dimmer Control",
         "description": "1 = Max Brightness, 20 = Min Brightness, Defaults to 1",
     },
+    {
+        "name": "Effects",
+        "description": "Start and stop light show effects, video streaming stops them.",
+    },
+    {
+        "name": "Streaming",
+        "description": "Stream frames over the /goggles/stream websocket, see stream_session.py.",
+    },
 ]
\ No newline at end of file
@@ -0,0 +1,106 @@
+import asyncio
+from baked_animation import BAKE_HEADER, BakedAnimation, animation_path, bake
+from effect_scheduler import EffectScheduler, create_effect
+from led_driver import APA102
+from spi_transport import SimulatedSpiTransport
+import pytest
+
+NUM_LED = 12
+
+
+def open_strip(brightness=4):
+    return APA102(NUM_LED, global_brightness=brightness, transport=SimulatedSpiTransport())
+
+
+def live_frames(name, cycles):
+    # What the effect paints, step by step, without running it on the clock
+    strip = open_strip()
+    effect = create_effect(name, strip)
+    strip.fill((0, 0, 0))
+    effect.init(strip, NUM_LED)
+    frames = []
+    for current_cycle in range(cycles):
+        for current_step in range(effect.num_steps_per_cycle):
+            effect.update(strip, NUM_LED, effect.num_steps_per_cycle, current_step, current_cycle)
+            frames.append(bytes(strip.leds))
+    return frames
+
+
+@pytest.mark.parametrize('name, cycles', [('strandtest', 3), ('rainbow', 1), ('roundandround', 1)])
+def test_bake_holds_a_full_period(tmp_path, name, cycles):
+    path = str(tmp_path / 'effect.lcba')
+    strip = open_strip()
+    bake(create_effect(name, strip), path)
+    animation = BakedAnimation(path)
+    try:
+        frames = live_frames(name, cycles)
+        assert animation.frame_count == len(frames)
+        assert [bytes(animation.frame(index)) for index in range(animation.frame_count)] == frames
+        assert animation.brightness == 4
+    finally:
+        animation.close()
+
+
+def test_baked_strandtest_goes_through_red_green_and_blue(tmp_path):
+    path = str(tmp_path / 'strandtest.lcba')
+    bake(create_effect('strandtest', open_strip()), path)
+    animation = BakedAnimation(path)
+    try:
+        colors = set()
+        for index in range(animation.frame_count):
+            frame = bytes(animation.frame(index))
+            colors.update((frame[i + 3], frame[i + 2], frame[i + 1]) for i in range(0, len(frame), 4))
+        assert {(255, 0, 0), (0, 255, 0), (0, 0, 255)} <= colors
+    finally:
+        animation.close()
+
+
+def test_play_file_on_the_scheduler(tmp_path):
+    path = str(tmp_path / 'rainbow.lcba')
+    strip = open_strip()
+    bake(create_effect('rainbow', strip), path, fps=1000)
+
+    async def main():
+        scheduler = EffectScheduler(strip)
+        task = scheduler.play_file(path, num_cycles=2)
+        assert scheduler.current == 'rainbow.lcba'
+        await task
+        assert scheduler.current is None
+
+    try:
+        asyncio.run(main())
+        assert len(strip.spi.decode_frames()) == 2 * 255
+    finally:
+        strip.stop_writer()
+
+
+def test_check_rejects_other_strips(tmp_path):
+    path = str(tmp_path / 'rainbow.lcba')
+    bake(create_effect('rainbow', open_strip()), path)
+    animation = BakedAnimation(path)
+    try:
+        animation.check(open_strip())
+        with pytest.raises(ValueError, match='brightness'):
+            animation.check(open_strip(brightness=31))
+        with pytest.raises(ValueError):
+            animation.check(APA102(NUM_LED + 1, global_brightness=4, transport=SimulatedSpiTransport()))
+    finally:
+        animation.close()
+    with pytest.raises(ValueError):
+        EffectScheduler(open_strip(brightness=31)).play_file(path)
+
+
+def test_old_and_truncated_files(tmp_path):
+    path = tmp_path / 'old.lcba'
+    path.write_bytes(BAKE_HEADER.pack(b'LCBA', 1, 0, 60, 1, NUM_LED, b'rgb') + bytes(4 * NUM_LED))
+    with pytest.raises(ValueError, match='bake it again'):
+        BakedAnimation(str(path))
+    path.write_bytes(BAKE_HEADER.pack(b'LCBA', 2, 4, 60, 2, NUM_LED, b'rgb') + bytes(4 * NUM_LED))
+    with pytest.raises(ValueError, match='truncated'):
+        BakedAnimation(str(path))
+
+
+@pytest.mark.parametrize('name', ['', '..', '../rainbow.lcba', '/tmp/rainbow.lcba'])
+def test_animation_path_stays_in_the_directory(tmp_path, name):
+    with pytest.raises(ValueError):
+        animation_path(str(tmp_path), name)
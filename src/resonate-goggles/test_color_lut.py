@@ -0,0 +1,39 @@
+from color_lut import IDENTITY_LUT, build_color_lut, compose_luts, dimmer_lut, gamma_lut
+import pytest
+
+
+def test_identity():
+    assert dimmer_lut(1) == IDENTITY_LUT
+    assert gamma_lut(1.0) == IDENTITY_LUT
+    assert build_color_lut() == IDENTITY_LUT
+
+
+def test_dimmer():
+    lut = dimmer_lut(4)
+    assert len(lut) == 256
+    assert (lut[0], lut[3], lut[4], lut[255]) == (0, 0, 1, 63)
+
+
+def test_gamma():
+    lut = gamma_lut(2.0)
+    assert (lut[0], lut[128], lut[255]) == (0, 64, 255)
+    assert list(lut) == sorted(lut)
+
+
+def test_compose_applies_first_then_second():
+    first, second = dimmer_lut(2), gamma_lut(2.0)
+    lut = compose_luts(first, second)
+    for value in (0, 17, 128, 255):
+        assert lut[value] == second[first[value]]
+
+
+def test_color_lut_is_dimmer_then_gamma():
+    assert build_color_lut(3, 2.2) == compose_luts(dimmer_lut(3), gamma_lut(2.2))
+    assert bytes([200, 100, 0]).translate(build_color_lut(2)) == bytes([100, 50, 0])
+
+
+def test_invalid_values():
+    with pytest.raises(ValueError):
+        dimmer_lut(0)
+    with pytest.raises(ValueError):
+        gamma_lut(0)
@@ -0,0 +1,78 @@
+import asyncio
+from effect_scheduler import EffectScheduler
+from led_driver import APA102
+from spi_transport import SimulatedSpiTransport
+import pytest
+
+NUM_LED = 4
+
+
+def run_scheduler(test):
+    async def main():
+        strip = APA102(NUM_LED, transport=SimulatedSpiTransport())
+        scheduler = EffectScheduler(strip, fps=1000)
+        events = []
+        scheduler.on_change = lambda name: events.append(('change', name))
+        scheduler.on_idle = lambda: events.append(('idle',))
+        try:
+            await test(scheduler, events)
+        finally:
+            strip.stop_writer()
+
+    asyncio.run(main())
+
+
+def test_effect_runs_to_the_end():
+    async def test(scheduler, events):
+        task = scheduler.start('roundandround', num_cycles=1)
+        assert scheduler.running and scheduler.current == 'roundandround'
+        await task
+        assert not scheduler.running and scheduler.current is None
+        assert events == [('change', 'roundandround'), ('change', None), ('idle',)]
+
+    run_scheduler(test)
+
+
+def test_start_replaces_the_running_effect():
+    async def test(scheduler, events):
+        first = scheduler.start('rainbow')
+        second = scheduler.start('theaterchase')
+        await asyncio.sleep(0)
+        assert first.cancelled() and not second.done()
+        assert scheduler.current == 'theaterchase'
+        assert events == [('change', 'rainbow'), ('change', 'theaterchase')]  # No idle in between
+        scheduler.stop()
+
+    run_scheduler(test)
+
+
+def test_preempt_stops_without_idle():
+    async def test(scheduler, events):
+        task = scheduler.start('rainbow')
+        await asyncio.sleep(0.01)
+        scheduler.preempt()
+        await asyncio.sleep(0)
+        assert task.cancelled() and not scheduler.running
+        assert events == [('change', 'rainbow'), ('change', None)]  # Video owns the strip now
+
+    run_scheduler(test)
+
+
+def test_stop_hands_the_strip_back():
+    async def test(scheduler, events):
+        scheduler.start('rainbow')
+        scheduler.stop()
+        assert events == [('change', 'rainbow'), ('change', None), ('idle',)]
+        scheduler.stop()  # Nothing runs, nothing to tell
+        assert len(events) == 3
+
+    run_scheduler(test)
+
+
+def test_unknown_effect():
+    async def test(scheduler, events):
+        with pytest.raises(KeyError):
+            scheduler.start('disco')
+        assert not events
+
+    run_scheduler(test)
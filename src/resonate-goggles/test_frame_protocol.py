@@ -0,0 +1,85 @@
+from frame_protocol import (FORMAT_PALETTE, FRAME_HEADER, find_legacy_color, is_frame_packet,
+                            pack_frame, pack_palette_frame, parse_frame)
+import pytest
+
+NUM_LED = 4
+
+
+def parse(packet, target):
+    return parse_frame(bytearray(packet), len(packet), target)
+
+
+def test_rgb_round_trip():
+    pixels = bytes(range(3 * NUM_LED))
+    packet = pack_frame(7, pixels)
+    assert is_frame_packet(packet, len(packet))
+    target = bytearray(3 * NUM_LED)
+    assert parse(packet, target) == (7, 3 * NUM_LED)
+    assert target == pixels
+
+
+def test_sequence_wraps_to_32_bits():
+    packet = pack_frame(2 ** 32 + 5, bytes(3))
+    assert parse(packet, bytearray(3)) == (5, 3)
+
+
+def test_short_frame_keeps_the_old_pixels():
+    target = bytearray([9]) * (3 * NUM_LED)
+    assert parse(pack_frame(1, bytes([1, 2, 3])), target) == (1, 3)
+    assert target == bytes([1, 2, 3]) + bytes([9]) * (3 * NUM_LED - 3)
+
+
+def test_long_frame_is_cut_to_the_target():
+    target = bytearray(3 * NUM_LED)
+    assert parse(pack_frame(1, bytes([5]) * (6 * NUM_LED)), target) == (1, 3 * NUM_LED)
+    assert target == bytes([5]) * (3 * NUM_LED)
+
+
+def test_invalid_packets():
+    target = bytearray(3 * NUM_LED)
+    packet = pack_frame(1, bytes(3 * NUM_LED))
+    assert parse(packet[:FRAME_HEADER.size - 1], target) is None
+    assert parse(packet[:-1], target) is None  # Truncated pixels
+    assert parse(b'XX' + packet[2:], target) is None
+    assert parse(packet[:2] + b'\x02' + packet[3:], target) is None  # Unknown version
+    assert parse(packet[:3] + b'\x07' + packet[4:], target) is None  # Unknown pixel format
+    assert not is_frame_packet(b'1\n2\n3\nabc\n', 10)
+
+
+def test_palette_frame():
+    palette = bytes([10, 20, 30, 40, 50, 60])
+    packet = pack_palette_frame(3, palette, [1, 0, 1, 5])
+    assert packet[3] == FORMAT_PALETTE
+    target = bytearray([9]) * (3 * NUM_LED)
+    assert parse(packet, target) == (3, 3 * NUM_LED)
+    assert target == bytes([40, 50, 60, 10, 20, 30, 40, 50, 60, 0, 0, 0])  # Index 5 is past the palette
+
+
+def test_palette_with_256_entries():
+    palette = bytes(value % 256 for value in range(3 * 256))
+    packet = pack_palette_frame(1, palette, [255, 0])
+    assert packet[FRAME_HEADER.size] == 0  # 0 means 256
+    target = bytearray(6)
+    assert parse(packet, target) == (1, 6)
+    assert target == palette[-3:] + palette[:3]
+
+
+def test_truncated_palette_frame():
+    packet = pack_palette_frame(1, bytes(6), [0, 1, 0, 1])
+    assert parse(packet[:-1], bytearray(3 * NUM_LED)) is None
+    assert parse(packet[:FRAME_HEADER.size + 4], bytearray(3 * NUM_LED)) is None
+
+
+def test_palette_size_is_checked():
+    with pytest.raises(ValueError):
+        pack_palette_frame(1, b'', [0])
+    with pytest.raises(ValueError):
+        pack_palette_frame(1, bytes(3 * 257), [0])
+
+
+def test_legacy_color():
+    packet = b'a\nb\nc\n\x01\x02\x03\n'
+    assert find_legacy_color(packet, len(packet)) == 6
+    assert find_legacy_color(b'a\nb\nc\n\x01\x02\x03', 9) == 6  # No newline at the end
+    assert find_legacy_color(b'a\nb\nc\n\x01\x02\n', 9) == -1  # Too short
+    assert find_legacy_color(b'a\nb\n', 4) == -1
@@ -0,0 +1,47 @@
+from goggle_light_show_templates import rainbow_frame, theater_chase_frame, wheel_frame
+from led_driver import APA102
+from spi_transport import SimulatedSpiTransport
+import pytest
+
+NUM_LED = 20
+
+
+@pytest.fixture
+def strip():
+    strip = APA102(NUM_LED, transport=SimulatedSpiTransport())
+    yield strip
+    strip.stop_writer()
+
+
+def wheel_rgb(strip, wheel_pos):
+    return bytes(strip.split_color(strip.wheel(wheel_pos)))
+
+
+def test_wheel_frame_matches_wheel(strip):
+    positions = bytes(range(255))
+    assert wheel_frame(positions) == b''.join(wheel_rgb(strip, pos) for pos in positions)
+    shifted = bytes((pos + 100) % 255 for pos in positions)
+    assert wheel_frame(positions, 100) == wheel_frame(shifted)
+    assert wheel_frame(positions, -155) == wheel_frame(shifted)
+
+
+def test_rainbow_frame_is_within_one_wheel_position(strip):
+    # The per pixel calculation the kernel replaced
+    for num_steps_per_cycle, current_step in ((255, 0), (255, 17), (100, 99), (7, 3)):
+        frame = rainbow_frame(NUM_LED, num_steps_per_cycle, current_step)
+        start_index = 255 / num_steps_per_cycle * current_step
+        for i in range(NUM_LED):
+            position = int(round(start_index + i * 255 / NUM_LED, 0)) % 255
+            assert frame[3 * i:3 * i + 3] in [wheel_rgb(strip, (position + offset) % 255) for offset in (-1, 0, 1)]
+
+
+def test_theater_chase_frame_matches_per_pixel(strip):
+    rgb = bytes([10, 20, 30])
+    for start_index in range(7):
+        expected = b''.join(bytes(3) if (pixel + start_index) % 7 in (0, 1) else rgb for pixel in range(NUM_LED))
+        assert theater_chase_frame(NUM_LED, rgb, start_index) == expected
+
+
+def test_wheel_is_clamped(strip):
+    assert strip.wheel(-20) == strip.wheel(0)
+    assert strip.wheel(300) == strip.wheel(255)
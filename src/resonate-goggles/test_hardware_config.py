@@ -0,0 +1,79 @@
+import asyncio
+import os
+from hardware_config import HardwareConfigStore, live_settings, parse_config, serialize_config
+import pytest
+
+
+def test_parse_config():
+    text = "# Goggles\nSPI_SPEED=150000\n\n  GAMMA = 2.2 \nbroken line\nLOCAL_SOCKET=\n"
+    assert parse_config(text) == {'SPI_SPEED': '150000', 'GAMMA': '2.2', 'LOCAL_SOCKET': ''}
+
+
+def test_serialize_round_trip():
+    options = {'SPI_SPEED': '150000', 'DIMMER_LEVEL': '2', 'SPI_BACKEND': 'simulated'}
+    assert serialize_config(options) == "SPI_SPEED=150000\nDIMMER_LEVEL=2\nSPI_BACKEND=simulated\n"
+    assert parse_config(serialize_config(options)) == options
+
+
+def test_live_settings():
+    options = {'SPI_SPEED': '150000', 'LED_BRIGHTNESS': '31', 'GAMMA': '2.2', 'REST_TIMEOUT': '0.5', 'SPI_BACKEND': 'simulated'}
+    assert live_settings(options) == {'SPI_SPEED': 150000, 'LED_BRIGHTNESS': 31, 'GAMMA': 2.2, 'REST_TIMEOUT': 0.5}
+
+
+@pytest.mark.parametrize('key, value', [('SPI_SPEED', '0'), ('LED_BRIGHTNESS', '32'), ('LED_BRIGHTNESS', '-1'),
+                                        ('DIMMER_LEVEL', '0'), ('GAMMA', '0'), ('REST_TIMEOUT', '0'), ('BLANK_TIMEOUT', '-1'),
+                                        ('DIMMER_LEVEL', 'bright')])
+def test_live_settings_rejects(key, value):
+    with pytest.raises(ValueError):
+        live_settings({'SPI_SPEED': '150000', key: value})
+
+
+def test_missing_file_reads_empty(tmp_path):
+    assert HardwareConfigStore(str(tmp_path / 'lc8823-demo')).read() == {}
+
+
+def test_write_notifies_and_writes_the_file(tmp_path):
+    path = tmp_path / 'lc8823-demo'
+    store = HardwareConfigStore(str(path))
+    seen = []
+    store.add_listener(seen.append)
+    asyncio.run(store.write({'DIMMER_LEVEL': 2}))
+    assert seen == [{'DIMMER_LEVEL': '2'}]
+    assert path.read_text() == "DIMMER_LEVEL=2\n"
+    asyncio.run(store.write({'DIMMER_LEVEL': '2'}))  # Unchanged
+    assert len(seen) == 1
+    assert store.read() == {'DIMMER_LEVEL': '2'}  # Our own write is not reloaded
+
+
+def test_edits_to_the_file_are_picked_up(tmp_path):
+    path = tmp_path / 'lc8823-demo'
+    path.write_text("DIMMER_LEVEL=2\n")
+    store = HardwareConfigStore(str(path))
+    seen = []
+    store.add_listener(seen.append)
+    assert store.read() == {'DIMMER_LEVEL': '2'}
+    assert seen == []  # The first read is not a change
+    path.write_text("DIMMER_LEVEL=3\n")
+    os.utime(path, ns=(0, os.stat(path).st_mtime_ns + 1))
+    assert store.read() == {'DIMMER_LEVEL': '3'}
+    assert seen == [{'DIMMER_LEVEL': '3'}]
+
+
+def test_file_created_after_startup_is_applied(tmp_path):
+    path = tmp_path / 'lc8823-demo'
+    store = HardwareConfigStore(str(path))
+    seen = []
+    store.add_listener(seen.append)
+    assert store.read() == {}
+    path.write_text("DIMMER_LEVEL=3\n")
+    assert store.read() == {'DIMMER_LEVEL': '3'}
+    assert seen == [{'DIMMER_LEVEL': '3'}]
+
+
+def test_failing_listener_does_not_stop_the_others(tmp_path):
+    store = HardwareConfigStore(str(tmp_path / 'lc8823-demo'))
+    seen = []
+    store.add_listener(live_settings)  # Raises ValueError
+    store.add_listener(seen.append)
+    asyncio.run(store.write({'DIMMER_LEVEL': '0'}))
+    assert seen == [{'DIMMER_LEVEL': '0'}]
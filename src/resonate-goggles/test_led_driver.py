@@ -0,0 +1,93 @@
+import threading
+from led_driver import APA102, SpiWriter
+from spi_transport import SimulatedSpiTransport
+import pytest
+
+NUM_LED = 4
+
+
+@pytest.fixture
+def strip():
+    strip = APA102(NUM_LED, global_brightness=31, refresh_interval=3600, transport=SimulatedSpiTransport())
+    yield strip
+    strip.stop_writer()
+
+
+def shown(strip):
+    return strip.spi.decode_frames()
+
+
+def test_writer_thread(strip):
+    strip.start_writer()
+    strip.fill((4, 5, 6))
+    strip.show()
+    strip._writer.flush(1.0)
+    assert shown(strip) == [[(4, 5, 6, 31)] * NUM_LED]
+
+
+def test_waiting_frame_is_replaced():
+    sent = []
+    writer = SpiWriter(lambda frame: sent.append(bytes(frame)), 2)
+    writer.submit(b'\x01\x01')  # Not started, the first frame is still waiting
+    writer.submit(b'\x02\x02')
+    writer.start()
+    writer.stop()
+    assert sent == [b'\x02\x02']
+    assert (writer.frames_written, writer.frames_replaced) == (1, 1)
+
+
+def test_send_error_goes_to_the_callback_and_the_thread_carries_on():
+    def send(frame):
+        if frame[0] == 1:
+            raise OSError("SPI gone")
+        sent.append(bytes(frame))
+
+    sent, errors = [], []
+    done = threading.Event()
+    writer = SpiWriter(send, 1)
+    writer.start()
+    try:
+        writer.submit(b'\x01', callback=errors.append)
+        writer.flush(1.0)
+        writer.submit(b'\x02', callback=lambda error: done.set())
+        assert done.wait(1.0)
+    finally:
+        writer.stop()
+    assert [str(error) for error in errors] == ["SPI gone"]
+    assert sent == [b'\x02']
+
+
+def test_show_sends_the_pixels(strip):
+    strip.set_pixels(bytes([1, 2, 3]) * NUM_LED)
+    strip.show()
+    assert shown(strip) == [[(1, 2, 3, 31)] * NUM_LED]
+
+
+def test_unchanged_frame_is_skipped(strip):
+    strip.fill((5, 6, 7))
+    assert strip.update_frame()
+    strip.fill((5, 6, 7))  # Same value again, dirty but not changed
+    assert not strip.update_frame()
+    assert not strip.update_frame()
+    assert strip.frames_skipped == 2
+    assert strip.update_frame(force=True)
+
+
+def test_only_the_dirty_range_is_copied(strip):
+    strip.fill((5, 6, 7))
+    strip.show()
+    strip.leds[0:4] = strip.encode_pixel((9, 9, 9))  # Not marked dirty
+    strip.set_pixel(2, 1, 1, 1)
+    strip.show()
+    assert shown(strip)[-1] == [(5, 6, 7, 31), (5, 6, 7, 31), (1, 1, 1, 31), (5, 6, 7, 31)]
+    strip.mark_dirty(0, 1)
+    strip.show()
+    assert shown(strip)[-1][0] == (9, 9, 9, 31)
+
+
+def test_refresh_interval_resends(strip):
+    strip.refresh_interval = 0
+    strip.fill((1, 1, 1))
+    strip.show()
+    strip.show()
+    assert strip.spi.transfer_count == 2
@@ -0,0 +1,127 @@
+import asyncio
+import socket
+import metrics
+from constants import UDP_BATCH
+from frame_protocol import pack_frame
+from led_driver import APA102
+from light_goggles import LightGoggles
+from spi_transport import SimulatedSpiTransport
+import pytest
+
+NUM_LED = 4
+
+
+@pytest.fixture
+def goggles():
+    strip = APA102(NUM_LED, transport=SimulatedSpiTransport())
+    yield LightGoggles(strip, None, rest_mode=True)
+    strip.stop_writer()
+
+
+def datagram(goggles, packet):
+    return goggles.handle_datagram(bytearray(packet), len(packet))
+
+
+def test_frame_ends_rest_mode(goggles):
+    assert datagram(goggles, pack_frame(5, bytes([1]) * (3 * NUM_LED)))
+    assert not goggles.rest_mode
+    assert goggles.last_sequence == 5
+    assert goggles.renderer.has_pending
+
+
+@pytest.mark.parametrize('packet', [pack_frame(5, bytes(3 * NUM_LED))[:-1],  # Truncated
+                                    b'LG\x02' + pack_frame(5, bytes(3))[3:],  # Unknown version
+                                    b'a\nb\n',  # Legacy packet without a color
+                                    b'a\nb\nc\n\x01\n'])
+def test_invalid_packets_are_no_activity(goggles, packet):
+    communication = goggles.last_received_socket_communication
+    assert not datagram(goggles, packet)
+    assert goggles.rest_mode
+    assert not goggles.renderer.has_pending
+    assert goggles.last_received_socket_communication == communication
+
+
+def test_legacy_packet_shows_one_color(goggles):
+    assert datagram(goggles, b'a\nb\nc\n\x01\x02\x03\n')
+    assert not goggles.rest_mode
+    assert goggles.renderer.pending == bytes([1, 2, 3]) * NUM_LED
+
+
+def test_fade_starts_from_the_strip_and_is_not_streamed(goggles):
+    async def main():
+        goggles.strip.fill((200, 0, 0))  # Left behind by an effect
+        goggles.strip.show()
+        await goggles.start_fade(bytes([0, 0, 100]) * NUM_LED, duration=0.05)
+
+    asyncio.run(main())
+    frames = [[pixel[:3] for pixel in frame] for frame in goggles.strip.spi.decode_frames()]
+    assert frames[0] == [(200, 0, 0)] * NUM_LED
+    assert frames[1][0][0] > 150  # The fade starts from there, no jump to the last streamed frame
+    assert frames[-1] == [(0, 0, 100)] * NUM_LED
+    renderer = goggles.renderer
+    assert (renderer.frames_submitted, renderer.frames_rendered, renderer.frames_dropped) == (0, 0, 0)
+
+
+def test_detached_recorder_gets_no_more_datagrams(goggles, tmp_path):
+    goggles.start_recording(str(tmp_path / 'show.lcsr'))
+    recorder = goggles.detach_recorder()
+    assert goggles.recorder is None  # Ingest checks this for every batch
+    recorder.close()
+    assert goggles.detach_recorder() is None
+
+
+class ListRecorder:
+    def __init__(self):
+        self.packets = []
+        self.dropped = 0
+
+    def record(self, buffer, nbytes):
+        self.packets.append(bytes(buffer[:nbytes]))
+
+
+def receive(goggles, packets):
+    sender = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    for packet in packets:  # Queued before the listener runs, as after a stall
+        sender.sendto(packet, goggles.sock.getsockname())
+    sender.close()
+
+    async def main():
+        listener = asyncio.get_running_loop().create_task(goggles.receive_vid_stream())
+        for _ in range(100):
+            await asyncio.sleep(0.01)
+            if goggles.renderer.has_pending:
+                break
+        listener.cancel()
+
+    asyncio.run(main())
+
+
+@pytest.fixture
+def udp_goggles():
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.bind(('127.0.0.1', 0))
+    sock.setblocking(False)
+    strip = APA102(NUM_LED, transport=SimulatedSpiTransport())
+    yield LightGoggles(strip, sock, rest_mode=True)
+    strip.stop_writer()
+    sock.close()
+
+
+def test_queued_datagrams_show_only_the_newest(udp_goggles):
+    packets = [pack_frame(sequence, bytes([sequence]) * (3 * NUM_LED)) for sequence in range(UDP_BATCH + 3)]
+    recorder = udp_goggles.recorder = ListRecorder()
+    superseded = metrics.udp_packets_superseded.value
+    receive(udp_goggles, packets)
+    assert udp_goggles.last_sequence == UDP_BATCH + 2
+    assert udp_goggles.renderer.pending == bytes([UDP_BATCH + 2]) * (3 * NUM_LED)
+    assert udp_goggles.renderer.frames_submitted == 1  # The older ones were never parsed
+    assert metrics.udp_packets_superseded.value - superseded == UDP_BATCH + 2
+    # The recorder gets what the ring still held, in order, and counts what was overwritten
+    assert recorder.packets == packets[3:]
+    assert recorder.dropped == 3
+
+
+def test_invalid_newest_datagram_falls_back_to_the_one_before(udp_goggles):
+    receive(udp_goggles, [pack_frame(7, bytes([7]) * (3 * NUM_LED)), b'LG\x02 garbage'])
+    assert udp_goggles.last_sequence == 7
+    assert udp_goggles.renderer.frames_submitted == 1
@@ -0,0 +1,97 @@
+import os
+import pytest
+from multiprocessing import resource_tracker
+from local_ingest import FrameRing, LocalRingWriter, RING_SLOTS, open_doorbell
+
+NUM_LED = 4
+
+
+@pytest.fixture
+def ring():
+    ring = FrameRing(NUM_LED)
+    yield ring
+    ring.close()
+    ring.unlink()
+
+
+def publish(ring, value, sequence):
+    buffer = ring.frame_buffer()
+    buffer[:] = bytes([value]) * (3 * NUM_LED)
+    buffer.release()
+    ring.publish(sequence)
+
+
+def test_take_without_new_frame(ring):
+    target = bytearray(3 * NUM_LED)
+    assert ring.take(0, target) is None
+    publish(ring, 1, 100)
+    assert ring.take(1, target) is None
+
+
+def test_take_returns_the_newest_frame(ring):
+    target = bytearray(3 * NUM_LED)
+    for value in range(1, 4):
+        publish(ring, value, 100 + value)
+    assert ring.take(0, target) == (3, 103)
+    assert target == bytes([3]) * (3 * NUM_LED)
+
+
+def test_wrap_around(ring):
+    target = bytearray(3 * NUM_LED)
+    taken = 0
+    for value in range(1, 3 * RING_SLOTS + 2):
+        publish(ring, value, value)
+        taken, sequence = ring.take(taken, target)
+        assert (taken, sequence) == (value, value)
+        assert target == bytes([value]) * (3 * NUM_LED)
+
+
+class OverrunTarget(bytearray):
+    # Lets the producer go around the ring while the first frame is copied
+    def __init__(self, ring):
+        super().__init__(3 * NUM_LED)
+        self.ring = ring
+        self.copies = 0
+
+    def __setitem__(self, index, value):
+        super().__setitem__(index, value)
+        self.copies += 1
+        if self.copies == 1:
+            for value in range(RING_SLOTS):
+                publish(self.ring, 50 + value, 50 + value)
+
+
+def test_take_retries_after_overrun(ring):
+    publish(ring, 1, 1)
+    target = OverrunTarget(ring)
+    assert ring.take(0, target) == (1 + RING_SLOTS, 50 + RING_SLOTS - 1)
+    assert target.copies == 2
+    assert target == bytes([50 + RING_SLOTS - 1]) * (3 * NUM_LED)
+
+
+def test_short_push_keeps_the_previous_pixels(ring):
+    read_fd, write_fd = open_doorbell()
+    writer = LocalRingWriter(ring, write_fd)
+    try:
+        writer.push(bytes([7]) * (3 * NUM_LED), 1)
+        for sequence in range(2, RING_SLOTS + 2):
+            writer.push(bytes([sequence]) * 3, sequence) # Only the first pixel
+        target = bytearray(3 * NUM_LED)
+        assert ring.take(0, target) == (RING_SLOTS + 1, RING_SLOTS + 1)
+        assert target == bytes([RING_SLOTS + 1]) * 3 + bytes([7]) * (3 * NUM_LED - 3)
+    finally:
+        os.close(read_fd)
+        if write_fd != read_fd:
+            os.close(write_fd)
+
+
+def test_attached_ring_is_left_to_the_goggles(ring, monkeypatch):
+    tracked = set()
+    monkeypatch.setattr(resource_tracker, 'register', lambda name, rtype: tracked.add(name))
+    monkeypatch.setattr(resource_tracker, 'unregister', lambda name, rtype: tracked.discard(name))
+    producer = FrameRing(name=ring.name)
+    try:
+        assert (producer.num_led, producer.slots) == (NUM_LED, RING_SLOTS)
+        assert not tracked  # Its tracker would unlink the ring when the producer exits
+    finally:
+        producer.close()
@@ -0,0 +1,56 @@
+from metrics import Histogram, Registry
+
+
+def test_render():
+    registry = Registry()
+    counter = registry.counter('frames_total', 'Frames shown')
+    value = [0.5]
+    registry.gauge('level', 'Current level', lambda: value[0])
+    counter.inc()
+    counter.inc(2)
+    value[0] = 0.25  # Read when rendered
+    assert registry.render() == ('# HELP frames_total Frames shown\n'
+                                 '# TYPE frames_total counter\n'
+                                 'frames_total 3\n'
+                                 '# HELP level Current level\n'
+                                 '# TYPE level gauge\n'
+                                 'level 0.25\n')
+
+
+def test_histogram_buckets_are_cumulative():
+    histogram = Histogram('seconds', 'Time', buckets=(0.1, 1.0))
+    for value in (0.05, 0.1, 0.5, 2.0):
+        histogram.observe(value)
+    lines = []
+    histogram.render(lines)
+    assert lines[2:7] == ['seconds_bucket{le="0.1"} 2', 'seconds_bucket{le="1.0"} 3', 'seconds_bucket{le="+Inf"} 4',
+                          'seconds_sum 2.65', 'seconds_count 4']
+
+
+def test_recent_quantiles_only_use_the_ring():
+    histogram = Histogram('seconds', 'Time', ring_size=4)
+    assert histogram.recent_quantile(0.5) == 0.0
+    for value in (9.0, 9.0, 1.0, 2.0, 3.0, 4.0):  # The 9s were overwritten
+        histogram.observe(value)
+    assert (histogram.recent_quantile(0.5), histogram.recent_quantile(0.99)) == (3.0, 4.0)
+    assert histogram.count == 6
+
+
+def test_merged_adds_the_other_process():
+    ours, theirs = Registry(), Registry()
+    for registry in (ours, theirs):
+        registry.counter('frames_total', 'Frames')
+        registry.gauge('up', 'Up', lambda: 1)
+        registry.histogram('seconds', 'Time', buckets=(0.1, 1.0))
+    ours.metrics[0].inc(2)
+    theirs.metrics[0].inc(5)
+    theirs.metrics[2].observe(0.05)
+    theirs.metrics[2].observe(0.5)
+    snapshot = theirs.snapshot_struct().unpack(theirs.snapshot_struct().pack(*theirs.snapshot()))
+    merged = ours.merged(snapshot)
+    counter, gauge, histogram = merged.metrics
+    assert counter.value == 7
+    assert gauge is ours.metrics[1]  # Read where it was registered
+    assert (list(histogram.counts), histogram.count, histogram.sum) == ([1, 1, 0], 2, 0.55)
+    assert histogram.recent_quantile(0.9) == 0.5
+    assert ours.metrics[0].value == 2  # Merging doesn't change ours
@@ -0,0 +1,147 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+import metrics
+import render_process
+from frame_protocol import pack_frame
+from render_process import RING_SLOTS, SEQ, STATUS, TEXT_SIZE, SharedGoggles
+import pytest
+
+NUM_LED = 4
+
+
+@pytest.fixture
+def shared():
+    shared = SharedGoggles(NUM_LED)
+    yield shared
+    shared.close()
+    shared.unlink()
+
+
+def push(shared, value, sequence, pixels=NUM_LED):
+    packet = bytearray(pack_frame(sequence, bytes([value]) * (3 * pixels)))
+    return shared.push_frame(packet, len(packet))
+
+
+def test_settings_round_trip(shared):
+    shared.write_settings(31, 2, 2.2, 150000, 1.0, 300.0)  # RenderProcessProxy writes them before the render process starts
+    version, settings = shared.read_settings()
+    assert settings == (31, 2, 2.2, 150000, 1.0, 300.0)
+    shared.write_settings(31, 3, 2.2, 150000, 1.0, 300.0)
+    new_version, settings = shared.read_settings()
+    assert new_version != version
+    assert settings[1] == 3
+
+
+def test_command_round_trip(shared):
+    assert shared.read_command() == (0, 0, 0, '')
+    shared.write_command(3, 1, 5, 'rainbow')
+    assert shared.read_command() == (3, 1, 5, 'rainbow')
+
+
+def test_too_long_command_text_is_rejected(shared):
+    shared.write_command(3, 1, 5, 'rainbow')
+    with pytest.raises(ValueError):
+        shared.write_command(4, 5, 0, '/' + 'a' * TEXT_SIZE)
+    assert shared.read_command() == (3, 1, 5, 'rainbow')
+    path = '/' + 'a' * (TEXT_SIZE - 1)
+    shared.write_command(4, 5, 0, path)
+    assert shared.read_command()[3] == path
+
+
+def test_attached_block_sees_the_same_data(shared):
+    other = SharedGoggles(NUM_LED, name=shared.name)
+    try:
+        shared.write_command(1, 2)
+        assert other.read_command() == (1, 2, 0, '')
+        assert push(shared, 4, 9) == 9
+        target = bytearray(3 * NUM_LED)
+        assert other.take_frame(0, target) == (1, 9)
+        assert target == bytes([4]) * (3 * NUM_LED)
+    finally:
+        other.close()
+
+
+def test_status_round_trip(shared):
+    status = (1, True, True, 4, -1, 10, 2, 7, 6, 5, 42, 1.5, 3, 0, 31, 2, 2.2,
+              b'rainbow', b'/var/lib/lc8823-goggles/recordings/show.lcsr', b'')
+    shared.publish_status(status)
+    read = shared.read_status()
+    assert (read.rest_state, read.has_pending, read.command_ack, read.command_result) == ('idle_r', 1, 4, -1)
+    assert (read.frames_taken, read.ring_done, read.ring_shown, read.last_sequence) == (7, 6, 5, 42)
+    assert (read.effect, read.recording_path, read.message) == ('rainbow', '/var/lib/lc8823-goggles/recordings/show.lcsr', '')
+    assert len(status) == len(STATUS.unpack(bytes(STATUS.size)))
+
+
+def test_torn_block_is_not_read(shared):
+    shared.write_settings(31, 2, 2.2, 150000, 1.0, 300.0)
+    shared.buf[SEQ.size] ^= 0xFF  # Changed behind the seqlock's back, the CRC no longer matches
+    reader = ThreadPoolExecutor(1)
+    try:
+        settings = reader.submit(shared.read_settings)
+        time.sleep(0.05)
+        assert not settings.done()
+        shared.buf[SEQ.size] ^= 0xFF
+        assert settings.result(1.0)[1][0] == 31
+    finally:
+        reader.shutdown()
+
+
+def test_block_left_locked_times_out(shared, monkeypatch):
+    monkeypatch.setattr(render_process, 'SEQLOCK_TIMEOUT', 0.05)
+    shared.write_settings(31, 2, 2.2, 150000, 1.0, 300.0)
+    SEQ.pack_into(shared.buf, 0, 3, 0)  # Odd, as a writer that died half way leaves it
+    with pytest.raises(TimeoutError):
+        shared.read_settings()
+
+
+def test_metrics_round_trip(shared):
+    snapshot = metrics.registry.snapshot()
+    shared.publish_metrics(snapshot)
+    assert shared.read_metrics() == snapshot
+
+
+def test_take_returns_the_newest_frame(shared):
+    target = bytearray(3 * NUM_LED)
+    assert shared.take_frame(0, target) is None
+    for value in range(1, 4):
+        push(shared, value, 100 + value)
+    assert shared.take_frame(0, target) == (3, 103)
+    assert target == bytes([3]) * (3 * NUM_LED)
+    assert shared.take_frame(3, target) is None
+
+
+def test_invalid_packet_is_not_pushed(shared):
+    assert shared.push_frame(bytearray(b'LG'), 2) is None
+    assert shared.frames_pushed() == 0
+
+
+class OverrunTarget(bytearray):
+    # Lets the API process go around the ring while the first frame is copied
+    def __init__(self, shared):
+        super().__init__(3 * NUM_LED)
+        self.shared = shared
+        self.copies = 0
+
+    def __setitem__(self, index, value):
+        super().__setitem__(index, value)
+        self.copies += 1
+        if self.copies == 1:
+            for value in range(RING_SLOTS):
+                push(self.shared, 50 + value, 50 + value)
+
+
+def test_take_retries_after_overrun(shared):
+    push(shared, 1, 1)
+    target = OverrunTarget(shared)
+    assert shared.take_frame(0, target) == (1 + RING_SLOTS, 50 + RING_SLOTS - 1)
+    assert target.copies == 2
+    assert target == bytes([50 + RING_SLOTS - 1]) * (3 * NUM_LED)
+
+
+def test_short_frame_keeps_the_previous_pixels(shared):
+    push(shared, 7, 1)
+    for sequence in range(2, RING_SLOTS + 2):
+        push(shared, sequence, sequence, pixels=1)
+    target = bytearray(3 * NUM_LED)
+    assert shared.take_frame(0, target) == (RING_SLOTS + 1, RING_SLOTS + 1)
+    assert target == bytes([RING_SLOTS + 1]) * 3 + bytes([7]) * (3 * NUM_LED - 3)
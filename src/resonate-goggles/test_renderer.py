@@ -0,0 +1,107 @@
+import asyncio
+from led_driver import APA102
+from renderer import FrameRenderer
+from spi_transport import SimulatedSpiTransport
+import pytest
+
+NUM_LED = 4
+
+
+@pytest.fixture
+def renderer():
+    strip = APA102(NUM_LED, global_brightness=31, transport=SimulatedSpiTransport())
+    yield FrameRenderer(strip, bright_percent=100)
+    strip.stop_writer()
+
+
+def test_overwritten_frames_are_dropped(renderer):
+    renderer.submit(bytes([1]) * (3 * NUM_LED))
+    renderer.submit(bytes([2]) * (3 * NUM_LED))
+    renderer.submit_solid((3, 3, 3))
+    assert renderer.has_pending
+    assert (renderer.frames_submitted, renderer.frames_dropped) == (3, 2)
+    asyncio.run(renderer.render())
+    assert not renderer.has_pending
+    assert (renderer.frames_rendered, renderer.last_shown) == (1, 3)
+    assert renderer.strip.spi.decode_frames() == [[(3, 3, 3, 31)] * NUM_LED]
+
+
+def test_short_submit_keeps_the_pending_pixels(renderer):
+    renderer.submit_solid((7, 7, 7))
+    renderer.submit(bytes([1, 2, 3]))
+    assert renderer.pending == bytes([1, 2, 3]) + bytes([7]) * (3 * NUM_LED - 3)
+
+
+def test_lut_is_applied(renderer):
+    renderer.lut = bytes(value // 2 for value in range(256))
+    renderer.submit_solid((10, 20, 30))
+    asyncio.run(renderer.render())
+    assert renderer.strip.spi.decode_frames() == [[(5, 10, 15, 31)] * NUM_LED]
+    assert renderer.pending == bytes([10, 20, 30]) * NUM_LED
+
+
+
+def test_wait_rendered():
+    async def main():
+        strip = APA102(NUM_LED, transport=SimulatedSpiTransport())
+        renderer = FrameRenderer(strip)
+        try:
+            renderer.submit_solid((1, 1, 1))
+            first = renderer.wait_rendered()
+            renderer.submit_solid((2, 2, 2))
+            second = renderer.wait_rendered()
+            assert not first.done()
+            await renderer.render()
+            assert (first.result(), second.result()) == (False, True)  # The first one was replaced
+            shown = renderer.wait_rendered(2)
+            assert shown.done() and shown.result()
+            early = renderer.wait_rendered(1)
+            assert early.done() and not early.result()
+        finally:
+            strip.stop_writer()
+
+    asyncio.run(main())
+
+
+def test_frame_committed_during_the_transfer_waits_for_the_next_render():
+    async def main():
+        strip = APA102(NUM_LED, transport=SimulatedSpiTransport())
+        renderer = FrameRenderer(strip)
+        try:
+            renderer.submit_solid((1, 1, 1))
+            render = asyncio.ensure_future(renderer.render())
+            await asyncio.sleep(0)  # render() is waiting for the transfer
+            renderer.submit_solid((2, 2, 2))
+            waiter = renderer.wait_rendered()
+            await render
+            assert not waiter.done() and renderer.has_pending
+            await renderer.render()
+            assert waiter.result()
+        finally:
+            strip.stop_writer()
+
+    asyncio.run(main())
+
+
+def test_waiters_that_timed_out_are_dropped():
+    async def main():
+        strip = APA102(NUM_LED, transport=SimulatedSpiTransport())
+        renderer = FrameRenderer(strip)
+        try:
+            for _ in range(10):  # Nothing is rendered while idle
+                with pytest.raises(asyncio.TimeoutError):
+                    await asyncio.wait_for(renderer.wait_rendered(renderer.last_shown + 1), 0)
+            renderer.wait_rendered(renderer.last_shown + 1)
+            assert len(renderer._render_waiters) == 1
+        finally:
+            strip.stop_writer()
+
+    asyncio.run(main())
+
+
+def test_on_render_is_called_after_the_frame_went_out(renderer):
+    shown = []
+    renderer.on_render = lambda: shown.append(renderer.last_shown)
+    renderer.submit_solid((1, 1, 1))
+    asyncio.run(renderer.render())
+    assert shown == [1]
@@ -0,0 +1,136 @@
+import asyncio
+from constants import r
+from rest_mode import RestMode, STREAMING, IDLE_R, BLANK
+
+
+class FakeStrip:
+    def __init__(self, goggles):
+        self.goggles = goggles
+
+    def clear_strip(self):
+        self.goggles.drawn.append('blank')
+
+
+class FakeEffects:
+    running = False
+
+
+class FakeGoggles:
+    # The parts of LightGoggles RestMode uses, records what was drawn
+    def __init__(self):
+        self.strip = FakeStrip(self)
+        self.effects = FakeEffects()
+        self.drawn = []
+        self.states = []
+        self.fade = False
+
+    def start_fade(self, rgb):
+        self.drawn.append('fade' if rgb == r else rgb)
+
+    def cancel_fade(self):
+        self.fade = False
+
+    def fading(self):
+        return self.fade
+
+    def show_R(self):
+        self.drawn.append('R')
+
+    def notify_state(self, changes):
+        self.states.append(changes['RestState'])
+
+
+def run(test, **timeouts):
+    goggles = FakeGoggles()
+    rest = RestMode(goggles, **timeouts)
+
+    async def main():
+        rest.start()
+        try:
+            await test(goggles, rest)
+        finally:
+            rest.stop()
+
+    asyncio.run(main())
+    return goggles
+
+
+def test_rest_then_blank():
+    async def test(goggles, rest):
+        await asyncio.sleep(0.05)
+        assert rest.state == IDLE_R
+        assert goggles.drawn == ['fade']
+        await asyncio.sleep(0.1)
+        assert rest.state == BLANK
+        assert goggles.drawn == ['fade', 'blank']
+
+    goggles = run(test, rest_timeout=0.02, blank_timeout=0.05)
+    assert goggles.states == [STREAMING, IDLE_R, BLANK]
+
+
+def test_packets_keep_streaming():
+    async def test(goggles, rest):
+        for _ in range(5):
+            await asyncio.sleep(0.02)
+            rest.packet_received()
+        assert rest.state == STREAMING
+        assert goggles.drawn == []
+
+    run(test, rest_timeout=0.05, blank_timeout=1)
+
+
+def test_packet_ends_rest():
+    async def test(goggles, rest):
+        await asyncio.sleep(0.05)
+        assert rest.state == BLANK
+        rest.packet_received()
+        assert rest.state == STREAMING
+        assert goggles.drawn == ['fade', 'blank']  # The packet draws itself
+        await asyncio.sleep(0.05)
+        assert rest.state == BLANK
+
+    goggles = run(test, rest_timeout=0.01, blank_timeout=0)
+    assert goggles.states == [STREAMING, IDLE_R, BLANK, STREAMING, IDLE_R, BLANK]
+
+
+def test_effect_owns_the_strip():
+    async def test(goggles, rest):
+        goggles.effects.running = True
+        await asyncio.sleep(0.05)
+        assert rest.state == IDLE_R
+        assert goggles.drawn == []
+        rest.redraw()
+        assert goggles.drawn == []
+        goggles.effects.running = False
+        rest.effect_finished()
+        assert goggles.drawn == ['fade']
+
+    run(test, rest_timeout=0.01, blank_timeout=1)
+
+
+def test_effect_ending_while_streaming_rests_right_away():
+    async def test(goggles, rest):
+        goggles.effects.running = True
+        await asyncio.sleep(0.02)
+        rest.last_packet -= 1  # The stream stopped while the effect ran
+        goggles.effects.running = False
+        rest.effect_finished()
+        assert rest.state == IDLE_R
+        assert goggles.drawn == ['fade']
+
+    run(test, rest_timeout=0.5, blank_timeout=1)
+
+
+def test_redraw_only_shows_a_resting_r():
+    async def test(goggles, rest):
+        rest.redraw()
+        assert goggles.drawn == []
+        await asyncio.sleep(0.05)
+        goggles.fade = True
+        rest.redraw()  # The fade starts over from where it got to, towards the new colors
+        assert goggles.drawn == ['fade', 'fade']
+        goggles.fade = False
+        rest.redraw()
+        assert goggles.drawn == ['fade', 'fade', 'R']
+
+    run(test, rest_timeout=0.01, blank_timeout=1)
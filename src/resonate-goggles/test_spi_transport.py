@@ -0,0 +1,49 @@
+from led_driver import APA102
+from spi_transport import SPI_BACKEND_ENV, SimulatedSpiTransport, decode_apa102, open_transport
+import pytest
+
+
+def test_transfers_are_recorded():
+    spi = SimulatedSpiTransport(max_speed_hz=8000)
+    spi.writebytes2(bytearray(10))
+    spi.writebytes2(b'\x01' * 20)
+    assert (spi.transfer_count, spi.bytes_sent) == (2, 30)
+    assert spi.wire_time == pytest.approx(30 * 8 / 8000)
+    assert [data for _, _, data in spi.transfers] == [bytes(10), b'\x01' * 20]
+
+
+def test_realtime_sleeps_for_the_wire_time():
+    spi = SimulatedSpiTransport(max_speed_hz=8000, realtime=True)
+    spi.writebytes2(bytearray(10))  # 10 ms at 8 kHz
+    start, end, _ = spi.transfers[0]
+    assert end - start >= 0.009
+
+
+def test_decode_round_trips_the_driver():
+    spi = SimulatedSpiTransport()
+    strip = APA102(3, global_brightness=7, order='bgr', transport=spi)
+    try:
+        strip.set_pixels(bytes([1, 2, 3, 4, 5, 6, 7, 8, 9]))
+        strip.show()
+        strip.fill((0, 0, 0))
+        strip.show()
+    finally:
+        strip.stop_writer()
+    assert spi.decode_frames('bgr') == [[(1, 2, 3, 7), (4, 5, 6, 7), (7, 8, 9, 7)], [(0, 0, 0, 7)] * 3]
+
+
+def test_decode_ignores_start_and_end_frames():
+    assert decode_apa102(bytes(4) + b'\xe1\x01\x02\x03' + bytes(4)) == [[(3, 2, 1, 1)]]  # Wire order is blue, green, red
+
+
+def test_environment_picks_the_backend(monkeypatch):
+    monkeypatch.setenv(SPI_BACKEND_ENV, 'simulated-realtime')
+    transport = open_transport('spidev', 1, 2, 1000)
+    assert isinstance(transport, SimulatedSpiTransport) and transport.realtime
+    assert (transport.bus, transport.device, transport.max_speed_hz) == (1, 2, 1000)
+
+
+def test_unknown_backend(monkeypatch):
+    monkeypatch.delenv(SPI_BACKEND_ENV, raising=False)
+    with pytest.raises(ValueError):
+        open_transport('bitbang')
@@ -0,0 +1,82 @@
+import asyncio
+import os
+from stream_recorder import LOG_HEADER, RECORD_HEADER, StreamLog, StreamRecorder, recording_path, replay
+import pytest
+
+
+def record(path, datagrams):
+    recorder = StreamRecorder(str(path))
+    for datagram in datagrams:
+        buffer = bytearray(datagram) + bytearray(b'reused')  # Only nbytes are recorded
+        recorder.record(buffer, len(datagram))
+    recorder.close()
+    return recorder
+
+
+def test_round_trip(tmp_path):
+    datagrams = [bytes([value]) * (value + 1) for value in range(20)]
+    recorder = record(tmp_path / 'show.lcsr', datagrams)
+    assert (recorder.recorded, recorder.dropped) == (20, 0)
+    log = StreamLog(str(tmp_path / 'show.lcsr'))
+    try:
+        records = [(timestamp, bytes(datagram)) for timestamp, datagram in log]
+        assert [datagram for _, datagram in records] == datagrams
+        assert [timestamp for timestamp, _ in records] == sorted(timestamp for timestamp, _ in records)
+        received = []
+        count = asyncio.run(replay(log, lambda buffer, nbytes: received.append(bytes(buffer[:nbytes])), speed=0))
+        assert count == 20
+        assert received == datagrams
+    finally:
+        log.close()
+
+
+def test_replay_keeps_the_timing(tmp_path):
+    path = tmp_path / 'show.lcsr'
+    with open(path, 'wb') as f:
+        f.write(LOG_HEADER.pack(b'LCSR', 1, 0.0))
+        for timestamp in (0, 50_000_000, 100_000_000):
+            f.write(RECORD_HEADER.pack(timestamp, 1) + b'x')
+    log = StreamLog(str(path))
+    times = []
+
+    async def main():
+        started = asyncio.get_running_loop().time()
+        await replay(log, lambda buffer, nbytes: times.append(asyncio.get_running_loop().time() - started), speed=2)
+
+    try:
+        asyncio.run(main())
+    finally:
+        log.close()
+    assert times[2] >= 0.05 - 0.005
+    assert times[1] < times[2]
+
+
+def test_truncated_last_record_is_skipped(tmp_path):
+    path = tmp_path / 'show.lcsr'
+    record(path, [b'one', b'two'])
+    with open(path, 'r+b') as f:
+        f.truncate(os.path.getsize(path) - 1)
+    log = StreamLog(str(path))
+    try:
+        assert [bytes(datagram) for _, datagram in log] == [b'one']
+    finally:
+        log.close()
+
+
+def test_not_a_stream_log(tmp_path):
+    path = tmp_path / 'show.lcsr'
+    path.write_bytes(b'LCBA' + bytes(20))
+    with pytest.raises(ValueError):
+        StreamLog(str(path))
+
+
+def test_recording_path(tmp_path):
+    directory = str(tmp_path / 'recordings')
+    assert recording_path(directory, 'show.lcsr') == os.path.join(directory, 'show.lcsr')
+    assert os.path.isdir(directory)
+
+
+@pytest.mark.parametrize('name', ['', '.', '..', '../show.lcsr', '/tmp/show.lcsr', 'a\\b', 'a\0b'])
+def test_recording_path_stays_in_the_directory(tmp_path, name):
+    with pytest.raises(ValueError):
+        recording_path(str(tmp_path), name)
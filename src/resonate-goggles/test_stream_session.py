@@ -0,0 +1,84 @@
+import asyncio
+from frame_protocol import pack_frame
+from led_driver import APA102
+from light_goggles import LightGoggles
+from spi_transport import SimulatedSpiTransport
+from stream_session import StreamSession
+
+NUM_LED = 4
+
+
+class FakeWebSocket:
+    client = 'test'
+
+    def __init__(self, messages):
+        self.messages = asyncio.Queue()
+        for message in messages:
+            self.messages.put_nowait(message)
+        self.sent = []
+
+    async def receive(self):
+        return await self.messages.get()
+
+    async def send_json(self, data):
+        self.sent.append(data)
+
+
+def frame(sequence):
+    return {"type": "websocket.receive", "bytes": pack_frame(sequence, bytes([sequence]) * (3 * NUM_LED))}
+
+
+DISCONNECT = {"type": "websocket.disconnect"}
+
+
+def run_session(test):
+    async def main():
+        strip = APA102(NUM_LED, transport=SimulatedSpiTransport())
+        goggles = LightGoggles(strip, None)
+        try:
+            await test(goggles)
+        finally:
+            strip.stop_writer()
+
+    asyncio.run(main())
+
+
+def test_ack_waits_for_the_render():
+    async def test(goggles):
+        websocket = FakeWebSocket([frame(1), frame(2), DISCONNECT])
+        session = asyncio.ensure_future(StreamSession(goggles, websocket, ack=True).run())
+        await asyncio.sleep(0.05)
+        # No render loop yet: the first frame is not acked and the second not read, the sender waits
+        assert websocket.sent == [] and websocket.messages.qsize() == 2
+        renderer = asyncio.ensure_future(goggles.renderer.run())
+        await asyncio.wait_for(session, 1.0)
+        renderer.cancel()
+        assert websocket.sent == [{"ack": 1, "rendered": True, "frames_dropped": 0},
+                                  {"ack": 2, "rendered": True, "frames_dropped": 0}]
+        assert goggles.renderer.frames_rendered == 2
+
+    run_session(test)
+
+
+def test_without_ack_the_waiting_frame_is_replaced():
+    async def test(goggles):
+        websocket = FakeWebSocket([frame(1), frame(2), frame(3), DISCONNECT])
+        session = StreamSession(goggles, websocket)
+        await session.run()
+        assert websocket.sent == []
+        assert (session.frames_received, session.frames_dropped, session.last_sequence) == (3, 2, 3)
+        assert goggles.renderer.frames_dropped == 2
+
+    run_session(test)
+
+
+def test_invalid_frame_and_stats():
+    async def test(goggles):
+        websocket = FakeWebSocket([{"type": "websocket.receive", "bytes": b'LG'},
+                                   {"type": "websocket.receive", "text": "stats"}, DISCONNECT])
+        await StreamSession(goggles, websocket, ack=True).run()
+        assert websocket.sent[0] == {"error": "invalid frame", "frames_rejected": 1}
+        assert (websocket.sent[1]["frames_received"], websocket.sent[1]["frames_rejected"]) == (1, 1)
+        assert not goggles.renderer.has_pending
+
+    run_session(test)
@@ -0,0 +1,89 @@
+import asyncio
+import threading
+import time
+from led_driver import APA102
+from spi_transport import SimulatedSpiTransport
+from strip_group import StripGroup, parse_segments
+import pytest
+
+
+def make_group(*sizes, realtime=False, max_speed_hz=8000000):
+    return StripGroup([APA102(num_led, global_brightness=31, refresh_interval=3600,
+                              transport=SimulatedSpiTransport(max_speed_hz=max_speed_hz, realtime=realtime))
+                       for num_led in sizes])
+
+
+@pytest.fixture
+def group():
+    group = make_group(2, 3)
+    yield group
+    group.stop_writer()
+
+
+def test_parse_segments():
+    assert parse_segments(' 1.0:122, 0.0:60,') == [(1, 0, 122), (0, 0, 60)]
+    assert parse_segments('') == []
+
+
+def test_strips_must_share_the_channel_order():
+    with pytest.raises(ValueError):
+        StripGroup([APA102(1, order='rgb', transport=SimulatedSpiTransport()),
+                    APA102(1, order='bgr', transport=SimulatedSpiTransport())])
+
+
+def test_set_pixels_spans_the_segments(group):
+    group.set_pixels(bytes(range(1, 10)), first=1)  # Pixels 1 to 3, across the boundary
+    assert group.get_pixels() == bytes(3) + bytes(range(1, 10)) + bytes(3)
+    assert group.strips[0].get_pixels() == bytes(3) + bytes([1, 2, 3])
+    assert group.strips[1].get_pixels() == bytes(range(4, 10)) + bytes(3)
+    group.show()
+    assert [pixel[:3] for pixel in group.strips[1].spi.decode_frames()[0]] == [(4, 5, 6), (7, 8, 9), (0, 0, 0)]
+
+
+def test_only_changed_segments_are_sent(group):
+    group.fill((1, 1, 1))
+    group.show()
+    group.set_pixel(4, 9, 9, 9)
+    assert group.update_frame()
+    assert group._changed == [group.strips[1]]
+    group.send_frame()
+    assert [strip.spi.transfer_count for strip in group.strips] == [1, 2]
+    assert not group.update_frame()
+
+
+def test_rotate_crosses_the_segments(group):
+    group.set_pixels(bytes([1, 1, 1, 2, 2, 2, 3, 3, 3, 4, 4, 4, 5, 5, 5]))
+    group.rotate()
+    assert group.get_pixels() == bytes([2, 2, 2, 3, 3, 3, 4, 4, 4, 5, 5, 5, 1, 1, 1])
+
+
+def test_barrier_holds_a_segment_until_the_others_are_ready(group):
+    group.start_writer()
+    first, second = group.strips
+    for strip in group.strips:
+        strip.update_frame(force=True)
+    barrier = threading.Barrier(2)
+    first.send_frame(barrier)
+    time.sleep(0.05)
+    assert first.spi.transfer_count == 0  # Waits for the second segment
+    second.send_frame(barrier)
+    for strip in group.strips:
+        strip._writer.flush(1.0)
+    assert [strip.spi.transfer_count for strip in group.strips] == [1, 1]
+
+
+def test_writers_transfer_together():
+    # 40 bytes a segment take 40 ms at 8 kHz, sent one after the other they would not overlap
+    group = make_group(8, 8, realtime=True, max_speed_hz=8000)
+
+    async def main():
+        group.start_writer()
+        group.fill((1, 2, 3))
+        await group.show_async()
+
+    try:
+        asyncio.run(main())
+    finally:
+        group.stop_writer()
+    (start_a, end_a, _), (start_b, end_b, _) = (strip.spi.transfers[0] for strip in group.strips)
+    assert start_a < end_b and start_b < end_a
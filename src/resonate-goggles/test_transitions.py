@@ -0,0 +1,73 @@
+import asyncio
+from led_driver import APA102
+from spi_transport import SimulatedSpiTransport
+from transitions import EASINGS, Transition, blend_frames
+import pytest
+
+VALUES = bytes(range(256))
+
+
+@pytest.mark.parametrize('t', [0, 0.1, 0.25, 0.5, 0.75, 1])
+def test_same_frame_is_kept(t):
+    assert blend_frames(VALUES, VALUES, t) == VALUES
+
+
+def test_end_points():
+    assert blend_frames(VALUES, bytes(256), 0) == VALUES
+    assert blend_frames(VALUES, bytes(256), 1) == bytes(256)
+    assert blend_frames(bytes(256), VALUES, 1) == VALUES
+
+
+def test_no_carry_into_the_next_channel():
+    full = bytes([255]) * 3
+    for k in range(257):
+        assert blend_frames(full, full, k / 256) == full
+        blended = blend_frames(bytes([255, 0, 255]), bytes([0, 255, 0]), k / 256)
+        assert abs(blended[0] - (255 - k * 255 / 256)) <= 1
+        assert abs(blended[1] - k * 255 / 256) <= 1
+
+
+def test_halfway():
+    assert blend_frames(bytes([200, 0, 10]), bytes([0, 100, 10]), 0.5) == bytes([100, 50, 10])
+
+
+def test_easings_go_from_0_to_1():
+    for easing in EASINGS.values():
+        assert (easing(0), easing(1)) == (0, 1)
+
+
+def test_transition_ends_on_the_end_frame():
+    strip = APA102(4, transport=SimulatedSpiTransport())
+    try:
+        transition = Transition(strip, bytes([255, 0, 0]) * 4, bytes([0, 0, 255]) * 2, duration=0.05)
+        asyncio.run(transition.run())
+        frames = strip.spi.decode_frames()
+        assert [pixel[:3] for pixel in frames[-1]] == [(0, 0, 255)] * 2 + [(0, 0, 0)] * 2  # end is padded
+        assert len(frames) > 1
+    finally:
+        strip.stop_writer()
+
+
+def test_transition_yields_when_behind():
+    strip = APA102(4, transport=SimulatedSpiTransport())
+
+    async def main():
+        ticks = 0
+
+        async def ingest():
+            nonlocal ticks
+            while True:
+                ticks += 1
+                await asyncio.sleep(0)
+
+        task = asyncio.get_running_loop().create_task(ingest())
+        await asyncio.sleep(0)
+        # Every step is late at this rate, and an unchanged frame goes out without awaiting the writer
+        await Transition(strip, bytes(12), bytes(12), duration=0.05, fps=1e6).run()
+        task.cancel()
+        return ticks
+
+    try:
+        assert asyncio.run(main()) > 10
+    finally:
+        strip.stop_writer()
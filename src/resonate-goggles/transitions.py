@@ -0,0 +1,104 @@
+"""
+Crossfades between whole frames.
+
+Frames are packed RGB bytes. Blending is done without a per pixel Python
+loop: both frames are scaled with a 256 entry table (bytes.translate) and
+then added as two big integers. The start frame is scaled rounding down
+and the end frame rounding up, so the two scaled values of a channel
+never add up to more than 255, no carry crosses into the next byte and the
+addition blends every channel of the frame at once. A channel that has
+the same value in both frames keeps it exactly, nothing flickers during a
+fade.
+"""
+import asyncio
+import time
+from constants import TARGET_FPS
+
+
+def linear(t):
+    return t
+
+
+def ease_in(t):
+    return t * t
+
+
+def ease_out(t):
+    return 1 - (1 - t) * (1 - t)
+
+
+def ease_in_out(t):
+    return t * t * (3 - 2 * t)
+
+
+EASINGS = {'linear': linear, 'ease_in': ease_in, 'ease_out': ease_out, 'ease_in_out': ease_in_out}
+
+_scale_luts = {}  # Tables for value * k / 256 rounded down or up, built on first use
+
+
+def _scale_lut(k, round_up):
+    lut = _scale_luts.get((k, round_up))
+    if lut is None:
+        offset = 255 if round_up else 0
+        lut = _scale_luts[k, round_up] = bytes((value * k + offset) >> 8 for value in range(256))
+    return lut
+
+
+def blend_frames(start, end, t):
+    """Returns start * (1 - t) + end * t for two frames of the same length."""
+    k = min(max(round(t * 256), 0), 256)
+    a = int.from_bytes(start.translate(_scale_lut(256 - k, False)), 'big')
+    b = int.from_bytes(end.translate(_scale_lut(k, True)), 'big')
+    return (a + b).to_bytes(len(start), 'big')
+
+
+class Transition:
+    """
+    Fades the strip from one frame to another.
+
+    The blended frames are painted on the strip directly, like the frames
+    of an effect, they are not streamed frames and don't go through the
+    renderer. Colors are taken as they are, apply the color table to
+    start and end beforehand.
+
+    Steps are scheduled on absolute time.monotonic() deadlines, and the
+    position of every step is computed from the time actually passed, so a
+    slow step shortens the fade instead of stretching it. run() can be
+    cancelled at any point, e.g. when a video packet arrives.
+
+    Attributes
+    ----------
+    strip : APA102
+        Shows the blended frames
+    start, end : bytes
+        Packed RGB frames to fade between, padded/cut to the strip's size
+    duration : float
+        Length of the fade in seconds
+    easing : str or callable
+        Name from EASINGS or a function mapping 0..1 to 0..1
+    bright_percent : int
+        Per pixel brightness of the blended frames
+    """
+    def __init__(self, strip, start, end, duration=1.0, easing='ease_in_out', fps=TARGET_FPS, bright_percent=100):
+        size = 3 * strip.num_led
+        self.strip = strip
+        self.start = bytes(start[:size]).ljust(size, b'\0')
+        self.end = bytes(end[:size]).ljust(size, b'\0')
+        self.duration = duration
+        self.easing = EASINGS[easing] if isinstance(easing, str) else easing
+        self.fps = fps
+        self.bright_percent = bright_percent
+
+    async def run(self):
+        period = 1.0 / self.fps
+        started = time.monotonic()
+        deadline = started
+        while True:
+            t = 1.0 if self.duration <= 0 else min((time.monotonic() - started) / self.duration, 1.0)
+            self.strip.set_pixels(blend_frames(self.start, self.end, self.easing(t)), self.bright_percent)
+            await self.strip.show_async()
+            if t >= 1.0:
+                return
+            deadline += period
+            delay = deadline - time.monotonic()
+            await asyncio.sleep(max(delay, 0)) # Yield even when behind, ingest must get its turn